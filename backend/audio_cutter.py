@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+FFmpeg Segment Cutter
+Writes every segment of a file in one ffmpeg invocation instead of decoding
+and re-encoding each pydub slice. MP3 sources are stream-copied (cuts snap
+to the nearest MP3 frame, ~26ms, and no generation loss is added); any other
+source is decoded once into shared memory and its segments are encoded in
+parallel by a process pool, each worker piping its slice of the PCM into
+ffmpeg. Falls back to pydub export when ffmpeg is not installed.
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_BITRATE = os.environ.get('SEGMENT_BITRATE', '128k')
+# Outputs per ffmpeg call when ranges are not contiguous (each output holds an open file)
+CUT_BATCH_SIZE = int(os.environ.get('CUT_BATCH_SIZE', 64))
+# Set SEGMENT_STREAM_COPY=0 to always re-encode segments
+STREAM_COPY_ENABLED = os.environ.get('SEGMENT_STREAM_COPY', '1').lower() not in ('0', 'false', 'no')
+
+STREAM_COPY_EXTENSIONS = ('.mp3',)
+
+# Processes encoding segments in parallel (1 = encode the whole file once, serially)
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', os.cpu_count() or 1))
+
+# ffmpeg raw sample formats by sample width in bytes
+RAW_FORMATS = {1: 'u8', 2: 's16le', 3: 's24le', 4: 's32le'}
+
+READ_BYTES = 1024 * 1024
+# First shared-memory size for a decode, as a multiple of the source size (pages are only committed when written)
+DECODE_SIZE_FACTOR = 12
+
+_export_pool = None
+_export_pool_lock = threading.Lock()
+
+
+def _ffmpeg() -> Optional[str]:
+    return shutil.which('ffmpeg')
+
+
+def _seconds(ms: int) -> str:
+    return f"{ms / 1000.0:.3f}"
+
+
+def _run(command: List[str]):
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode('utf-8', 'replace').strip()[-500:])
+
+
+def _is_contiguous(ranges_ms: Sequence[Sequence[int]]) -> bool:
+    return bool(ranges_ms) and ranges_ms[0][0] == 0 and all(
+        following[0] == current[1] for current, following in zip(ranges_ms, ranges_ms[1:]))
+
+
+def _cut_contiguous(ffmpeg: str, source: str, ranges_ms, output_paths, codec_args: List[str]):
+    """Back-to-back ranges: the segment muxer writes them one file at a time"""
+    output_dir = os.path.dirname(os.path.abspath(output_paths[0]))
+    pattern = os.path.join(output_dir, f".cut-{os.getpid()}-%05d.mp3")
+    split_points = ','.join(_seconds(start) for start, _ in ranges_ms[1:])
+    command = [ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', source, '-map', '0:a:0', '-t', _seconds(ranges_ms[-1][1]),
+               *codec_args, '-f', 'segment', '-reset_timestamps', '1']
+    if split_points:
+        command += ['-segment_times', split_points]
+    try:
+        _run(command + [pattern])
+        for index, output_path in enumerate(output_paths):
+            os.replace(pattern % index, output_path)
+    finally:
+        for index in range(len(output_paths) + 1):
+            leftover = pattern % index
+            if os.path.exists(leftover):
+                os.unlink(leftover)
+
+
+def _cut_ranges(ffmpeg: str, source: str, ranges_ms, output_paths, codec_args: List[str]):
+    """Arbitrary ranges: one ffmpeg call writes a batch of outputs from a single demux"""
+    for batch_start in range(0, len(ranges_ms), CUT_BATCH_SIZE):
+        command = [ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', source]
+        for (start, end), output_path in zip(ranges_ms[batch_start:batch_start + CUT_BATCH_SIZE],
+                                             output_paths[batch_start:batch_start + CUT_BATCH_SIZE]):
+            command += ['-map', '0:a:0', '-ss', _seconds(start), '-to', _seconds(end), *codec_args, output_path]
+        _run(command)
+
+
+def _cut(ffmpeg: str, source: str, ranges_ms, output_paths, codec_args: List[str]):
+    if _is_contiguous(ranges_ms):
+        _cut_contiguous(ffmpeg, source, ranges_ms, output_paths, codec_args)
+    else:
+        _cut_ranges(ffmpeg, source, ranges_ms, output_paths, codec_args)
+
+
+def _export_with_pydub(source: str, ranges_ms, output_paths, bitrate: str, audio=None):
+    from pydub import AudioSegment
+    if audio is None:
+        audio = AudioSegment.from_file(source)
+    for (start, end), output_path in zip(ranges_ms, output_paths):
+        audio[start:end].export(output_path, format="mp3", bitrate=bitrate)
+
+
+def _get_export_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _export_pool
+    with _export_pool_lock:
+        if _export_pool is None:
+            # Not forked: the pool starts lazily inside a threaded server, and a child forked
+            # while another thread holds a lock (logging, the GPT executor, ...) can hang
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _export_pool = concurrent.futures.ProcessPoolExecutor(max_workers=EXPORT_WORKERS,
+                                                                  mp_context=multiprocessing.get_context(method))
+        return _export_pool
+
+
+def _parse_wav_header(data: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """(sample_rate, channels, sample_width, data offset) of a streamed WAV, None until the data chunk is in `data`"""
+    if len(data) < 12:
+        return None
+    if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+        raise RuntimeError("ffmpeg did not produce WAV output")
+    offset = 12
+    sample_rate = channels = sample_width = None
+    while offset + 8 <= len(data):
+        chunk_id, chunk_size = data[offset:offset + 4], struct.unpack('<I', data[offset + 4:offset + 8])[0]
+        if chunk_id == b'fmt ':
+            channels, sample_rate = struct.unpack('<HI', data[offset + 10:offset + 16])
+            sample_width = struct.unpack('<H', data[offset + 22:offset + 24])[0] // 8
+        elif chunk_id == b'data':
+            if sample_rate is None:
+                break
+            return sample_rate, channels, sample_width, offset + 8
+        offset += 8 + chunk_size + (chunk_size & 1)
+    if sample_rate is None and len(data) > 65536:
+        raise RuntimeError("Malformed WAV header from ffmpeg")
+    return None
+
+
+def _grow(shm: shared_memory.SharedMemory, length: int) -> shared_memory.SharedMemory:
+    """Twice as large shared memory holding the first `length` bytes of shm (which is released)"""
+    larger = shared_memory.SharedMemory(create=True, size=shm.size * 2)
+    larger.buf[:length] = shm.buf[:length]
+    shm.close()
+    shm.unlink()
+    return larger
+
+
+def decode_source(ffmpeg: str, source: str) -> Tuple[shared_memory.SharedMemory, int, int, int, int]:
+    """
+    Interleaved 16-bit PCM of the source at its own rate and channel count,
+    read from ffmpeg's stdout straight into shared memory. Returns (shm,
+    PCM byte length, sample_rate, channels, sample_width); the caller closes
+    and unlinks the shared memory.
+    """
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen([ffmpeg, '-nostdin', '-v', 'error', '-i', source, '-map', '0:a:0',
+                                    '-f', 'wav', '-acodec', 'pcm_s16le', '-'],
+                                   stdout=subprocess.PIPE, stderr=stderr)
+        shm = None
+        try:
+            header = b''
+            parsed = None
+            while parsed is None:
+                data = process.stdout.read1(READ_BYTES)
+                if not data:
+                    break
+                header += data
+                parsed = _parse_wav_header(header)
+
+            if parsed is not None:
+                sample_rate, channels, sample_width, data_offset = parsed
+                size = max(len(header), os.path.getsize(source) * DECODE_SIZE_FACTOR, 16 * 1024 * 1024)
+                shm = shared_memory.SharedMemory(create=True, size=size)
+                length = len(header) - data_offset
+                shm.buf[:length] = header[data_offset:]
+                del header
+                while True:
+                    if length == shm.size:
+                        shm = _grow(shm, length)
+                    view = shm.buf[length:]
+                    try:
+                        received = process.stdout.readinto(view)
+                    finally:
+                        view.release()
+                    if not received:
+                        break
+                    length += received
+            process.stdout.close()
+            if process.wait() != 0 or parsed is None:
+                stderr.seek(0)
+                raise RuntimeError(stderr.read().decode('utf-8', 'replace').strip()[-500:] or
+                                   "ffmpeg did not produce WAV output")
+        except BaseException:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            raise
+    return shm, length, sample_rate, channels, sample_width
+
+
+def _encode_shared_range(shm_name: str, byte_start: int, byte_end: int, raw_format: str, sample_rate: int,
+                         channels: int, output_path: str, bitrate: str) -> str:
+    """Pool worker: pipe one slice of the shared PCM into ffmpeg's MP3 encoder"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        command = [shutil.which('ffmpeg') or 'ffmpeg', '-nostdin', '-v', 'error', '-y',
+                   '-f', raw_format, '-ar', str(sample_rate), '-ac', str(channels), '-i', '-',
+                   '-c:a', 'libmp3lame', '-b:a', bitrate, output_path]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        _, stderr = process.communicate(bytes(shm.buf[byte_start:byte_end]))
+        if process.returncode != 0:
+            raise RuntimeError(stderr.decode('utf-8', 'replace').strip()[-500:])
+    finally:
+        shm.close()
+    return output_path
+
+
+def encode_segments_parallel(ffmpeg: str, source: str, ranges_ms, output_paths, bitrate: str, audio=None):
+    """
+    Decode the source once into shared memory (or reuse a loaded pydub
+    AudioSegment) and encode every range on the export pool. Files are
+    written in whatever order workers finish; this returns when all are done.
+    """
+    if audio is not None:
+        raw, sample_rate, channels, sample_width = audio.raw_data, audio.frame_rate, audio.channels, audio.sample_width
+        length = len(raw)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, length))
+        shm.buf[:length] = raw
+        del raw
+    else:
+        shm, length, sample_rate, channels, sample_width = decode_source(ffmpeg, source)
+    try:
+        raw_format = RAW_FORMATS.get(sample_width)
+        if raw_format is None:
+            raise RuntimeError(f"Unsupported sample width {sample_width}")
+        frame_bytes = sample_width * channels
+        pool = _get_export_pool()
+        futures = []
+        for (start, end), output_path in zip(ranges_ms, output_paths):
+            # Same frame arithmetic as pydub's AudioSegment slicing
+            byte_start = min(int(start * (sample_rate / 1000.0)) * frame_bytes, length)
+            byte_end = min(int(end * (sample_rate / 1000.0)) * frame_bytes, length)
+            futures.append(pool.submit(_encode_shared_range, shm.name, byte_start, byte_end, raw_format,
+                                       sample_rate, channels, output_path, bitrate))
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def cut_segments(source: str, ranges_ms: Sequence[Sequence[int]], output_paths: Sequence[str],
+                 bitrate: str = SEGMENT_BITRATE, stream_copy: Optional[bool] = None, audio=None,
+                 bounded_memory: bool = False) -> Dict:
+    """
+    Write source[start_ms:end_ms] to each output path as MP3. `audio` is an
+    already-loaded pydub AudioSegment of the source, reused instead of
+    decoding again when segments have to be re-encoded. With bounded_memory
+    the source is never decoded into memory (no parallel encode).
+    Returns the method used and how long the cut took.
+    """
+    ranges_ms = [[int(start), int(end)] for start, end in ranges_ms]
+    output_paths = list(output_paths)
+    if len(ranges_ms) != len(output_paths):
+        raise ValueError(f"{len(ranges_ms)} ranges but {len(output_paths)} output paths")
+    started = time.time()
+    if not ranges_ms:
+        return {"method": "none", "seconds": 0.0}
+
+    if stream_copy is None:
+        stream_copy = STREAM_COPY_ENABLED
+    ffmpeg = _ffmpeg()
+    method = None
+
+    if ffmpeg:
+        copy_args = ['-c:a', 'copy']
+        encode_args = ['-c:a', 'libmp3lame', '-b:a', bitrate]
+        try:
+            if stream_copy and os.path.splitext(source)[1].lower() in STREAM_COPY_EXTENSIONS:
+                _cut(ffmpeg, source, ranges_ms, output_paths, copy_args)
+                method = "stream_copy"
+            elif EXPORT_WORKERS > 1 and len(ranges_ms) > 1 and not bounded_memory:
+                encode_segments_parallel(ffmpeg, source, ranges_ms, output_paths, bitrate, audio)
+                method = "parallel_encode"
+            elif stream_copy or bounded_memory:
+                # One encode for the whole file, then copy-cut that
+                encoded = os.path.join(os.path.dirname(os.path.abspath(output_paths[0])), f".encoded-{os.getpid()}.mp3")
+                try:
+                    _run([ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', source, '-map', '0:a:0', *encode_args, encoded])
+                    _cut(ffmpeg, encoded, ranges_ms, output_paths, copy_args)
+                finally:
+                    if os.path.exists(encoded):
+                        os.unlink(encoded)
+                method = "encode_once"
+            else:
+                _cut(ffmpeg, source, ranges_ms, output_paths, encode_args)
+                method = "encode_segments"
+        except (RuntimeError, OSError, concurrent.futures.process.BrokenProcessPool) as e:
+            logger.warning(f"⚠️ ffmpeg cut failed for {os.path.basename(source)}, exporting with pydub: {e}")
+
+    if method is None:
+        _export_with_pydub(source, ranges_ms, output_paths, bitrate, audio)
+        method = "pydub"
+
+    elapsed = time.time() - started
+    logger.info(f"✂️ Cut {len(ranges_ms)} segments from {os.path.basename(source)} ({method}) in {elapsed:.2f}s")
+    return {"method": method, "seconds": round(elapsed, 3)}
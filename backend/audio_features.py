@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Vectorized Audio Features
+RMS envelope, peak, zero-crossing rate, spectral centroid and speech-activity
+ratio computed in one pass over the decoded PCM sidecar. Samples are
+reshaped into frames and every feature is an array operation over the frame
+matrix: a 20 s segment takes a few milliseconds, a 10 minute file well under
+a second. The batch form analyzes every segment of a conversation from its
+sidecars in one call.
+"""
+
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from backend.pcm_cache import load_pcm, PCM_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Analysis frame for ZCR / spectral centroid / speech activity
+FEATURE_FRAME_MS = int(os.environ.get('AUDIO_FEATURE_FRAME_MS', 25))
+# RMS envelope resolution (the old per-chunk loop used 500ms)
+ENVELOPE_FRAME_MS = int(os.environ.get('AUDIO_ENVELOPE_FRAME_MS', 500))
+# Frames louder than this count as speech
+SPEECH_THRESHOLD_DBFS = float(os.environ.get('SPEECH_THRESHOLD_DBFS', -40))
+# dBFS mapped to 0.0 for the normalized volume / energy levels
+LEVEL_FLOOR_DBFS = -60.0
+
+# Frames converted to float and transformed at a time (bounds memory on long files)
+FEATURE_BLOCK_FRAMES = 4096
+
+FULL_SCALE = 32768.0
+
+EMPTY_FEATURES = {"mean": 0.0, "max": 0.0, "std": 0.0, "duration": 0.0, "energy": 0.0}
+
+
+def _dbfs(rms):
+    return 20.0 * np.log10(np.maximum(rms, 1e-9) / FULL_SCALE)
+
+
+def _level(dbfs: float) -> float:
+    """dBFS mapped onto 0..1 (LEVEL_FLOOR_DBFS → 0, full scale → 1)"""
+    return float(np.clip((dbfs - LEVEL_FLOOR_DBFS) / -LEVEL_FLOOR_DBFS, 0.0, 1.0))
+
+
+def frame_matrix(samples: np.ndarray, frame_length: int):
+    """
+    (n_frames, frame_length) matrix of the samples plus the number of real
+    samples in each frame. A view when the length divides evenly, otherwise
+    a copy with the last frame zero-padded.
+    """
+    n = len(samples)
+    n_frames = max(1, -(-n // frame_length))
+    if n == n_frames * frame_length:
+        frames = np.asarray(samples).reshape(n_frames, frame_length)
+    else:
+        frames = np.zeros(n_frames * frame_length, dtype=samples.dtype)
+        frames[:n] = samples
+        frames = frames.reshape(n_frames, frame_length)
+    counts = np.full(n_frames, frame_length, dtype=np.int64)
+    counts[-1] = n - (n_frames - 1) * frame_length
+    return frames, counts
+
+
+def frame_features(frames: np.ndarray, counts: np.ndarray, sample_rate: int = PCM_SAMPLE_RATE) -> Dict[str, np.ndarray]:
+    """Per-frame sum of squares, RMS, peak, ZCR and spectral centroid"""
+    frame_length = frames.shape[1]
+    window = np.hanning(frame_length).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_length, 1.0 / sample_rate)
+    n_frames = frames.shape[0]
+
+    sum_squares = np.empty(n_frames, dtype=np.float64)
+    peak = np.empty(n_frames, dtype=np.float64)
+    crossings = np.empty(n_frames, dtype=np.int64)
+    centroid = np.empty(n_frames, dtype=np.float64)
+
+    for start in range(0, n_frames, FEATURE_BLOCK_FRAMES):
+        end = min(start + FEATURE_BLOCK_FRAMES, n_frames)
+        block = frames[start:end].astype(np.float32)
+        sum_squares[start:end] = np.einsum('ij,ij->i', block, block, dtype=np.float64)
+        peak[start:end] = np.abs(block).max(axis=1)
+        signs = np.signbit(block)
+        crossings[start:end] = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+        spectrum = np.abs(np.fft.rfft(block * window, axis=1))
+        magnitude = spectrum.sum(axis=1)
+        centroid[start:end] = np.divide(spectrum @ freqs, magnitude,
+                                        out=np.zeros(end - start), where=magnitude > 0)
+
+    return {
+        "sum_squares": sum_squares,
+        "rms": np.sqrt(sum_squares / np.maximum(counts, 1)),
+        "peak": peak,
+        "zcr": crossings / np.maximum(counts - 1, 1),
+        "centroid": centroid,
+    }
+
+
+def summarize_features(per_frame: Dict[str, np.ndarray], counts: np.ndarray, frame_ms: int = FEATURE_FRAME_MS,
+                       envelope_ms: int = ENVELOPE_FRAME_MS, sample_rate: int = PCM_SAMPLE_RATE) -> Dict[str, Any]:
+    """Aggregate one file's per-frame features into the analysis dict"""
+    n_samples = int(counts.sum())
+    if n_samples == 0:
+        return dict(EMPTY_FEATURES)
+
+    # RMS envelope from the frame sums of squares (exact when envelope_ms is a multiple of frame_ms)
+    frames_per_envelope = max(1, int(round(envelope_ms / float(frame_ms))))
+    starts = np.arange(0, len(counts), frames_per_envelope)
+    envelope = np.sqrt(np.add.reduceat(per_frame["sum_squares"], starts) / np.add.reduceat(counts, starts))
+    envelope_min = envelope.min()
+    envelope_ptp = envelope.max() - envelope_min
+    normalized = (envelope - envelope_min) / envelope_ptp if envelope_ptp != 0 else envelope
+
+    frame_dbfs = _dbfs(per_frame["rms"])
+    speech = frame_dbfs > SPEECH_THRESHOLD_DBFS
+    voiced = speech if speech.any() else np.ones_like(speech)
+    overall_dbfs = float(_dbfs(np.sqrt(per_frame["sum_squares"].sum() / n_samples)))
+    peak = float(per_frame["peak"].max())
+
+    return {
+        # Same keys and meaning as the previous per-chunk loop
+        "mean": float(normalized.mean()),
+        "max": float(normalized.max()),
+        "std": float(normalized.std()),
+        "duration": n_samples / float(sample_rate),
+        "energy": float(envelope.mean()),
+        # 0..1 levels for the GPT analysis prompt
+        "volume": round(_level(overall_dbfs), 3),
+        "energy_level": round(_level(float(np.percentile(frame_dbfs, 90))), 3),
+        "rms_dbfs": round(overall_dbfs, 2),
+        "peak": round(peak / FULL_SCALE, 4),
+        "peak_dbfs": round(float(_dbfs(peak)), 2),
+        # ZCR and centroid over speech frames, so pauses do not dilute them
+        "zcr": round(float(per_frame["zcr"][voiced].mean()), 4),
+        "spectral_centroid": round(float(per_frame["centroid"][voiced].mean()), 1),
+        "speech_ratio": round(float(speech.mean()), 3),
+        "rms_envelope": [round(float(v), 1) for v in envelope],
+        "envelope_frame_ms": frames_per_envelope * frame_ms,
+    }
+
+
+def _frame_length(sample_rate: int, frame_ms: int) -> int:
+    return max(1, int(sample_rate * frame_ms / 1000))
+
+
+def extract_audio_features(samples: np.ndarray, sample_rate: int = PCM_SAMPLE_RATE,
+                           frame_ms: int = FEATURE_FRAME_MS,
+                           envelope_ms: int = ENVELOPE_FRAME_MS) -> Dict[str, Any]:
+    """All features for one sample array (int16 PCM or float)"""
+    if len(samples) == 0:
+        return dict(EMPTY_FEATURES)
+    frames, counts = frame_matrix(samples, _frame_length(sample_rate, frame_ms))
+    per_frame = frame_features(frames, counts, sample_rate)
+    return summarize_features(per_frame, counts, frame_ms, envelope_ms, sample_rate)
+
+
+def extract_audio_features_batch(sample_arrays: List[np.ndarray], sample_rate: int = PCM_SAMPLE_RATE,
+                                 frame_ms: int = FEATURE_FRAME_MS,
+                                 envelope_ms: int = ENVELOPE_FRAME_MS) -> List[Dict[str, Any]]:
+    """Features for many sample arrays, in order"""
+    return [extract_audio_features(samples, sample_rate, frame_ms, envelope_ms) for samples in sample_arrays]
+
+
+def analyze_audio_file(path: str, **kwargs) -> Dict[str, Any]:
+    """Features of one audio file, read from its decoded PCM sidecar"""
+    return extract_audio_features(load_pcm(path), **kwargs)
+
+
+def analyze_audio_files(paths: Iterable[str], **kwargs) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Features for many audio files in one batch; files that cannot be decoded map to None"""
+    loaded, arrays = [], []
+    results: Dict[str, Optional[Dict[str, Any]]] = {}
+    for path in paths:
+        try:
+            arrays.append(load_pcm(path))
+            loaded.append(path)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not decode {path} for audio features: {e}")
+            results[path] = None
+    for path, features in zip(loaded, extract_audio_features_batch(arrays, **kwargs)):
+        results[path] = features
+    return results
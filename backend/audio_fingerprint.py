@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Audio Fingerprint Index
+Spectral-peak ("constellation") fingerprints of every original recording
+and segment under conversations/, kept in a small SQLite index that is
+updated incrementally (files are re-fingerprinted only when their mtime or
+size changes). Peaks are local maxima of the log spectrogram of the 16 kHz
+PCM sidecar below 4 kHz; each peak is paired with a few later peaks into
+22-bit (f1, f2, dt) hashes stored with the anchor's frame offset, roughly
+200k hashes (~8 MB of index) per hour of audio.
+
+A new upload is matched by counting hashes that agree on a single time
+offset per indexed file. Re-encoded copies of a stored recording come out
+as duplicates, and a recording containing part of a stored one (or
+contained in it) as an overlap, before anything is segmented or
+transcribed.
+
+Run `python -m backend.audio_fingerprint update` to index the archive and
+`python -m backend.audio_fingerprint match <audio>` to look a file up.
+"""
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from backend.pcm_cache import load_pcm, PCM_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_DB = os.environ.get('FINGERPRINT_DB', os.path.join('cache', 'fingerprints.sqlite'))
+# Share of an upload's hashes matching one conversation for it to count as a duplicate
+FINGERPRINT_DUPLICATE_COVERAGE = float(os.environ.get('FINGERPRINT_DUPLICATE_COVERAGE', 0.5))
+# Matching audio needed to report an overlap
+FINGERPRINT_MIN_OVERLAP_SECONDS = float(os.environ.get('FINGERPRINT_MIN_OVERLAP_SECONDS', 10))
+
+# Bump when the fingerprint changes so the index is rebuilt
+FINGERPRINT_VERSION = 1
+
+N_FFT = 1024
+HOP = 512                       # 32 ms frames
+MAX_BIN = 256                   # 4 kHz at 16 kHz / 1024
+PEAK_TIME_FRAMES = 10           # a peak is the maximum of a ±10 frame ...
+PEAK_FREQ_BINS = 10             # ... by ±10 bin neighbourhood
+PEAK_MIN_DB = 10.0              # and this far above the median level
+FAN_OUT = 5                     # later peaks paired with each anchor
+MAX_DT_FRAMES = 63
+MIN_MATCHING_HASHES = 20
+SPECTRUM_BLOCK_FRAMES = 4096
+
+SEGMENT_FILE = re.compile(r'^\d{3}\.mp3$')
+FRAME_SECONDS = HOP / float(PCM_SAMPLE_RATE)
+
+
+def _log_spectrogram(pcm: np.ndarray) -> np.ndarray:
+    """(n_frames, MAX_BIN) log-magnitude spectrogram in dB, computed in blocks"""
+    n_frames = 1 + (len(pcm) - N_FFT) // HOP if len(pcm) >= N_FFT else 0
+    spectrogram = np.empty((n_frames, MAX_BIN), dtype=np.float32)
+    window = np.hanning(N_FFT).astype(np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(np.asarray(pcm), N_FFT)[::HOP] if n_frames else None
+    for start in range(0, n_frames, SPECTRUM_BLOCK_FRAMES):
+        block = frames[start:start + SPECTRUM_BLOCK_FRAMES].astype(np.float32) * window
+        magnitude = np.abs(np.fft.rfft(block, axis=1))[:, :MAX_BIN]
+        spectrogram[start:start + len(block)] = 20 * np.log10(np.maximum(magnitude, 1e-3))
+    return spectrogram
+
+
+def _sliding_max(values: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    padding = [(0, 0), (0, 0)]
+    padding[axis] = (radius, radius)
+    padded = np.pad(values, padding, mode='constant', constant_values=-np.inf)
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1, axis=axis).max(axis=-1)
+
+
+def spectral_peaks(pcm: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(frame, bin) of every local spectrogram maximum, ordered by frame"""
+    spectrogram = _log_spectrogram(pcm)
+    if len(spectrogram) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    neighbourhood = _sliding_max(_sliding_max(spectrogram, PEAK_FREQ_BINS, 1), PEAK_TIME_FRAMES, 0)
+    floor = np.median(spectrogram) + PEAK_MIN_DB
+    frames, bins = np.nonzero((spectrogram == neighbourhood) & (spectrogram > floor))
+    return frames.astype(np.int64), bins.astype(np.int64)
+
+
+def fingerprint_hashes(pcm: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(hash, anchor frame) pairs: each peak combined with the next FAN_OUT peaks within MAX_DT_FRAMES"""
+    frames, bins = spectral_peaks(pcm)
+    hashes, offsets = [], []
+    for k in range(1, FAN_OUT + 1):
+        if len(frames) <= k:
+            break
+        dt = frames[k:] - frames[:-k]
+        valid = (dt > 0) & (dt <= MAX_DT_FRAMES)
+        hashes.append((bins[:-k][valid] << 14) | (bins[k:][valid] << 6) | dt[valid])
+        offsets.append(frames[:-k][valid])
+    if not hashes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(hashes), np.concatenate(offsets)
+
+
+def conversation_of(path: str) -> Optional[str]:
+    parts = os.path.normpath(path).split(os.sep)
+    return parts[-2] if len(parts) >= 2 and parts[-2].startswith('convo') else None
+
+
+def conversation_files(conv_path: str) -> List[str]:
+    """Original recording and segment files of one conversation folder"""
+    if not os.path.isdir(conv_path):
+        return []
+    return [os.path.join(conv_path, name) for name in sorted(os.listdir(conv_path))
+            if name.startswith('original_') or SEGMENT_FILE.match(name)]
+
+
+def archive_files(root: str = "conversations") -> List[str]:
+    """Original recordings and segment files of every conversation"""
+    paths = []
+    if not os.path.isdir(root):
+        return paths
+    for conversation in sorted(os.listdir(root)):
+        if conversation.startswith('convo'):
+            paths.extend(conversation_files(os.path.join(root, conversation)))
+    return paths
+
+
+class FingerprintIndex:
+    """SQLite index: files (one row per indexed version) and hashes (hash, file, anchor frame)"""
+
+    def __init__(self, db_path: str = FINGERPRINT_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # One update at a time, so two threads never index the same file together
+        self._update_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                conversation TEXT,
+                kind TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                duration REAL NOT NULL,
+                n_hashes INTEGER NOT NULL,
+                version INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS hashes (
+                hash INTEGER NOT NULL,
+                file_id INTEGER NOT NULL,
+                offset INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS hashes_by_hash ON hashes (hash);
+            CREATE INDEX IF NOT EXISTS hashes_by_file ON hashes (file_id);
+        """)
+        return connection
+
+    def add_file(self, path: str, connection: Optional[sqlite3.Connection] = None) -> bool:
+        """(Re)index one file unless this version of it is already indexed; True if indexed now"""
+        own_connection = connection is None
+        connection = connection or self._connect()
+        try:
+            stat = os.stat(path)
+            key = os.path.normpath(path)
+            row = connection.execute("SELECT id, mtime_ns, size, version FROM files WHERE path = ?", (key,)).fetchone()
+            if row and row[1:] == (stat.st_mtime_ns, stat.st_size, FINGERPRINT_VERSION):
+                return False
+            pcm = load_pcm(path)
+            hashes, offsets = fingerprint_hashes(pcm)
+            kind = "original" if os.path.basename(path).startswith('original_') else "segment"
+            with self._lock, connection:
+                if row:
+                    connection.execute("DELETE FROM hashes WHERE file_id = ?", (row[0],))
+                    connection.execute("DELETE FROM files WHERE id = ?", (row[0],))
+                file_id = connection.execute(
+                    "INSERT INTO files (path, conversation, kind, mtime_ns, size, duration, n_hashes, version) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, conversation_of(path), kind, stat.st_mtime_ns, stat.st_size,
+                     len(pcm) / float(PCM_SAMPLE_RATE), len(hashes), FINGERPRINT_VERSION)).lastrowid
+                connection.executemany("INSERT INTO hashes (hash, file_id, offset) VALUES (?, ?, ?)",
+                                       zip(hashes.tolist(), [file_id] * len(hashes), offsets.tolist()))
+            return True
+        finally:
+            if own_connection:
+                connection.close()
+
+    def remove_missing(self, connection: sqlite3.Connection) -> int:
+        missing = [(file_id,) for file_id, path in connection.execute("SELECT id, path FROM files")
+                   if not os.path.exists(path)]
+        with self._lock, connection:
+            connection.executemany("DELETE FROM hashes WHERE file_id = ?", missing)
+            connection.executemany("DELETE FROM files WHERE id = ?", missing)
+        return len(missing)
+
+    def update(self, paths: Optional[Iterable[str]] = None) -> Dict:
+        """Index new and changed files (default: the whole archive) and drop deleted ones"""
+        started = time.time()
+        paths = archive_files() if paths is None else list(paths)
+        indexed = failed = 0
+        with self._update_lock:
+            connection = self._connect()
+            try:
+                for path in paths:
+                    try:
+                        indexed += self.add_file(path, connection)
+                    except Exception as e:
+                        failed += 1
+                        logger.warning(f"⚠️ Could not fingerprint {path}: {e}")
+                removed = self.remove_missing(connection)
+            finally:
+                connection.close()
+        elapsed = time.time() - started
+        logger.info(f"🔎 Fingerprint index: {indexed} files indexed, {removed} removed, {failed} failed "
+                    f"({len(paths)} checked) in {elapsed:.1f}s")
+        return {"checked": len(paths), "indexed": indexed, "removed": removed, "failed": failed,
+                "seconds": round(elapsed, 2)}
+
+    def update_async(self, paths: Optional[Iterable[str]] = None) -> threading.Thread:
+        thread = threading.Thread(target=self.update, args=(None if paths is None else list(paths),),
+                                  name='fingerprint-index', daemon=True)
+        thread.start()
+        return thread
+
+    def match(self, path: str, exclude_conversation: Optional[str] = None) -> List[Dict]:
+        """
+        Conversations whose indexed audio matches `path`, best first. For each,
+        `coverage` is the share of the file's hashes that agree with a single
+        time offset in an indexed file and `matchedSeconds` the stretch of the
+        file those hashes span (both summed over a conversation's segments when
+        they cover the file piece by piece). A match spanning nearly all of a
+        stored recording of the same length is a duplicate.
+        """
+        pcm = load_pcm(path)
+        duration = len(pcm) / float(PCM_SAMPLE_RATE)
+        hashes, offsets = fingerprint_hashes(pcm)
+        if len(hashes) == 0:
+            return []
+
+        connection = self._connect()
+        try:
+            connection.execute("CREATE TEMP TABLE query (hash INTEGER, offset INTEGER)")
+            connection.executemany("INSERT INTO query VALUES (?, ?)", zip(hashes.tolist(), offsets.tolist()))
+            rows = connection.execute("""
+                SELECT h.file_id, h.offset - q.offset AS delta, COUNT(*), MIN(q.offset), MAX(q.offset)
+                FROM query q JOIN hashes h ON h.hash = q.hash
+                GROUP BY h.file_id, delta
+            """).fetchall()
+            files = {row[0]: row[1:] for row in connection.execute(
+                "SELECT id, path, conversation, kind, duration FROM files")}
+        finally:
+            connection.close()
+
+        # Best offset per indexed file; a shift that is not a whole frame splits
+        # the votes between two neighbouring offsets, so those are counted together
+        by_offset: Dict[int, Dict[int, Tuple[int, int, int]]] = defaultdict(dict)
+        for file_id, delta, votes, first, last in rows:
+            by_offset[file_id][delta] = (votes, first, last)
+        best: Dict[int, Tuple[int, int, int]] = {}
+        for file_id, offsets_votes in by_offset.items():
+            for delta, (votes, first, last) in offsets_votes.items():
+                next_votes, next_first, next_last = offsets_votes.get(delta + 1, (0, first, last))
+                total = votes + next_votes
+                if total > best.get(file_id, (0, 0, 0))[1]:
+                    best[file_id] = (delta, total, (max(last, next_last) - min(first, next_first)))
+
+        by_conversation: Dict[str, Dict] = defaultdict(
+            lambda: {"original": None, "segment_votes": 0, "segment_frames": 0, "segments": 0})
+        for file_id, (delta, votes, span_frames) in best.items():
+            if votes < MIN_MATCHING_HASHES or file_id not in files:
+                continue
+            file_path, conversation, kind, file_duration = files[file_id]
+            if conversation is None or conversation == exclude_conversation:
+                continue
+            entry = by_conversation[conversation]
+            if kind == "original":
+                if entry["original"] is None or votes > entry["original"]["votes"]:
+                    entry["original"] = {"path": file_path, "votes": votes, "duration": file_duration,
+                                         "span_frames": span_frames,
+                                         "offset_seconds": round(delta * FRAME_SECONDS, 2)}
+            else:
+                entry["segment_votes"] += votes
+                entry["segment_frames"] += span_frames
+                entry["segments"] += 1
+
+        matches = []
+        for conversation, entry in by_conversation.items():
+            original = entry["original"]
+            votes = max(original["votes"] if original else 0, entry["segment_votes"])
+            coverage = min(1.0, votes / float(len(hashes)))
+            # How much of the upload lies between its first and last matching hash
+            span_frames = max(original["span_frames"] if original else 0, entry["segment_frames"])
+            matched_seconds = min(duration, span_frames * FRAME_SECONDS)
+            stored_duration = original["duration"] if original else None
+            is_duplicate = (matched_seconds >= 0.9 * duration or coverage >= FINGERPRINT_DUPLICATE_COVERAGE) and (
+                stored_duration is None or abs(stored_duration - duration) <= max(2.0, 0.05 * duration))
+            if not is_duplicate and matched_seconds < min(FINGERPRINT_MIN_OVERLAP_SECONDS, 0.5 * duration):
+                continue
+            matches.append({
+                "conversation": conversation,
+                "type": "duplicate" if is_duplicate else "overlap",
+                "coverage": round(coverage, 3),
+                "matchedSeconds": round(matched_seconds, 1),
+                "original": original["path"] if original else None,
+                "offsetSeconds": original["offset_seconds"] if original else None,
+                "matchingSegments": entry["segments"],
+            })
+        matches.sort(key=lambda match: match["coverage"], reverse=True)
+        return matches
+
+    def stats(self) -> Dict:
+        connection = self._connect()
+        try:
+            files, seconds = connection.execute("SELECT COUNT(*), COALESCE(SUM(duration), 0) FROM files").fetchone()
+            n_hashes = connection.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        finally:
+            connection.close()
+        size = os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        return {"files": files, "hours": round(seconds / 3600.0, 2), "hashes": n_hashes, "bytes": size}
+
+
+fingerprint_index = FingerprintIndex()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Spectral-peak fingerprint index of the conversation archive")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('update', help='Index new and changed recordings and segments')
+    match_parser = subparsers.add_parser('match', help='Find stored recordings matching audio files')
+    match_parser.add_argument('files', nargs='+')
+    subparsers.add_parser('stats', help='Index size')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.command == 'update':
+        fingerprint_index.update()
+    elif args.command == 'match':
+        for path in args.files:
+            started = time.time()
+            matches = fingerprint_index.match(path)
+            logger.info(f"🔎 {path}: {len(matches)} matches in {time.time() - started:.2f}s")
+            for match in matches:
+                logger.info(f"   {match['type']:<9} {match['conversation']} coverage {match['coverage']:.0%} "
+                            f"({match['matchedSeconds']}s, offset {match['offsetSeconds']}s)")
+    else:
+        logger.info(f"🔎 {fingerprint_index.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+In-Memory Transcription Preprocessing
+Audio for the transcription APIs is taken from the 16 kHz mono PCM sidecar
+(ffmpeg resamples at decode time), gain-adjusted and normalized in NumPy with
+the same arithmetic as the pydub chain it replaces, and kept as an in-memory
+WAV. Results are memoized per file version, so a fallback chain that tries
+several transcription paths on one segment preprocesses it once and no temp
+files are written.
+"""
+
+import io
+import logging
+import os
+import threading
+import wave
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from backend.pcm_cache import load_pcm, pcm_sha256, PCM_SAMPLE_RATE, PCM_SAMPLE_WIDTH, PCM_CHANNELS
+
+logger = logging.getLogger(__name__)
+
+# Preprocessed segments kept in memory (a 20s segment is ~640 KB)
+PREPARED_AUDIO_MEMO_SIZE = int(os.environ.get('PREPARED_AUDIO_MEMO_SIZE', 16))
+
+MAX_AMPLITUDE = float(1 << (8 * PCM_SAMPLE_WIDTH - 1))
+MIN_DURATION_MS = 500
+
+_memo: "OrderedDict[Tuple, PreparedAudio]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def dbfs(samples: np.ndarray) -> float:
+    """pydub's AudioSegment.dBFS: integer RMS relative to full scale"""
+    if len(samples) == 0:
+        return -float('inf')
+    rms = int(np.sqrt(np.dot(samples.astype(np.float64), samples.astype(np.float64)) / len(samples)))
+    if rms == 0:
+        return -float('inf')
+    return 20 * np.log10(rms / MAX_AMPLITUDE)
+
+
+def apply_gain(samples: np.ndarray, gain_db: float) -> np.ndarray:
+    """pydub's apply_gain (audioop.mul): scale, clip to int16, round down"""
+    factor = 10 ** (float(gain_db) / 20)
+    scaled = np.clip(samples.astype(np.float64) * factor, -MAX_AMPLITUDE, MAX_AMPLITUDE - 1)
+    return np.floor(scaled).astype(np.int16)
+
+
+def normalize(samples: np.ndarray, headroom: float = 0.1) -> np.ndarray:
+    """pydub.effects.normalize: boost so the peak sits `headroom` dB below full scale"""
+    peak = int(np.abs(samples.astype(np.int32)).max()) if len(samples) else 0
+    if peak == 0:
+        return samples
+    target_peak = MAX_AMPLITUDE * 10 ** (-headroom / 20)
+    return apply_gain(samples, 20 * np.log10(target_peak / peak))
+
+
+def preprocess_pcm(pcm: np.ndarray) -> np.ndarray:
+    """
+    Loudness handling for transcription: lift very quiet audio, tame very
+    loud audio, normalize gently and pad to at least 0.5s.
+    """
+    samples = np.asarray(pcm, dtype=np.int16)
+    level = dbfs(samples)
+    if level < -50:
+        samples = apply_gain(samples, 15)
+    elif level > -10:
+        samples = apply_gain(samples, -10)
+    samples = normalize(samples, headroom=5.0)
+    min_samples = MIN_DURATION_MS * PCM_SAMPLE_RATE // 1000
+    if len(samples) < min_samples:
+        samples = np.concatenate((samples, np.zeros(min_samples - len(samples), dtype=np.int16)))
+    return samples
+
+
+def wav_bytes(samples: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(PCM_CHANNELS)
+        wav.setsampwidth(PCM_SAMPLE_WIDTH)
+        wav.setframerate(PCM_SAMPLE_RATE)
+        wav.writeframes(np.ascontiguousarray(samples, dtype=np.int16).tobytes())
+    return buffer.getvalue()
+
+
+class PreparedAudio:
+    """
+    Transcription-ready audio held in memory. `pcm_hash` is the hash of the
+    decoded (not normalized) PCM that keys the transcription cache; it is
+    None when the file could not be decoded and the original bytes are sent.
+    """
+
+    def __init__(self, source_path: str, data: bytes, filename: str, pcm_hash: Optional[str] = None,
+                 samples: Optional[np.ndarray] = None):
+        self.source_path = source_path
+        self.data = data
+        self.filename = filename
+        self.pcm_hash = pcm_hash
+        self.samples = samples
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def duration_ms(self) -> Optional[int]:
+        return None if self.samples is None else len(self.samples) * 1000 // PCM_SAMPLE_RATE
+
+    def upload(self) -> Tuple[str, bytes]:
+        """(filename, bytes) file argument for the OpenAI SDK"""
+        return self.filename, self.data
+
+    def float32(self) -> Optional[np.ndarray]:
+        """Samples scaled to [-1, 1), the array form local Whisper models take"""
+        return None if self.samples is None else self.samples.astype(np.float32) / MAX_AMPLITUDE
+
+
+def _prepare(audio_path: str) -> PreparedAudio:
+    name = os.path.splitext(os.path.basename(audio_path))[0] or 'audio'
+    try:
+        pcm = load_pcm(audio_path)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to load audio {audio_path}: {e}, sending the original file")
+        with open(audio_path, 'rb') as f:
+            return PreparedAudio(audio_path, f.read(), os.path.basename(audio_path))
+
+    pcm_hash = pcm_sha256(pcm)
+    if len(pcm) < PCM_SAMPLE_RATE // 10:  # Less than 100ms
+        logger.warning(f"⚠️ Audio too short to preprocess: {audio_path}")
+        samples = np.array(pcm, dtype=np.int16)
+    else:
+        samples = preprocess_pcm(pcm)
+    prepared = PreparedAudio(audio_path, wav_bytes(samples), f"{name}.wav", pcm_hash, samples)
+    logger.info(f"🔧 Preprocessed {os.path.basename(audio_path)} in memory: "
+                f"{dbfs(samples):.1f}dB, {prepared.duration_ms}ms")
+    return prepared
+
+
+def prepare_audio_for_transcription(audio_path: str) -> PreparedAudio:
+    """Preprocessed audio for `audio_path`, memoized by path, mtime and size"""
+    stat = os.stat(audio_path)
+    key = (os.path.realpath(audio_path), stat.st_mtime_ns, stat.st_size)
+    with _memo_lock:
+        prepared = _memo.get(key)
+        if prepared is not None:
+            _memo.move_to_end(key)
+            return prepared
+    prepared = _prepare(audio_path)
+    with _memo_lock:
+        _memo[key] = prepared
+        while len(_memo) > PREPARED_AUDIO_MEMO_SIZE:
+            _memo.popitem(last=False)
+    return prepared
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Backup Store
+Backup copies (*.backup.<ts>, *.backup_<ts>, *_backup_<ts>.mp4 ...) are moved
+out of the conversation, videos and config folders into one store where
+each distinct content is kept once, named by its SHA-256
+(backups/objects/ab/abcd....mp4, read-only), and every backed-up version is
+a hard link to it under backups/versions/<original path>/<ts>-<sha12><ext>.
+A retention policy (last N, newest per day, newest per week) prunes
+versions; objects no version refers to any more are deleted. Maintenance
+runs in the background and as a dry-run report:
+
+    python -m backend.backup_store report
+    python -m backend.backup_store run
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.json_files import file_lock
+
+logger = logging.getLogger(__name__)
+
+BACKUP_STORE_DIR = os.environ.get('BACKUP_STORE_DIR', 'backups')
+# Folders swept for backup copies
+BACKUP_SCAN_ROOTS = [root for root in os.environ.get('BACKUP_SCAN_ROOTS', 'conversations,videos,config').split(',') if root]
+# Retention per original file: the newest N versions, plus the newest of each of the last D days / W weeks
+BACKUP_KEEP_LAST = int(os.environ.get('BACKUP_KEEP_LAST', 5))
+BACKUP_KEEP_DAILY = int(os.environ.get('BACKUP_KEEP_DAILY', 7))
+BACKUP_KEEP_WEEKLY = int(os.environ.get('BACKUP_KEEP_WEEKLY', 8))
+# Background maintenance interval (0 disables it)
+BACKUP_MAINTENANCE_HOURS = float(os.environ.get('BACKUP_MAINTENANCE_HOURS', 6))
+
+READ_BYTES = 1024 * 1024
+# name.ext.backup.<ts> / name.ext.backup_<ts> / name.ext.backup_<reason>_<ts>
+_SUFFIX_BACKUP = re.compile(r'^(?P<original>.+)\.backup[._](?:[a-z]+_)?(?P<ts>\d{9,})$')
+# name_backup_<ts>.ext / name_backup_<ts>_metadata.json
+_INFIX_BACKUP = re.compile(r'^(?P<stem>.+?)_backup_(?P<ts>\d{9,})(?P<rest>(?:_\w+)?\.\w+)$')
+_VERSION = re.compile(r'^(?P<ts>\d+)-(?P<sha>[0-9a-f]{12})(?P<ext>\.[^.]*)?$')
+
+
+def file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(READ_BYTES)
+            if not data:
+                break
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def parse_backup_name(path: str) -> Optional[Tuple[str, float]]:
+    """(path of the original file, backup time) for a backup copy, None for anything else"""
+    directory, name = os.path.split(path)
+    match = _SUFFIX_BACKUP.match(name)
+    if match:
+        return os.path.join(directory, match.group('original')), float(match.group('ts'))
+    match = _INFIX_BACKUP.match(name)
+    if match:
+        return os.path.join(directory, match.group('stem') + match.group('rest')), float(match.group('ts'))
+    return None
+
+
+def _extension(origin: str) -> str:
+    return os.path.splitext(origin)[1]
+
+
+def retention_keep(versions: List[Dict[str, Any]], keep_last: int = BACKUP_KEEP_LAST,
+                   keep_daily: int = BACKUP_KEEP_DAILY, keep_weekly: int = BACKUP_KEEP_WEEKLY) -> Set[int]:
+    """
+    Indexes of the versions (of one original, any order) the policy keeps:
+    the newest keep_last, and the newest in each of the keep_daily most
+    recent days and keep_weekly most recent ISO weeks that have versions.
+    """
+    order = sorted(range(len(versions)), key=lambda i: versions[i]['ts'], reverse=True)
+    keep = set(order[:keep_last])
+    for count, bucket in ((keep_daily, lambda ts: datetime.fromtimestamp(ts).date()),
+                          (keep_weekly, lambda ts: datetime.fromtimestamp(ts).isocalendar()[:2])):
+        seen = set()
+        for i in order:
+            key = bucket(versions[i]['ts'])
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.add(key)
+            keep.add(i)
+    return keep
+
+
+class BackupStore:
+    def __init__(self, root: str = BACKUP_STORE_DIR):
+        self.root = root
+        self._thread: Optional[threading.Thread] = None
+
+    def _object_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.root, 'objects', sha256[:2], f"{sha256}{ext}")
+
+    def _versions_dir(self, origin: str) -> str:
+        return os.path.join(self.root, 'versions', os.path.normpath(origin).lstrip(os.sep))
+
+    def versions(self, origin: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Stored versions (of one original file, or all), oldest first"""
+        base = self._versions_dir(origin) if origin else os.path.join(self.root, 'versions')
+        found = []
+        for directory, _, names in os.walk(base):
+            for name in names:
+                match = _VERSION.match(name)
+                if not match:
+                    continue
+                path = os.path.join(directory, name)
+                found.append({
+                    "origin": os.path.relpath(directory, os.path.join(self.root, 'versions')),
+                    "ts": float(match.group('ts')),
+                    "sha12": match.group('sha'),
+                    "path": path,
+                    "size": os.path.getsize(path),
+                })
+        return sorted(found, key=lambda version: (version['origin'], version['ts']))
+
+    def add(self, path: str, origin: Optional[str] = None, timestamp: Optional[float] = None,
+            move: bool = False) -> Optional[str]:
+        """
+        Back up one file as a version of `origin` (default: the file itself).
+        move=True takes the file over (for backup copies, which are never
+        written again); otherwise the content is copied, since the live file
+        may be rewritten in place. Returns the version path, or None when the
+        original already has a version with this content.
+        """
+        origin = os.path.normpath(origin or path)
+        timestamp = time.time() if timestamp is None else timestamp
+        ext = _extension(origin)
+        sha256 = file_sha256(path)
+        target = self._object_path(sha256, ext)
+
+        if os.path.exists(target):
+            if move:
+                os.unlink(path)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            if move:
+                shutil.move(path, tmp_path)
+            else:
+                shutil.copy2(path, tmp_path)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, target)
+
+        versions_dir = self._versions_dir(origin)
+        os.makedirs(versions_dir, exist_ok=True)
+        if any(name.endswith(f"-{sha256[:12]}{ext}") for name in os.listdir(versions_dir)):
+            return None
+        version_path = os.path.join(versions_dir, f"{int(timestamp)}-{sha256[:12]}{ext}")
+        try:
+            os.link(target, version_path)
+        except OSError:
+            shutil.copy2(target, version_path)
+        return version_path
+
+    def restore(self, version_path: str, target: str):
+        """Copy a stored version back to a (writable) file"""
+        shutil.copyfile(version_path, target)
+
+    def scan(self, roots: Iterable[str] = BACKUP_SCAN_ROOTS) -> List[Dict[str, Any]]:
+        """Backup copies lying in the scanned folders"""
+        found = []
+        store_root = os.path.abspath(self.root)
+        for root in roots:
+            for directory, dirnames, names in os.walk(root):
+                dirnames[:] = [d for d in dirnames if not d.startswith('.')
+                               and os.path.abspath(os.path.join(directory, d)) != store_root]
+                for name in names:
+                    path = os.path.join(directory, name)
+                    parsed = parse_backup_name(path)
+                    if parsed and os.path.isfile(path):
+                        found.append({"path": path, "origin": os.path.normpath(parsed[0]), "ts": parsed[1],
+                                      "size": os.path.getsize(path)})
+        return found
+
+    def _plan(self, versions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Versions the retention policy drops"""
+        by_origin: Dict[str, List[Dict[str, Any]]] = {}
+        for version in versions:
+            by_origin.setdefault(version['origin'], []).append(version)
+        dropped = []
+        for origin_versions in by_origin.values():
+            keep = retention_keep(origin_versions)
+            dropped.extend(version for i, version in enumerate(origin_versions) if i not in keep)
+        return dropped
+
+    def _objects(self) -> List[Tuple[str, str, int]]:
+        """(path, sha256, size) of every stored object"""
+        objects = []
+        for directory, _, names in os.walk(os.path.join(self.root, 'objects')):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(directory, name)
+                objects.append((path, name.split('.', 1)[0], os.path.getsize(path)))
+        return objects
+
+    def maintain(self, dry_run: bool = False, roots: Iterable[str] = BACKUP_SCAN_ROOTS) -> Dict[str, Any]:
+        """
+        Move backup copies into the store, apply the retention policy and
+        delete unreferenced objects. With dry_run nothing is touched and the
+        report says what would happen.
+        """
+        started = time.time()
+        with file_lock(os.path.join(self.root, '.maintenance')):
+            found = self.scan(roots)
+            hashed = [(item, file_sha256(item['path'])) for item in found]
+            stored = {sha for _, sha, _ in self._objects()}
+            distinct = {sha: item for item, sha in hashed}
+            new_objects = [(None, sha, item['size']) for sha, item in distinct.items() if sha not in stored]
+            new_bytes = sum(size for _, _, size in new_objects)
+
+            if dry_run:
+                versions = self.versions()
+                known = {(version['origin'], version['sha12']) for version in versions}
+                for item, sha in sorted(hashed, key=lambda pair: pair[0]['ts']):
+                    if (item['origin'], sha[:12]) not in known:
+                        known.add((item['origin'], sha[:12]))
+                        versions.append({"origin": item['origin'], "ts": item['ts'], "sha12": sha[:12],
+                                         "path": None, "size": item['size']})
+            else:
+                # Oldest first, so a content's version carries the time it was first backed up
+                for item, _ in sorted(hashed, key=lambda pair: pair[0]['ts']):
+                    try:
+                        self.add(item['path'], origin=item['origin'], timestamp=item['ts'], move=True)
+                    except OSError as e:
+                        logger.warning(f"⚠️ Could not store backup {item['path']}: {e}")
+                versions = self.versions()
+
+            dropped = self._plan(versions)
+            if not dry_run:
+                for version in dropped:
+                    os.unlink(version['path'])
+
+            dropped_ids = {id(version) for version in dropped}
+            referenced = {version['sha12'] for version in versions if id(version) not in dropped_ids}
+            objects = self._objects() + (new_objects if dry_run else [])
+            unreferenced = [(path, sha, size) for path, sha, size in objects if sha[:12] not in referenced]
+            if not dry_run:
+                for path, _, _ in unreferenced:
+                    os.chmod(path, 0o644)
+                    os.unlink(path)
+
+        found_bytes = sum(item['size'] for item in found)
+        report = {
+            "dry_run": dry_run,
+            "backup_files": len(found),
+            "backup_bytes": found_bytes,
+            "distinct_contents": len(distinct),
+            "duplicate_files": len(found) - len(distinct),
+            "new_object_bytes": new_bytes,
+            "versions_kept": len(versions) - len(dropped),
+            "versions_pruned": [{"origin": version['origin'], "ts": version['ts']} for version in dropped],
+            "objects_removed": len(unreferenced),
+            # Backup files leave their folders, new objects are stored, unreferenced objects are deleted
+            "bytes_reclaimed": found_bytes - new_bytes + sum(size for _, _, size in unreferenced),
+            "policy": {"keep_last": BACKUP_KEEP_LAST, "keep_daily": BACKUP_KEEP_DAILY, "keep_weekly": BACKUP_KEEP_WEEKLY},
+            "seconds": round(time.time() - started, 3),
+        }
+        verb = "Would move" if dry_run else "Moved"
+        logger.info(f"🗄️ {verb} {len(found)} backup files ({len(distinct)} distinct) into {self.root}, "
+                    f"pruned {len(dropped)} versions, {len(unreferenced)} objects, "
+                    f"{report['bytes_reclaimed'] / (1024 * 1024):.1f} MB reclaimed")
+        return report
+
+    def start_maintenance(self, interval_hours: float = BACKUP_MAINTENANCE_HOURS):
+        """Run maintain() now and then every interval_hours in a daemon thread"""
+        if interval_hours <= 0 or (self._thread and self._thread.is_alive()):
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.maintain()
+                except Exception as e:
+                    logger.error(f"❌ Backup maintenance failed: {e}")
+                time.sleep(interval_hours * 3600)
+
+        self._thread = threading.Thread(target=loop, name='backup-maintenance', daemon=True)
+        self._thread.start()
+
+
+backup_store = BackupStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed backup store maintenance")
+    parser.add_argument("command", choices=["report", "run"], help="report: dry run; run: apply")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    print(json.dumps(backup_store.maintain(dry_run=args.command == "report"), indent=2))
+
+
+if __name__ == "__main__":
+    main()
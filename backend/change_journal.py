@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Emotion Change Journal
+Every write of an emotion file through the emotion store appends one JSON
+line with the field-level changes it made ({segment, field, old, new}) to
+conversations/<convo>/.history/<file>/journal-<ms>.jsonl, instead of
+copying the whole file to .backup.<timestamp>. Each journal starts at a
+snapshot-<ms>.json of the file; once a journal grows past
+EMOTION_JOURNAL_COMPACT_KB it is closed and a new snapshot starts the next
+one. The file's state at any time since the oldest kept snapshot is that
+snapshot with the journal replayed up to the time.
+
+    python -m backend.change_journal history conversations/convo1/emotions1_ai_analyzed.json
+    python -m backend.change_journal restore conversations/convo1/emotions1_ai_analyzed.json --to 2026-10-18T12:00:00 [--dry-run]
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from backend.json_files import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DIRNAME = '.history'
+# Journal size after which it is compacted into a new snapshot
+EMOTION_JOURNAL_COMPACT_BYTES = int(float(os.environ.get('EMOTION_JOURNAL_COMPACT_KB', 512)) * 1024)
+# Snapshot + journal generations kept per file (older undo history is dropped)
+EMOTION_JOURNAL_KEEP_GENERATIONS = int(os.environ.get('EMOTION_JOURNAL_KEEP_GENERATIONS', 20))
+
+_SNAPSHOT = re.compile(r'^snapshot-(\d+)\.json$')
+
+
+def history_dir(path: str) -> str:
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, HISTORY_DIRNAME, os.path.splitext(name)[0])
+
+
+def _snapshot_path(path: str, generation: int) -> str:
+    return os.path.join(history_dir(path), f"snapshot-{generation}.json")
+
+
+def _journal_path(path: str, generation: int) -> str:
+    return os.path.join(history_dir(path), f"journal-{generation}.jsonl")
+
+
+def generations(path: str) -> List[int]:
+    """Snapshot times (ms) of a file's history, oldest first"""
+    try:
+        names = os.listdir(history_dir(path))
+    except OSError:
+        return []
+    return sorted(int(m.group(1)) for m in map(_SNAPSHOT.match, names) if m)
+
+
+def diff_emotion_data(old: Dict, new: Dict) -> List[Dict[str, Any]]:
+    """
+    Field-level changes from old to new. Segments (dict values) are compared
+    field by field; anything else is one change with field None. A missing
+    "old" / "new" key means the segment or field did not exist on that side.
+    """
+    changes = []
+    for segment in list(old.keys()) + [key for key in new.keys() if key not in old]:
+        in_old, in_new = segment in old, segment in new
+        before, after = old.get(segment), new.get(segment)
+        if in_old and in_new and before == after:
+            continue
+        if in_old and in_new and isinstance(before, dict) and isinstance(after, dict):
+            for field in list(before.keys()) + [key for key in after.keys() if key not in before]:
+                if field in before and field in after and before[field] == after[field]:
+                    continue
+                change = {"segment": segment, "field": field}
+                if field in before:
+                    change["old"] = before[field]
+                if field in after:
+                    change["new"] = after[field]
+                changes.append(change)
+            continue
+        change = {"segment": segment, "field": None}
+        if in_old:
+            change["old"] = before
+        if in_new:
+            change["new"] = after
+        changes.append(change)
+    return changes
+
+
+def apply_changes(data: Dict, changes: List[Dict[str, Any]], reverse: bool = False):
+    """Replay changes onto data in place (reverse: undo them, newest first)"""
+    side = "old" if reverse else "new"
+    for change in (reversed(changes) if reverse else changes):
+        segment, field = change["segment"], change["field"]
+        if field is None:
+            if side in change:
+                data[segment] = change[side]
+            else:
+                data.pop(segment, None)
+            continue
+        target = data.get(segment)
+        if not isinstance(target, dict):
+            if side not in change:
+                continue
+            target = data[segment] = {}
+        if side in change:
+            target[field] = change[side]
+        else:
+            target.pop(field, None)
+
+
+def _start_generation(path: str, data: Dict, timestamp: float) -> int:
+    generation = int(timestamp * 1000)
+    while os.path.exists(_snapshot_path(path, generation)):
+        generation += 1
+    os.makedirs(history_dir(path), exist_ok=True)
+    atomic_write_json(_snapshot_path(path, generation), data, indent=None, separators=(',', ':'))
+    open(_journal_path(path, generation), 'a').close()
+    _prune(path)
+    return generation
+
+
+def _prune(path: str):
+    kept = generations(path)
+    for generation in kept[:-EMOTION_JOURNAL_KEEP_GENERATIONS] if EMOTION_JOURNAL_KEEP_GENERATIONS > 0 else []:
+        for stale in (_snapshot_path(path, generation), _journal_path(path, generation)):
+            try:
+                os.unlink(stale)
+            except OSError:
+                pass
+        logger.info(f"🧹 Dropped history generation {generation} of {os.path.basename(path)}")
+
+
+def record(path: str, old: Optional[Dict], new: Dict, source: Optional[str] = None,
+           old_mtime: Optional[float] = None) -> int:
+    """
+    Journal one write of `path` (call while holding the file's lock, after
+    the write). `old_mtime` is when the replaced content was written.
+    Returns the number of changes recorded.
+    """
+    now = time.time()
+    kept = generations(path)
+    if not kept:
+        # First write with history: the replaced content is the baseline, valid since it was written
+        _start_generation(path, old if old is not None else new, min(old_mtime or now, now))
+        if old is None:
+            return 0
+        kept = generations(path)
+    changes = diff_emotion_data(old or {}, new)
+    if not changes:
+        return 0
+    journal = _journal_path(path, kept[-1])
+    entry = {"ts": now, "source": source, "changes": changes}
+    with open(journal, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+    if os.path.getsize(journal) > EMOTION_JOURNAL_COMPACT_BYTES:
+        _start_generation(path, new, now)
+        logger.info(f"🗜️ Compacted history of {os.path.basename(path)} into a new snapshot")
+    return len(changes)
+
+
+def _read_journal(path: str, generation: int) -> Iterator[Dict[str, Any]]:
+    try:
+        with open(_journal_path(path, generation), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-append
+                    continue
+    except OSError:
+        return
+
+
+def entries(path: str, since: Optional[float] = None, until: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Journal entries of every kept generation, oldest first, optionally within [since, until]"""
+    result = []
+    for generation in generations(path):
+        for entry in _read_journal(path, generation):
+            if (since is None or entry["ts"] >= since) and (until is None or entry["ts"] <= until):
+                result.append(entry)
+    return result
+
+
+def state_at(path: str, timestamp: float) -> Dict:
+    """The file's content as of `timestamp` (seconds since the epoch)"""
+    candidates = [generation for generation in generations(path) if generation <= timestamp * 1000]
+    if not candidates:
+        raise ValueError(f"No history of {path} reaches back to {datetime.fromtimestamp(timestamp).isoformat()}")
+    generation = candidates[-1]
+    with open(_snapshot_path(path, generation), 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    for entry in _read_journal(path, generation):
+        if entry["ts"] > timestamp:
+            break
+        apply_changes(data, entry["changes"])
+    return data
+
+
+def restore(path: str, timestamp: float, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Put the file back to its state at `timestamp`. The restore is written
+    through the emotion store, so it is journaled (and can be undone) too.
+    """
+    from backend.emotion_store import emotion_store
+
+    # Buffered edits go to disk (and the journal) first, so they are not replayed over the restore
+    emotion_store.flush(path)
+    with emotion_store.lock(path):
+        target = state_at(path, timestamp)
+        current = emotion_store.read(path) or {}
+        changes = diff_emotion_data(current, target)
+        if not dry_run and changes:
+            emotion_store.write(path, target, source=f"restore:{datetime.fromtimestamp(timestamp).isoformat()}")
+    return {"file": path, "restored_to": timestamp, "changes": len(changes), "dry_run": dry_run,
+            "segments": sorted({change["segment"] for change in changes})}
+
+
+def parse_timestamp(value: str) -> float:
+    """Epoch seconds or an ISO date/time (local time)"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emotion file change history")
+    sub = parser.add_subparsers(dest="command", required=True)
+    history_parser = sub.add_parser("history", help="List journaled changes")
+    history_parser.add_argument("file")
+    history_parser.add_argument("--since", help="epoch seconds or ISO time")
+    restore_parser = sub.add_parser("restore", help="Restore the file to its state at a time")
+    restore_parser.add_argument("file")
+    restore_parser.add_argument("--to", required=True, help="epoch seconds or ISO time")
+    restore_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    if args.command == "history":
+        since = parse_timestamp(args.since) if args.since else None
+        for entry in entries(args.file, since=since):
+            fields = ', '.join(f"{c['segment']}.{c['field']}" if c['field'] else c['segment'] for c in entry["changes"])
+            print(f"{datetime.fromtimestamp(entry['ts']).isoformat(timespec='seconds')}  "
+                  f"{entry.get('source') or '-':<20} {fields}")
+    else:
+        result = restore(args.file, parse_timestamp(args.to), dry_run=args.dry_run)
+        verb = "Would change" if args.dry_run else "Restored"
+        print(f"{verb} {result['changes']} fields in {len(result['segments'])} segments of {args.file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Chunked, Resumable Uploads
+Recordings are uploaded as a sequence of raw chunks appended to a staged
+file, with a SHA-256 rolled forward as the bytes arrive. A dropped
+connection only loses the chunk in flight: the client asks for the current
+offset and continues from there (also after a page reload, via its resume
+key, or a server restart). Chunks of one upload may reach different
+gunicorn workers: the offset check and append run under a file lock shared
+between processes, and when a worker's rolling hash does not cover the
+staged bytes the hash is computed once, when the upload is finished.
+Finished uploads are indexed by content hash, so uploading a recording that
+is already stored links to the existing copy instead of storing another.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from backend.json_files import file_lock
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_STAGING_DIR = os.environ.get('UPLOAD_STAGING_DIR', os.path.join('cache', 'uploads'))
+RECORDING_INDEX_DIR = os.environ.get('RECORDING_INDEX_DIR', os.path.join('cache', 'recordings'))
+# Chunk size suggested to clients (each chunk is one request)
+UPLOAD_CHUNK_BYTES = int(float(os.environ.get('UPLOAD_CHUNK_MB', 8)) * 1024 * 1024)
+# Unfinished uploads older than this are removed
+UPLOAD_SESSION_TTL_SECONDS = int(float(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 24)) * 3600)
+
+READ_BYTES = 1024 * 1024
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """Upload request that cannot be applied; carries the HTTP status and current offset"""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def copy_with_sha256(source: BinaryIO, target: BinaryIO, hasher=None) -> Tuple[Any, int]:
+    """Copy a stream in fixed-size reads, hashing as it goes; returns (hasher, bytes copied)"""
+    hasher = hasher or hashlib.sha256()
+    copied = 0
+    while True:
+        data = source.read(READ_BYTES)
+        if not data:
+            break
+        target.write(data)
+        hasher.update(data)
+        copied += len(data)
+    return hasher, copied
+
+
+def save_stream_with_sha256(source: BinaryIO, target_path: str) -> Tuple[str, int]:
+    """Write a stream to target_path (via a temp file); returns (sha256 hex, size)"""
+    tmp_path = f"{target_path}.{os.getpid()}.part"
+    try:
+        with open(tmp_path, 'wb') as f:
+            hasher, size = copy_with_sha256(source, f)
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    return hasher.hexdigest(), size
+
+
+class RecordingIndex:
+    """Stored recordings by content hash: <index_dir>/<sha[:2]>/<sha>.json"""
+
+    def __init__(self, index_dir: str = RECORDING_INDEX_DIR):
+        self.index_dir = index_dir
+
+    def _path(self, sha256: str) -> str:
+        return os.path.join(self.index_dir, sha256[:2], f"{sha256}.json")
+
+    def find(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """The stored recording with this hash, if its file is still there unchanged"""
+        try:
+            with open(self._path(sha256), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            if os.path.getsize(entry['path']) == entry['size']:
+                return entry
+        except (OSError, KeyError):
+            pass
+        return None
+
+    def register(self, sha256: str, path: str, size: int, conversation_folder: Optional[str] = None):
+        target = self._path(sha256)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "sha256": sha256,
+                "path": path,
+                "size": size,
+                "conversationFolder": conversation_folder,
+                "stored_at": time.time()
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, target)
+
+
+class UploadManager:
+    """
+    Upload sessions under <staging_dir>: <id>.json holds the metadata,
+    <id>.part the bytes received so far (its size is the upload offset).
+    """
+
+    def __init__(self, staging_dir: str = UPLOAD_STAGING_DIR):
+        self.staging_dir = staging_dir
+        # upload id -> (inode, offset, hasher) of the bytes this process appended
+        self._hashers: Dict[str, Tuple[int, int, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.staging_dir, f"{upload_id}.json")
+
+    def part_path(self, upload_id: str) -> str:
+        return os.path.join(self.staging_dir, f"{upload_id}.part")
+
+    def _session_lock(self, upload_id: str):
+        """Serializes offset check + append of one upload between threads and worker processes"""
+        return file_lock(self.part_path(upload_id))
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        if not _UPLOAD_ID.match(upload_id or ''):
+            raise UploadError("Invalid upload id", 400)
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError(f"Unknown upload {upload_id}", 404)
+
+    def _offset(self, upload_id: str) -> int:
+        try:
+            return os.path.getsize(self.part_path(upload_id))
+        except OSError:
+            return 0
+
+    def _status(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        offset = self._offset(session['uploadId'])
+        return {
+            "uploadId": session['uploadId'],
+            "filename": session['filename'],
+            "size": session['size'],
+            "offset": offset,
+            "complete": offset == session['size'],
+            "chunkSize": UPLOAD_CHUNK_BYTES
+        }
+
+    def prune_stale(self):
+        """
+        Remove unfinished uploads nobody has touched for UPLOAD_SESSION_TTL_SECONDS.
+        A session is as old as its last received chunk (the .part mtime; the
+        .json is written once at start), and both files go together.
+        """
+        if not os.path.isdir(self.staging_dir):
+            return
+        cutoff = time.time() - UPLOAD_SESSION_TTL_SECONDS
+        upload_ids = {os.path.splitext(name)[0] for name in os.listdir(self.staging_dir)
+                      if name.endswith(('.json', '.part'))}
+        for upload_id in upload_ids:
+            try:
+                touched = max(os.path.getmtime(path) for path in (self.part_path(upload_id), self._meta_path(upload_id))
+                              if os.path.exists(path))
+            except (OSError, ValueError):
+                continue
+            if touched < cutoff:
+                self.discard(upload_id)
+                logger.info(f"🧹 Removed stale upload {upload_id}")
+
+    def start(self, filename: str, size: int, resume_key: Optional[str] = None) -> Dict[str, Any]:
+        """New upload session, or the unfinished one with the same resume key, filename and size"""
+        if size <= 0:
+            raise UploadError("Upload size must be positive", 400)
+        os.makedirs(self.staging_dir, exist_ok=True)
+        self.prune_stale()
+
+        if resume_key:
+            upload_id = hashlib.sha256(f"{resume_key}|{filename}|{size}".encode('utf-8')).hexdigest()[:32]
+            try:
+                session = self._load(upload_id)
+                logger.info(f"⏯️ Resuming upload {upload_id} of {filename} at {self._offset(upload_id):,}/{size:,} bytes")
+                return self._status(session)
+            except UploadError:
+                pass
+        else:
+            upload_id = uuid.uuid4().hex
+
+        session = {"uploadId": upload_id, "filename": filename, "size": size, "created_at": time.time()}
+        with open(self._meta_path(upload_id), 'w', encoding='utf-8') as f:
+            json.dump(session, f, ensure_ascii=False)
+        open(self.part_path(upload_id), 'ab').close()
+        logger.info(f"📤 Started upload {upload_id} of {filename} ({size:,} bytes)")
+        return self._status(session)
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        return self._status(self._load(upload_id))
+
+    def _rolling_hasher(self, upload_id: str, offset: int):
+        """
+        This process's rolling hash of the first `offset` staged bytes, or None
+        when another worker (or a previous run) appended some of them.
+        """
+        cached = self._hashers.get(upload_id)
+        try:
+            inode = os.stat(self.part_path(upload_id)).st_ino
+        except OSError:
+            return None
+        if cached and cached[0] == inode and cached[1] == offset:
+            return cached[2]
+        return hashlib.sha256() if offset == 0 else None
+
+    def _file_sha256(self, upload_id: str) -> str:
+        hasher = hashlib.sha256()
+        with open(self.part_path(upload_id), 'rb') as f:
+            while True:
+                data = f.read(READ_BYTES)
+                if not data:
+                    break
+                hasher.update(data)
+        return hasher.hexdigest()
+
+    def write_chunk(self, upload_id: str, offset: int, stream: BinaryIO) -> Dict[str, Any]:
+        """
+        Append a chunk that starts at `offset`. Any other offset is refused
+        with 409 and the current one, so the client can re-slice from there.
+        """
+        session = self._load(upload_id)
+        with self._session_lock(upload_id):
+            current = self._offset(upload_id)
+            if offset != current:
+                raise UploadError(f"Chunk offset {offset} does not match upload offset {current}", 409, current)
+            hasher = self._rolling_hasher(upload_id, current)
+            received = 0
+            try:
+                with open(self.part_path(upload_id), 'ab') as f:
+                    inode = os.fstat(f.fileno()).st_ino
+                    while True:
+                        data = stream.read(READ_BYTES)
+                        if not data:
+                            break
+                        if current + received + len(data) > session['size']:
+                            data = data[:session['size'] - current - received]
+                            f.write(data)
+                            if hasher:
+                                hasher.update(data)
+                            received += len(data)
+                            raise UploadError("Upload is larger than its declared size", 413, current + received)
+                        f.write(data)
+                        if hasher:
+                            hasher.update(data)
+                        received += len(data)
+            finally:
+                # Whatever reached the disk stays, and the hash matches it
+                if hasher:
+                    self._hashers[upload_id] = (inode, current + received, hasher)
+                else:
+                    self._hashers.pop(upload_id, None)
+        return self._status(session)
+
+    def finish(self, upload_id: str, expected_sha256: Optional[str] = None) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        Verify a fully received upload; returns (staged path, sha256, session).
+        The caller moves the staged file away and then calls discard().
+        """
+        session = self._load(upload_id)
+        with self._session_lock(upload_id):
+            offset = self._offset(upload_id)
+            if offset != session['size']:
+                raise UploadError(f"Upload incomplete: {offset} of {session['size']} bytes", 409, offset)
+            hasher = self._rolling_hasher(upload_id, offset)
+            # Chunks that reached other workers: hash the staged file once
+            sha256 = hasher.hexdigest() if hasher else self._file_sha256(upload_id)
+            if expected_sha256 and expected_sha256.lower() != sha256:
+                self.discard(upload_id)
+                raise UploadError("SHA-256 mismatch, upload discarded", 422, 0)
+        logger.info(f"✅ Upload {upload_id} complete: {session['filename']} ({offset:,} bytes, sha256 {sha256[:12]})")
+        return self.part_path(upload_id), sha256, session
+
+    def discard(self, upload_id: str):
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+        for path in (self.part_path(upload_id), self._meta_path(upload_id)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+upload_manager = UploadManager()
+recording_index = RecordingIndex()
@@ -16,6 +16,8 @@ from pathlib import Path
 
 from flask import request, jsonify
 
+from backend.transcription_cache import transcription_cache, pcm_sha256_for_file
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -23,6 +25,9 @@ logger = logging.getLogger(__name__)
 whisper_model = None
 openai_client = None
 
+# Transcription cache model id for the local Whisper model loaded below
+WIZARD_WHISPER_MODEL = "whisper-base"
+
 def initialize_models():
     """Initialize Whisper and OpenAI models if available"""
     global whisper_model, openai_client
@@ -40,12 +45,15 @@ def initialize_models():
     # Initialize OpenAI client
     if openai_client is None:
         try:
-            from openai import OpenAI
+            from backend.openai_client import create_openai_client, use_mock_server
+            
+            # OPENAI_MOCK_SERVER_URL routes the wizard to the local mock server as well
+            use_mock_server()
             
             # Try to get API key from environment or existing config
             api_key = os.getenv('OPENAI_API_KEY')
             if api_key:
-                openai_client = OpenAI(api_key=api_key)
+                openai_client = create_openai_client(api_key)
                 logger.info("✅ OpenAI client configured with new API format")
             else:
                 logger.warning("⚠️ OpenAI API key not found - emotion analysis will use fallback method")
@@ -74,18 +82,6 @@ def transcribe_audio_route():
     try:
         logger.info("🎤 Transcription request received")
         
-        # Initialize models if needed
-        initialize_models()
-        
-        # Check model status with detailed logging
-        logger.info(f"📊 Whisper model status: {type(whisper_model)}")
-        if whisper_model is None:
-            logger.error("❌ Whisper model is None - initialization failed")
-            return jsonify({'error': 'Whisper model not initialized'}), 500
-        elif whisper_model is False:
-            logger.error("❌ Whisper model is False - loading failed")
-            return jsonify({'error': 'Whisper model failed to load'}), 500
-        
         if 'audio' not in request.files:
             logger.warning("⚠️ No audio file in request")
             return jsonify({'error': 'No audio file provided'}), 400
@@ -119,6 +115,30 @@ def transcribe_audio_route():
             return jsonify({'error': f'Failed to save audio: {str(e)}'}), 500
         
         try:
+            # Identical audio was already transcribed - skip loading Whisper altogether
+            pcm_hash = pcm_sha256_for_file(temp_audio_path)
+            transcribed_text = transcription_cache.get(pcm_hash, WIZARD_WHISPER_MODEL, 'he')
+            if transcribed_text:
+                logger.info(f"📝 Transcription result (cached): {transcribed_text}")
+                return jsonify({
+                    'success': True,
+                    'transcription': transcribed_text,
+                    'language': 'he',
+                    'cached': True
+                })
+            
+            # Initialize models if needed
+            initialize_models()
+            
+            # Check model status with detailed logging
+            logger.info(f"📊 Whisper model status: {type(whisper_model)}")
+            if whisper_model is None:
+                logger.error("❌ Whisper model is None - initialization failed")
+                return jsonify({'error': 'Whisper model not initialized'}), 500
+            elif whisper_model is False:
+                logger.error("❌ Whisper model is False - loading failed")
+                return jsonify({'error': 'Whisper model failed to load'}), 500
+            
             # Transcribe using Whisper
             logger.info("🎤 Starting Hebrew transcription...")
             result = whisper_model.transcribe(
@@ -134,6 +154,7 @@ def transcribe_audio_route():
                 logger.warning("⚠️ Empty transcription result")
                 return jsonify({'error': 'Could not transcribe audio'}), 400
             
+            transcription_cache.put(pcm_hash, WIZARD_WHISPER_MODEL, transcribed_text, 'he')
             logger.info("✅ Transcription successful")
             return jsonify({
                 'success': True,
@@ -285,6 +306,7 @@ def analyze_with_openai(text):
         # Use the new OpenAI API format (v1.0+)
         response = openai_client.chat.completions.create(
             model="gpt-3.5-turbo",
+            metrics_stage="wizard_emotion",
             messages=[
                 {"role": "system", "content": "אתה מנתח רגשות מקצועי הכותב בעברית."},
                 {"role": "user", "content": prompt}
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Local Speaker Diarization
+CPU-only two-speaker assignment for conversation segments. Each segment gets
+a compact voice embedding (mean and spread of 12 MFCCs over its voiced
+frames, computed from a log-mel spectrogram in NumPy, a few milliseconds per
+segment) which is cached next to the segment's PCM sidecar. The embeddings
+of a whole conversation are then clustered into two speakers in one batch.
+The first speaker heard becomes speaker 0 (דובר 1, left side). WhisperX /
+pyannote diarization is no longer needed for speaker assignment.
+"""
+
+import functools
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from backend.pcm_cache import load_pcm, companion_path, PCM_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Bump when the embedding changes so cached ones are recomputed
+EMBEDDING_VERSION = 1
+EMBEDDING_KIND = f"voice{EMBEDDING_VERSION}"
+
+FRAME_MS = 25
+HOP_MS = 10
+N_FFT = 512
+N_MELS = 40
+N_MFCC = 13
+# Frames within this many dB of the segment's loudest frame count as voiced
+VOICED_RANGE_DB = float(os.environ.get('DIARIZATION_VOICED_RANGE_DB', 30))
+# ...and must be louder than this absolute floor
+VOICED_FLOOR_DBFS = float(os.environ.get('DIARIZATION_VOICED_FLOOR_DBFS', -50))
+MIN_VOICED_FRAMES = 10
+KMEANS_ITERATIONS = 30
+
+
+@functools.lru_cache(maxsize=4)
+def mel_filterbank(sample_rate: int = PCM_SAMPLE_RATE, n_fft: int = N_FFT, n_mels: int = N_MELS) -> np.ndarray:
+    """(n_fft // 2 + 1, n_mels) triangular mel filters"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    mel_points = np.linspace(hz_to_mel(0.0), hz_to_mel(sample_rate / 2.0), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mel_points) / sample_rate).astype(int)
+    filters = np.zeros((n_fft // 2 + 1, n_mels))
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            filters[left:center, m - 1] = (np.arange(left, center) - left) / float(center - left)
+        if right > center:
+            filters[center:right, m - 1] = (right - np.arange(center, right)) / float(right - center)
+    return filters
+
+
+@functools.lru_cache(maxsize=4)
+def dct_matrix(n_mels: int = N_MELS, n_mfcc: int = N_MFCC) -> np.ndarray:
+    """(n_mels, n_mfcc) orthonormal DCT-II basis"""
+    n = np.arange(n_mels)
+    basis = np.cos(np.pi / n_mels * (n[:, None] + 0.5) * np.arange(n_mfcc)[None, :])
+    basis *= np.sqrt(2.0 / n_mels)
+    basis[:, 0] /= np.sqrt(2.0)
+    return basis
+
+
+def mfcc_frames(samples: np.ndarray, sample_rate: int = PCM_SAMPLE_RATE):
+    """(n_frames, N_MFCC) MFCCs and per-frame dBFS of int16 samples"""
+    frame_length = sample_rate * FRAME_MS // 1000
+    hop = sample_rate * HOP_MS // 1000
+    if len(samples) < frame_length:
+        return np.zeros((0, N_MFCC)), np.zeros(0)
+    frames = np.lib.stride_tricks.sliding_window_view(np.asarray(samples), frame_length)[::hop]
+    frames = frames.astype(np.float32) / 32768.0
+    frame_dbfs = 10 * np.log10(np.maximum(np.einsum('ij,ij->i', frames, frames) / frame_length, 1e-12))
+    # Pre-emphasis inside each frame, then a Hamming window
+    emphasized = np.empty_like(frames)
+    emphasized[:, 0] = frames[:, 0]
+    emphasized[:, 1:] = frames[:, 1:] - 0.97 * frames[:, :-1]
+    power = np.abs(np.fft.rfft(emphasized * np.hamming(frame_length).astype(np.float32), n=N_FFT, axis=1)) ** 2
+    log_mel = np.log(np.maximum(power @ mel_filterbank(sample_rate), 1e-10))
+    return log_mel @ dct_matrix(), frame_dbfs
+
+
+def voice_embedding(samples: np.ndarray, sample_rate: int = PCM_SAMPLE_RATE) -> Optional[np.ndarray]:
+    """
+    Mean and standard deviation of MFCC 1-12 over the voiced frames (c0,
+    the loudness term, is left out); None when there is too little speech.
+    """
+    mfcc, frame_dbfs = mfcc_frames(samples, sample_rate)
+    if len(frame_dbfs) == 0:
+        return None
+    voiced = (frame_dbfs > frame_dbfs.max() - VOICED_RANGE_DB) & (frame_dbfs > VOICED_FLOOR_DBFS)
+    if voiced.sum() < MIN_VOICED_FRAMES:
+        return None
+    coefficients = mfcc[voiced, 1:]
+    return np.concatenate((coefficients.mean(axis=0), coefficients.std(axis=0))).astype(np.float32)
+
+
+def file_embedding(path: str) -> Optional[np.ndarray]:
+    """Voice embedding of a segment file, cached next to its PCM sidecar"""
+    try:
+        cache_path = companion_path(path, EMBEDDING_KIND)
+    except OSError:
+        return None
+    if os.path.exists(cache_path):
+        try:
+            embedding = np.load(cache_path, allow_pickle=False)
+            return embedding if embedding.size else None
+        except (OSError, ValueError):
+            pass
+    try:
+        embedding = voice_embedding(load_pcm(path))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not embed {path} for diarization: {e}")
+        return None
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            # An empty array records "no speech" so it is not recomputed either
+            np.save(f, embedding if embedding is not None else np.zeros(0, dtype=np.float32), allow_pickle=False)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"⚠️ Could not cache voice embedding for {path}: {e}")
+    return embedding
+
+
+def cluster_speakers(embeddings: Sequence[Optional[np.ndarray]]) -> List[Optional[int]]:
+    """
+    Two-speaker k-means over standardized embeddings (deterministic
+    farthest-point initialization). Segments without an embedding get None;
+    the speaker of the first embedded segment is 0.
+    """
+    labels: List[Optional[int]] = [None] * len(embeddings)
+    indices = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+    if not indices:
+        return labels
+    if len(indices) == 1:
+        labels[indices[0]] = 0
+        return labels
+
+    X = np.stack([embeddings[i] for i in indices]).astype(np.float64)
+    X = (X - X.mean(axis=0)) / np.maximum(X.std(axis=0), 1e-6)
+
+    first = int(np.argmax(((X - X.mean(axis=0)) ** 2).sum(axis=1)))
+    second = int(np.argmax(((X - X[first]) ** 2).sum(axis=1)))
+    centroids = X[[first, second]]
+    assignment = np.zeros(len(X), dtype=int)
+    for _ in range(KMEANS_ITERATIONS):
+        distances = ((X[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        new_assignment = distances.argmin(axis=1)
+        if _ and np.array_equal(new_assignment, assignment):
+            break
+        assignment = new_assignment
+        for k in range(2):
+            if np.any(assignment == k):
+                centroids[k] = X[assignment == k].mean(axis=0)
+
+    # The first voice heard is דובר 1 (speaker 0)
+    if assignment[0] == 1:
+        assignment = 1 - assignment
+    for i, label in zip(indices, assignment.tolist()):
+        labels[i] = label
+    return labels
+
+
+def diarize_files(paths: Iterable[str]) -> Dict[str, Optional[int]]:
+    """Speaker (0/1, None without speech) for each segment file of one conversation"""
+    paths = list(paths)
+    labels = cluster_speakers([file_embedding(path) for path in paths])
+    assigned = [label for label in labels if label is not None]
+    logger.info(f"👥 Diarized {len(paths)} segments: {assigned.count(0)} × דובר 1, {assigned.count(1)} × דובר 2")
+    return dict(zip(paths, labels))
+
+
+def diarize_ranges(pcm: np.ndarray, ranges_ms: Sequence[Sequence[int]],
+                   sample_rate: int = PCM_SAMPLE_RATE) -> List[Optional[int]]:
+    """Speaker for each [start_ms, end_ms] range of one decoded recording"""
+    embeddings = [voice_embedding(pcm[start * sample_rate // 1000:end * sample_rate // 1000], sample_rate)
+                  for start, end in ranges_ms]
+    return cluster_speakers(embeddings)
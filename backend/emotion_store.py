@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Emotion Store
+Parsed conversation emotion files (emotionsN_ai_analyzed.json) kept in
+memory, keyed by path and validated against the file's mtime and size on
+every read, so a file changed by another process or by hand is re-parsed
+and an unchanged one never is. The cache is an LRU bounded by the total
+size of the cached files.
+
+Reads hand out read-only views (FrozenDict / FrozenList, which serialize
+like the plain dict / list they subclass); code that changes a file goes
+through `update` (read-modify-write under the file's lock, shared with
+other workers through backend.json_files) or `write`, the single place
+emotion files are written (atomically, with the field-level changes
+appended to the conversation's change journal). Small segment edits such as
+slider moves can be staged instead: they show up at once in reads served
+by the same process and are merged into one write per file every
+EMOTION_STORE_FLUSH_MS; other gunicorn workers see them once written.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from backend import change_journal
+from backend.json_files import atomic_write_json, file_lock
+
+logger = logging.getLogger(__name__)
+
+EMOTION_STORE_MAX_BYTES = int(float(os.environ.get('EMOTION_STORE_MAX_MB', 32)) * 1024 * 1024)
+# Write-behind window for segment edits staged with stage() (0 writes each edit through)
+EMOTION_STORE_FLUSH_MS = int(os.environ.get('EMOTION_STORE_FLUSH_MS', 300))
+
+
+def _read_only(*args, **kwargs):
+    raise TypeError("Emotion data from the store is read-only; change it through emotion_store.update()")
+
+
+class FrozenDict(dict):
+    """dict that refuses in-place changes"""
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _read_only
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class FrozenList(list):
+    """list that refuses in-place changes"""
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = pop = remove = clear = \
+        sort = reverse = _read_only
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def _freeze_value(value):
+    if type(value) is list:
+        return FrozenList(_freeze_value(item) for item in value)
+    return value
+
+
+def _freeze_object(pairs: Dict[str, Any]) -> FrozenDict:
+    # json object_hook: nested objects arrive already frozen, lists are frozen here
+    return FrozenDict((key, _freeze_value(value)) for key, value in pairs.items())
+
+
+def freeze(value):
+    """Read-only deep copy of a JSON value"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Plain, mutable deep copy of a (frozen) JSON value"""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
+
+
+def _apply_deltas(data: Dict, deltas: Dict[str, Dict[str, Any]]):
+    for filename, fields in deltas.items():
+        if isinstance(data.get(filename), dict):
+            data[filename].update(thaw(fields))
+
+
+def _merge_deltas(older: Dict[str, Dict[str, Any]], newer: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    merged = {filename: dict(fields) for filename, fields in older.items()}
+    for filename, fields in newer.items():
+        merged.setdefault(filename, {}).update(fields)
+    return merged
+
+
+class EmotionStore:
+    def __init__(self, max_bytes: int = EMOTION_STORE_MAX_BYTES, flush_ms: int = EMOTION_STORE_FLUSH_MS):
+        self.max_bytes = max_bytes
+        self.flush_ms = flush_ms
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int, int], int, FrozenDict]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # Write-behind segment edits: key -> (path, {segment: {field: value}}); _flushing holds those being written
+        self._pending: Dict[str, Tuple[str, Dict[str, Dict[str, Any]]]] = {}
+        self._flushing: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._overlays: Dict[str, Tuple[FrozenDict, FrozenDict]] = {}
+        self._flush_timer: Optional[threading.Timer] = None
+        self.hits = 0
+        self.misses = 0
+        self.staged = 0
+        self.flushes = 0
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.realpath(path)
+
+    @staticmethod
+    def _signature(stat: os.stat_result) -> Tuple[int, int, int]:
+        # Atomic writes replace the inode, so a rewrite is seen even within one mtime tick
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _remember(self, key: str, stat: os.stat_result, data: FrozenDict):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._bytes -= previous[1]
+            self._entries[key] = (self._signature(stat), stat.st_size, data)
+            self._bytes += stat.st_size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, size, _) = self._entries.popitem(last=False)
+                self._bytes -= size
+
+    def invalidate(self, path: str):
+        with self._lock:
+            entry = self._entries.pop(self._key(path), None)
+            if entry:
+                self._bytes -= entry[1]
+
+    def lock(self, path: str):
+        """Serializes read-modify-write of one file between threads and worker processes"""
+        return file_lock(path)
+
+    def _read_file(self, path: str) -> Optional[FrozenDict]:
+        """The file as it is on disk (through the cache)"""
+        key = self._key(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(path)
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == self._signature(stat):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f, object_hook=_freeze_object)
+        if not isinstance(data, dict):
+            raise ValueError(f"{path} does not hold a JSON object")
+        self._remember(key, stat, data)
+        return data
+
+    def _unwritten(self, key: str) -> Dict[str, Dict[str, Any]]:
+        """Staged edits not yet on disk, oldest first merged under newer (caller holds _lock)"""
+        pending = self._pending.get(key)
+        return _merge_deltas(self._flushing.get(key, {}), pending[1] if pending else {})
+
+    def read(self, path: str) -> Optional[FrozenDict]:
+        """Read-only view of the file including staged edits, None when it does not exist"""
+        key = self._key(path)
+        data = self._read_file(path)
+        if data is None:
+            return None
+        with self._lock:
+            if key not in self._pending and key not in self._flushing:
+                return data
+            overlay = self._overlays.get(key)
+            if overlay and overlay[0] is data:
+                return overlay[1]
+            merged = dict(data)
+            for filename, fields in self._unwritten(key).items():
+                segment = merged.get(filename)
+                if isinstance(segment, dict):
+                    merged[filename] = FrozenDict({**segment, **freeze(fields)})
+            view = FrozenDict(merged)
+            self._overlays[key] = (data, view)
+            return view
+
+    def get_segment(self, path: str, filename: str) -> Optional[FrozenDict]:
+        data = self.read(path)
+        return data.get(filename) if data is not None else None
+
+    def load(self, path: str, default: Optional[Dict] = None) -> Dict:
+        """Mutable copy of the file (or of `default` when it does not exist) to change and write back"""
+        data = self.read(path)
+        if data is None:
+            return thaw(default) if default is not None else {}
+        return thaw(data)
+
+    def stage(self, path: str, filename: str, updates: Dict[str, Any]) -> Optional[FrozenDict]:
+        """
+        Write-behind edit of one segment: visible at once to reads in this
+        process (other worker processes read the file, so they see it within
+        flush_ms, when it is written with other edits to the same file).
+        Returns the segment as it was, or None when the file has no such segment.
+        """
+        segment = self.get_segment(path, filename)
+        if segment is None:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Emotion file not found: {path}")
+            return None
+        key = self._key(path)
+        with self._lock:
+            pending = self._pending.setdefault(key, (path, {}))
+            pending[1].setdefault(filename, {}).update(thaw(updates))
+            self._overlays.pop(key, None)
+            self.staged += 1
+            if self.flush_ms > 0:
+                self._arm_timer()
+        if self.flush_ms <= 0:
+            self.flush(path)
+        return segment
+
+    def _arm_timer(self):
+        """Schedule a timed flush unless one is scheduled (caller holds _lock)"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_ms / 1000.0, self._timed_flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._flush_timer = None
+        self.flush()
+        with self._lock:
+            # Edits of a failed flush were re-queued: retry them on the next tick
+            if self._pending and self.flush_ms > 0:
+                self._arm_timer()
+
+    def flush(self, path: Optional[str] = None, source: str = "staged-edits") -> bool:
+        """
+        Write staged edits (of one file, or all) now. A flush of the file
+        already in progress in another thread is waited for. Returns False
+        when some edits could not be written (they stay queued).
+        """
+        with self._lock:
+            if path is None:
+                paths = [pending_path for pending_path, _ in self._pending.values()]
+            else:
+                paths = [path]
+        flushed = True
+        for pending_path in paths:
+            key = self._key(pending_path)
+            try:
+                # The file lock is held for the whole of a flush, so this waits for one that is running
+                with self.lock(pending_path):
+                    with self._lock:
+                        if key not in self._pending and key not in self._flushing:
+                            continue
+                    self.update(pending_path, lambda data: None, source=source)
+            except Exception as e:
+                logger.error(f"❌ Could not flush buffered edits to {pending_path}: {e}")
+                flushed = False
+        return flushed
+
+    def _write_file(self, path: str, data: Dict, previous: Optional[Dict], source: Optional[str]):
+        try:
+            previous_mtime = os.path.getmtime(path)
+        except OSError:
+            previous_mtime = None
+        stat = atomic_write_json(path, data)
+        self._remember(self._key(path), stat, freeze(data))
+        try:
+            change_journal.record(path, previous, data, source, previous_mtime)
+        except Exception as e:
+            # The save itself succeeded; only its undo history is missing
+            logger.warning(f"⚠️ Could not journal changes to {path}: {e}")
+
+    def _absorb_pending(self, path: str, data: Dict) -> str:
+        """Apply staged edits to `data` and mark them as being written; returns the key to settle"""
+        key = self._key(path)
+        with self._lock:
+            pending = self._pending.pop(key, None)
+            if pending:
+                self._flushing[key] = _merge_deltas(self._flushing.get(key, {}), pending[1])
+            _apply_deltas(data, self._flushing.get(key, {}))
+        return key
+
+    def _settle(self, key: str, written: bool, path: str):
+        with self._lock:
+            deltas = self._flushing.pop(key, None)
+            self._overlays.pop(key, None)
+            if deltas and not written:
+                # Keep them for the next flush, under anything staged since
+                newer = self._pending.get(key, (path, {}))[1]
+                self._pending[key] = (path, _merge_deltas(deltas, newer))
+            elif deltas:
+                self.flushes += 1
+
+    def write(self, path: str, data: Dict, source: Optional[str] = None):
+        """
+        Write a whole emotion file and cache what was written. Staged segment
+        edits are applied on top (they are newer than anything loaded
+        before them). The changes are journaled under `source`.
+        """
+        with self.lock(path):
+            previous = self._read_file(path)
+            key = self._absorb_pending(path, data)
+            written = False
+            try:
+                self._write_file(path, data, previous, source)
+                written = True
+            finally:
+                self._settle(key, written, path)
+
+    def update(self, path: str, mutate: Callable[[Dict], Any], default: Optional[Dict] = None,
+               source: Optional[str] = None) -> Any:
+        """
+        Read-modify-write: `mutate` gets a mutable copy of the file (of
+        `default` when it does not exist yet) with staged edits applied, and
+        its return value is passed through. The file is written only when the
+        data actually changed.
+        """
+        with self.lock(path):
+            current = self._read_file(path)
+            if current is None and default is None:
+                raise FileNotFoundError(f"Emotion file not found: {path}")
+            data = thaw(current if current is not None else default)
+            key = self._absorb_pending(path, data)
+            written = False
+            try:
+                result = mutate(data)
+                if current is None or data != current:
+                    self._write_file(path, data, current, source)
+                written = True
+            finally:
+                self._settle(key, written, path)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"files": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "staged": self.staged, "flushes": self.flushes,
+                    "pending_files": len(self._pending)}
+
+
+emotion_store = EmotionStore()
+# Buffered edits are written on interpreter exit (gunicorn workers also flush in worker_exit)
+atexit.register(emotion_store.flush)
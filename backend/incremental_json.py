@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Incremental JSON Object Parser
+Consumes a streamed model reply that is expected to be one JSON object and
+reports each top-level field as soon as its value is complete, so a client can
+render the first sections while the rest of the completion is still arriving.
+Text before the opening brace (e.g. a ```json fence) is skipped.
+"""
+
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONObjectParser:
+    """
+    Feed text chunks in order; `feed` returns the (key, value) pairs whose
+    values were completed by that chunk. Each character is scanned once.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.fields: List[Tuple[str, Any]] = []
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._key_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        if self.done or not text:
+            return []
+        self.buffer += text
+        completed = []
+        buffer = self.buffer
+
+        while self._pos < len(buffer) and not self.done:
+            ch = buffer[self._pos]
+            pos = self._pos
+            self._pos += 1
+
+            if not self._started:
+                if ch == '{':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._key_start is not None:
+                        self._key = json.loads(buffer[self._key_start:pos + 1])
+                        self._key_start = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._key is None:
+                        self._key_start = pos
+                    elif self._value_start is None:
+                        self._value_start = pos
+                continue
+
+            if self._depth == 1 and self._key is not None and self._value_start is None \
+                    and ch not in ' \t\r\n:,':
+                self._value_start = pos
+
+            if ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_field(buffer, pos, completed)
+                    self.done = True
+            elif ch == ',' and self._depth == 1:
+                self._complete_field(buffer, pos, completed)
+
+        return completed
+
+    def _complete_field(self, buffer: str, end: int, completed: List[Tuple[str, Any]]):
+        if self._key is None or self._value_start is None:
+            self._key = None
+            self._value_start = None
+            return
+        raw_value = buffer[self._value_start:end].strip()
+        try:
+            value = json.loads(raw_value)
+        except json.JSONDecodeError:
+            logger.warning(f"⚠️ Could not parse streamed field '{self._key}'")
+        else:
+            self.fields.append((self._key, value))
+            completed.append((self._key, value))
+        self._key = None
+        self._value_start = None
+
+    def result(self) -> Any:
+        """
+        The whole object parsed from the full buffer, ignoring anything around
+        the outermost braces; raises json.JSONDecodeError if it is not valid JSON.
+        """
+        start = self.buffer.find('{')
+        end = self.buffer.rfind('}')
+        if start == -1 or end < start:
+            return json.loads(self.buffer.strip())
+        return json.loads(self.buffer[start:end + 1])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Atomic JSON Files
+JSON files shared by request threads and gunicorn workers (emotion files,
+config/conversations_config.json, ...) are written to a temp file in the
+same directory, fsynced and moved over the target with os.replace, so a
+reader sees either the old or the new version and never a truncated one.
+Read-modify-write cycles hold a per-file lock: a thread lock inside the
+process plus an fcntl lock on cache/locks/<hash>.lock across processes.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only serialize threads of one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+JSON_LOCK_DIR = os.environ.get('JSON_LOCK_DIR', os.path.join('cache', 'locks'))
+
+_locks_guard = threading.Lock()
+_thread_locks: Dict[str, threading.RLock] = {}
+_lock_depth = threading.local()
+
+
+def _lock_key(path: str) -> str:
+    return os.path.realpath(path)
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    Exclusive lock on one file for a read-modify-write cycle. Re-entrant
+    within a thread; the fcntl lock is taken once per outermost acquisition.
+    """
+    key = _lock_key(path)
+    with _locks_guard:
+        thread_lock = _thread_locks.setdefault(key, threading.RLock())
+    with thread_lock:
+        depths = _lock_depth.__dict__.setdefault('depths', {})
+        outermost = depths.get(key, 0) == 0
+        lock_file = None
+        if outermost and fcntl is not None:
+            os.makedirs(JSON_LOCK_DIR, exist_ok=True)
+            lock_name = hashlib.sha1(key.encode('utf-8')).hexdigest() + '.lock'
+            lock_file = open(os.path.join(JSON_LOCK_DIR, lock_name), 'a')
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        depths[key] = depths.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            depths[key] -= 1
+            if lock_file is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                lock_file.close()
+
+
+def atomic_write_json(path: str, data: Any, indent: Optional[int] = 2, ensure_ascii: bool = False,
+                      **dump_kwargs) -> os.stat_result:
+    """
+    Write JSON via temp file + fsync + os.replace (+ directory fsync).
+    Returns the stat of the written file (the inode survives the rename).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=ensure_ascii, indent=indent, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+            stat = os.fstat(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return stat
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        pass
+    finally:
+        os.close(dir_fd)
+    return stat
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    """Parsed file, or `default` when it does not exist"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def update_json(path: str, mutate: Callable[[Any], Any], default: Any = None, **write_kwargs) -> Any:
+    """
+    Locked read-modify-write: `mutate` changes the parsed file (or `default`
+    when it does not exist; FileNotFoundError without one) in place and its
+    return value is passed through. Unchanged data is not rewritten.
+    """
+    with file_lock(path):
+        current = read_json(path)
+        if current is None:
+            if default is None:
+                raise FileNotFoundError(f"JSON file not found: {path}")
+            data = default
+        else:
+            data = copy.deepcopy(current)
+        result = mutate(data)
+        if current is None or data != current:
+            atomic_write_json(path, data, **write_kwargs)
+        return result
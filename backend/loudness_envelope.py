@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Loudness Envelopes
+A 50 Hz RMS envelope per segment, quantized to one byte per frame on a dBFS
+scale (-60 dBFS → 0, full scale → 255) and stored base64-encoded: a 20 s
+segment is ~1.3 KB of JSON. Envelopes are computed while a recording is
+segmented (from the samples already in memory), kept in the conversation's
+loudness_envelopes.json and copied into each segment of the emotion JSON, so
+playback drives the blobs from them without decoding or analysing audio in
+the browser.
+"""
+
+import base64
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from backend.audio_features import LEVEL_FLOOR_DBFS, FULL_SCALE
+from backend.pcm_cache import load_pcm, PCM_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+ENVELOPE_HZ = int(os.environ.get('LOUDNESS_ENVELOPE_HZ', 50))
+ENVELOPE_ENCODING = "uint8-dbfs"
+ENVELOPES_FILENAME = "loudness_envelopes.json"
+
+# Frames squared and summed at a time (bounds float memory on long files)
+ENVELOPE_BLOCK_FRAMES = 4096
+
+
+def _frame_length(sample_rate: int, hz: int) -> int:
+    return max(1, int(round(sample_rate / float(hz))))
+
+
+def quantize_levels(mean_squares: np.ndarray) -> np.ndarray:
+    """Mean squares of int16 samples → uint8 levels, linear in dBFS above LEVEL_FLOOR_DBFS"""
+    dbfs = 10.0 * np.log10(np.maximum(mean_squares, 1e-12) / (FULL_SCALE * FULL_SCALE))
+    levels = np.clip((dbfs - LEVEL_FLOOR_DBFS) / -LEVEL_FLOOR_DBFS, 0.0, 1.0)
+    return np.round(levels * 255).astype(np.uint8)
+
+
+def _frame_mean_squares(samples: np.ndarray, frame_samples: int) -> np.ndarray:
+    """Mean square of each run of `frame_samples` samples; the last frame may be partial"""
+    n = len(samples)
+    n_full = n // frame_samples
+    out = np.empty(n_full + (1 if n % frame_samples else 0), dtype=np.float64)
+    for start in range(0, n_full, ENVELOPE_BLOCK_FRAMES):
+        end = min(start + ENVELOPE_BLOCK_FRAMES, n_full)
+        block = np.asarray(samples[start * frame_samples:end * frame_samples], dtype=np.float32)
+        block = block.reshape(end - start, frame_samples)
+        out[start:end] = np.einsum('ij,ij->i', block, block, dtype=np.float64) / frame_samples
+    if len(out) > n_full:
+        tail = np.asarray(samples[n_full * frame_samples:], dtype=np.float64)
+        out[-1] = np.dot(tail, tail) / len(tail)
+    return out
+
+
+def compute_envelope(samples: np.ndarray, sample_rate: int = PCM_SAMPLE_RATE, channels: int = 1,
+                     hz: int = ENVELOPE_HZ) -> np.ndarray:
+    """uint8 loudness envelope of int16 samples (interleaved when channels > 1)"""
+    if len(samples) == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return quantize_levels(_frame_mean_squares(samples, _frame_length(sample_rate, hz) * channels))
+
+
+def envelopes_for_ranges(samples: np.ndarray, ranges_ms: Sequence[Sequence[int]], sample_rate: int = PCM_SAMPLE_RATE,
+                         channels: int = 1, hz: int = ENVELOPE_HZ) -> List[np.ndarray]:
+    """Envelope of each [start_ms, end_ms] range of one recording (pydub slicing arithmetic)"""
+    envelopes = []
+    for start, end in ranges_ms:
+        first = int(start * (sample_rate / 1000.0)) * channels
+        last = int(end * (sample_rate / 1000.0)) * channels
+        envelopes.append(compute_envelope(samples[first:last], sample_rate, channels, hz))
+    return envelopes
+
+
+class EnvelopeBuilder:
+    """
+    Whole-recording envelope built from PCM chunks of any size, for the
+    streaming segmenter. Frames are aligned to the start of the recording;
+    `slice` cuts out the frames covering a range.
+    """
+
+    def __init__(self, sample_rate: int = PCM_SAMPLE_RATE, hz: int = ENVELOPE_HZ):
+        self.sample_rate = sample_rate
+        self.hz = hz
+        self.frame_samples = _frame_length(sample_rate, hz)
+        self._levels: List[np.ndarray] = []
+        self._remainder = np.zeros(0, dtype=np.int16)
+        self._finished = None
+
+    def feed(self, chunk: np.ndarray):
+        if len(self._remainder):
+            chunk = np.concatenate((self._remainder, chunk))
+        n_full = len(chunk) // self.frame_samples * self.frame_samples
+        if n_full:
+            self._levels.append(quantize_levels(_frame_mean_squares(chunk[:n_full], self.frame_samples)))
+        self._remainder = np.array(chunk[n_full:], dtype=np.int16)
+        self._finished = None
+
+    def envelope(self) -> np.ndarray:
+        if self._finished is None:
+            parts = list(self._levels)
+            if len(self._remainder):
+                parts.append(quantize_levels(_frame_mean_squares(self._remainder, self.frame_samples)))
+            self._finished = np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint8)
+        return self._finished
+
+    def slice(self, start_ms: int, end_ms: int) -> np.ndarray:
+        envelope = self.envelope()
+        first = int(start_ms) * self.hz // 1000
+        last = -(-int(end_ms) * self.hz // 1000)
+        return envelope[first:last]
+
+
+def encode_envelope(envelope: np.ndarray, hz: int = ENVELOPE_HZ) -> Dict:
+    """JSON form stored with the segment data"""
+    return {
+        "hz": hz,
+        "encoding": ENVELOPE_ENCODING,
+        "floor_dbfs": LEVEL_FLOOR_DBFS,
+        "data": base64.b64encode(np.ascontiguousarray(envelope, dtype=np.uint8).tobytes()).decode('ascii'),
+    }
+
+
+def decode_envelope(encoded: Dict) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded["data"]), dtype=np.uint8)
+
+
+def file_envelope(path: str, hz: int = ENVELOPE_HZ) -> Optional[Dict]:
+    """Encoded envelope of one audio file, from its PCM sidecar"""
+    try:
+        return encode_envelope(compute_envelope(load_pcm(path), hz=hz), hz)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not compute loudness envelope for {path}: {e}")
+        return None
+
+
+def envelopes_path(conv_path: str) -> str:
+    return os.path.join(conv_path, ENVELOPES_FILENAME)
+
+
+def load_envelopes(conv_path: str) -> Dict[str, Dict]:
+    try:
+        with open(envelopes_path(conv_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_envelopes(conv_path: str, envelopes: Dict[str, Dict]):
+    target = envelopes_path(conv_path)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(envelopes, f, separators=(',', ':'))
+    os.replace(tmp_path, target)
+
+
+def store_segment_envelopes(conv_path: str, segment_files: Sequence[str], envelopes: Sequence[np.ndarray],
+                            hz: int = ENVELOPE_HZ):
+    """Record the envelopes computed during segmentation; a failure only costs a recompute later"""
+    try:
+        save_envelopes(conv_path, {name: encode_envelope(envelope, hz)
+                                   for name, envelope in zip(segment_files, envelopes)})
+        logger.info(f"📈 Stored {len(segment_files)} loudness envelopes in {envelopes_path(conv_path)}")
+    except OSError as e:
+        logger.warning(f"⚠️ Could not store loudness envelopes for {conv_path}: {e}")
+
+
+def conversation_envelopes(conv_path: str, segment_files: Iterable[str]) -> Dict[str, Optional[Dict]]:
+    """
+    Encoded envelope per segment file name. Entries of loudness_envelopes.json
+    are used while the file is at least as new as the segment; anything
+    missing or stale is computed from the PCM sidecar and written back.
+    """
+    stored = load_envelopes(conv_path)
+    try:
+        stored_mtime = os.path.getmtime(envelopes_path(conv_path))
+    except OSError:
+        stored_mtime = None
+
+    result: Dict[str, Optional[Dict]] = {}
+    computed = 0
+    for name in segment_files:
+        segment_path = os.path.join(conv_path, name)
+        entry = stored.get(name)
+        try:
+            fresh = entry is not None and stored_mtime is not None and os.path.getmtime(segment_path) <= stored_mtime
+        except OSError:
+            fresh = False
+        if not fresh:
+            entry = file_envelope(segment_path)
+            if entry is not None:
+                stored[name] = entry
+                computed += 1
+        result[name] = entry
+
+    if computed:
+        try:
+            save_envelopes(conv_path, stored)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not store loudness envelopes for {conv_path}: {e}")
+    return result
@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""
+Mock OpenAI Server
+Local stand-in for the /v1/chat/completions and /v1/audio/transcriptions
+endpoints used by the emotion visualizer, for offline load and latency tests.
+
+Features:
+- Recorded fixtures (exact request hash) and hand-written fixtures (substring match)
+- Built-in deterministic answers for the emotion detection/analysis prompts
+- Configurable latency distributions per endpoint
+- 429 / 500 injection and slow SSE streaming
+- Optional record mode that proxies to the real API and saves fixtures
+
+Usage:
+    python backend/mock_openai_server.py --port 8099 --chat-latency lognormal:800,0.4 --rate-429 0.05
+    OPENAI_MOCK_SERVER_URL=http://127.0.0.1:8099/v1 python start_server.py
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRANSCRIPT = "שלום, מה שלומך היום? אני שמח שנפגשנו."
+
+CHAT_ENDPOINT = 'chat.completions'
+AUDIO_ENDPOINT = 'audio.transcriptions'
+
+
+class LatencyDistribution:
+    """
+    Latency sampler parsed from a spec string (all values in milliseconds):
+    fixed:200 | uniform:100,400 | normal:300,80 | lognormal:300,0.5 (median, sigma)
+    """
+
+    def __init__(self, spec: str = "fixed:0"):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        self.kind = kind.strip().lower()
+        self.params = [float(p) for p in params.split(',') if p.strip()] if params else []
+        if self.kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample_seconds(self) -> float:
+        p = self.params
+        if self.kind == 'fixed':
+            ms = p[0] if p else 0
+        elif self.kind == 'uniform':
+            ms = random.uniform(p[0], p[1])
+        elif self.kind == 'normal':
+            ms = random.gauss(p[0], p[1])
+        else:
+            ms = random.lognormvariate(0, p[1]) * p[0]
+        return max(0.0, ms) / 1000.0
+
+
+class MockSettings:
+    """Runtime behaviour; can be changed while running via POST /__mock/config"""
+
+    def __init__(self, chat_latency: str = "fixed:0", audio_latency: str = "fixed:0",
+                 rate_429: float = 0.0, rate_500: float = 0.0, stream_chunk_chars: int = 8,
+                 stream_chunk_delay_ms: float = 0.0, seed: Optional[int] = None):
+        self.chat_latency = LatencyDistribution(chat_latency)
+        self.audio_latency = LatencyDistribution(audio_latency)
+        self.rate_429 = rate_429
+        self.rate_500 = rate_500
+        self.stream_chunk_chars = max(1, stream_chunk_chars)
+        self.stream_chunk_delay_ms = stream_chunk_delay_ms
+        if seed is not None:
+            random.seed(seed)
+
+    def update(self, values: Dict[str, Any]):
+        if 'chat_latency' in values:
+            self.chat_latency = LatencyDistribution(values['chat_latency'])
+        if 'audio_latency' in values:
+            self.audio_latency = LatencyDistribution(values['audio_latency'])
+        for key in ('rate_429', 'rate_500', 'stream_chunk_delay_ms'):
+            if key in values:
+                setattr(self, key, float(values[key]))
+        if 'stream_chunk_chars' in values:
+            self.stream_chunk_chars = max(1, int(values['stream_chunk_chars']))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "chat_latency": self.chat_latency.spec,
+            "audio_latency": self.audio_latency.spec,
+            "rate_429": self.rate_429,
+            "rate_500": self.rate_500,
+            "stream_chunk_chars": self.stream_chunk_chars,
+            "stream_chunk_delay_ms": self.stream_chunk_delay_ms,
+        }
+
+
+class MockStats:
+    """Request counters exposed at GET /__mock/stats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests: Dict[str, int] = {}
+            self.statuses: Dict[str, int] = {}
+            self.fixture_hits = 0
+            self.latency_total = 0.0
+
+    def record(self, endpoint: str, status: int, latency: float, fixture_hit: bool):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            self.fixture_hits += int(fixture_hit)
+            self.latency_total += latency
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.requests.values())
+            return {
+                "requests": dict(self.requests),
+                "statuses": dict(self.statuses),
+                "fixture_hits": self.fixture_hits,
+                "mean_injected_latency_ms": round(self.latency_total / total * 1000, 1) if total else 0.0,
+            }
+
+
+def chat_request_hash(payload: Dict[str, Any]) -> str:
+    """Identity of a chat request for recorded fixtures"""
+    key = {"model": payload.get("model"), "messages": payload.get("messages")}
+    return hashlib.sha256(json.dumps(key, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def audio_request_hash(audio_bytes: bytes, fields: Dict[str, str]) -> str:
+    """Identity of a transcription request for recorded fixtures"""
+    digest = hashlib.sha256(audio_bytes)
+    digest.update(json.dumps({"model": fields.get("model"), "language": fields.get("language")},
+                             sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class FixtureStore:
+    """
+    Fixtures are a JSON list of entries:
+      {"endpoint": "chat.completions", "request_hash": "...", "content": "..."}   (recorded)
+      {"endpoint": "chat.completions", "match": "substring", "content": "..."}    (hand-written)
+      {"endpoint": "audio.transcriptions", "match": "file name part", "text": "...", "segments": [...]}
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+            logger.info(f"📼 Loaded {len(self.entries)} fixtures from {path}")
+
+    def find(self, endpoint: str, request_hash: str, haystack: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for entry in self.entries:
+                if entry.get('endpoint') == endpoint and entry.get('request_hash') == request_hash:
+                    return entry
+            for entry in self.entries:
+                match = entry.get('match')
+                if entry.get('endpoint') == endpoint and match and match in haystack:
+                    return entry
+        return None
+
+    def add(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.entries = [e for e in self.entries
+                            if not (e.get('endpoint') == entry['endpoint']
+                                    and e.get('request_hash') == entry.get('request_hash'))]
+            self.entries.append(entry)
+            if self.path:
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.entries, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+
+
+# ==================== BUILT-IN RESPONDERS ====================
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get('content') or ''
+    if isinstance(content, list):
+        return ' '.join(part.get('text', '') for part in content if isinstance(part, dict))
+    return content
+
+
+def _listed_emotions(system_prompt: str) -> List[str]:
+    """Emotions rendered six per line as 'a | b | c' in the detection/analysis prompts"""
+    emotions = []
+    for line in system_prompt.splitlines():
+        if ' | ' in line and '<' not in line:
+            emotions.extend(part.strip() for part in line.split('|') if part.strip())
+    return emotions
+
+
+def _stable_pick(options: List[str], seed_text: str, count: int) -> List[str]:
+    """Deterministic choice so repeated load tests see identical answers"""
+    if not options:
+        return []
+    start = int(hashlib.md5(seed_text.encode('utf-8')).hexdigest(), 16)
+    return [options[(start + i * 7) % len(options)] for i in range(min(count, len(options)))]
+
+
+def builtin_chat_content(payload: Dict[str, Any]) -> str:
+    messages = payload.get('messages') or []
+    system_text = '\n'.join(_message_text(m) for m in messages if m.get('role') == 'system')
+    user_text = _message_text(messages[-1]) if messages else ''
+    all_text = system_text + '\n' + '\n'.join(_message_text(m) for m in messages if m.get('role') != 'system')
+
+    quoted = re.findall(r'"([^"]+)"\s*$', user_text.strip())
+    segment_text = quoted[-1] if quoted else user_text
+
+    if '"emotions_detected"' in all_text:
+        emotions = re.findall(r'רגשות מזוהים:\s*(.+)', all_text)
+        emotions = [e.strip() for e in emotions[0].split(',')] if emotions else _stable_pick(_listed_emotions(system_text), segment_text, 2)
+        words = len(segment_text.split())
+        seed = int(hashlib.md5(segment_text.encode('utf-8')).hexdigest(), 16)
+        return json.dumps({
+            "emotions_detected": emotions,
+            "primary_emotion": emotions[0] if emotions else "נייטרלי",
+            "word_count": words,
+            "humor_score": seed % 4,
+            "tone": "חם",
+            "is_question": '?' in segment_text,
+            "intention": "ביטוי רגש",
+            "godel_to_regesh": 1.5,
+            "kamut_to_regesh": 60,
+            "blur": seed % 6,
+            "spark": seed % 5,
+            "godel_to_regular": 1.0,
+            "grid_resolution": max(20, min(words * 10, 150)),
+            "blob_size": 3,
+            "blob_intensity": 1200,
+            "dominance": 1000,
+            "blobiness": 5,
+            "speaker_position": "מרכז",
+            "proximity": "בינוני",
+            "volume_factor": 1.0,
+            "energy_factor": 1.0,
+            "summary": "ניתוח משרת הדמה"
+        }, ensure_ascii=False)
+
+    listed = _listed_emotions(system_text)
+    if listed:
+        return ', '.join(_stable_pick(listed, segment_text, 2))
+
+    if (payload.get('response_format') or {}).get('type') == 'json_object' or 'JSON' in all_text:
+        return json.dumps({"summary": "ניתוח משרת הדמה", "main_emotion": "נייטרלי",
+                           "insights": [], "mock": True}, ensure_ascii=False)
+
+    # Transcript enhancement and other free-text prompts: hand the text back
+    return segment_text
+
+
+def builtin_transcription(audio_bytes: bytes) -> Dict[str, Any]:
+    # Rough duration guess from compressed size (~16 kB/s at 128 kbps)
+    duration = max(0.5, round(len(audio_bytes) / 16000, 2))
+    return {
+        "text": DEFAULT_TRANSCRIPT,
+        "segments": [{
+            "id": 0, "start": 0.0, "end": duration, "text": DEFAULT_TRANSCRIPT,
+            "avg_logprob": -0.25, "no_speech_prob": 0.02, "compression_ratio": 1.2
+        }],
+        "duration": duration,
+    }
+
+
+def parse_multipart(body: bytes, content_type: str) -> Tuple[Dict[str, str], bytes, str]:
+    """Minimal multipart/form-data parser: returns (fields, file_bytes, file_name)"""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    fields, file_bytes, file_name = {}, b'', ''
+    if not match:
+        return fields, file_bytes, file_name
+    boundary = b'--' + match.group(1).encode('latin-1')
+    for part in body.split(boundary):
+        head, sep, data = part.partition(b'\r\n\r\n')
+        if not sep:
+            continue
+        data = data[:-2] if data.endswith(b'\r\n') else data
+        headers = head.decode('utf-8', 'replace')
+        name = re.search(r'name="([^"]*)"', headers)
+        filename = re.search(r'filename="([^"]*)"', headers)
+        if filename:
+            file_bytes, file_name = data, filename.group(1)
+        elif name:
+            fields[name.group(1)] = data.decode('utf-8', 'replace')
+    return fields, file_bytes, file_name
+
+
+# ==================== HTTP HANDLER ====================
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "MockOpenAI/1.0"
+
+    # Set by create_server
+    settings: MockSettings = None
+    fixtures: FixtureStore = None
+    stats: MockStats = None
+    upstream: Optional[str] = None
+    record: bool = False
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('x-request-id', f"req_mock_{uuid.uuid4().hex[:16]}")
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def _inject_failure(self, endpoint: str, latency: float) -> bool:
+        """Send an injected 429/500 if the dice say so"""
+        roll = random.random()
+        if roll < self.settings.rate_429:
+            self.stats.record(endpoint, 429, latency, False)
+            self._send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests",
+                                            "param": None, "code": "rate_limit_exceeded"}},
+                            headers={'retry-after': '1'})
+            return True
+        if roll < self.settings.rate_429 + self.settings.rate_500:
+            self.stats.record(endpoint, 500, latency, False)
+            self._send_json(500, {"error": {"message": "The server had an error (mock)", "type": "server_error",
+                                            "param": None, "code": None}})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/__mock/stats':
+            self._send_json(200, {"stats": self.stats.to_dict(), "settings": self.settings.to_dict()})
+        elif self.path.rstrip('/') == '/v1/models':
+            self._send_json(200, {"object": "list", "data": [
+                {"id": model, "object": "model", "owned_by": "mock"}
+                for model in ("gpt-4o", "gpt-3.5-turbo", "whisper-1")
+            ]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        if path == '/__mock/config':
+            self.settings.update(json.loads(self._read_body() or b'{}'))
+            self._send_json(200, {"settings": self.settings.to_dict()})
+        elif path == '/__mock/reset':
+            self.stats.reset()
+            self._send_json(200, {"stats": self.stats.to_dict()})
+        elif path == '/v1/chat/completions':
+            self._handle_chat()
+        elif path == '/v1/audio/transcriptions':
+            self._handle_transcription()
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+
+    # ---------- chat ----------
+
+    def _handle_chat(self):
+        raw_body = self._read_body()
+        try:
+            payload = json.loads(raw_body or b'{}')
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+            return
+
+        latency = self.settings.chat_latency.sample_seconds()
+        time.sleep(latency)
+        if self._inject_failure(CHAT_ENDPOINT, latency):
+            return
+
+        request_hash = chat_request_hash(payload)
+        haystack = '\n'.join(_message_text(m) for m in payload.get('messages') or [])
+        fixture = self.fixtures.find(CHAT_ENDPOINT, request_hash, haystack)
+
+        if fixture is None and self.record and self.upstream:
+            fixture = self._record_chat(payload, request_hash)
+
+        content = fixture['content'] if fixture else builtin_chat_content(payload)
+        self.stats.record(CHAT_ENDPOINT, 200, latency, fixture is not None)
+
+        model = payload.get('model', 'gpt-4o')
+        completion_id = f"chatcmpl-mock{uuid.uuid4().hex[:20]}"
+        prompt_tokens = max(1, len(haystack) // 3)
+        completion_tokens = max(1, len(content) // 3)
+
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens,
+                 "prompt_tokens_details": {"cached_tokens": 0}}
+
+        if payload.get('stream'):
+            include_usage = bool((payload.get('stream_options') or {}).get('include_usage'))
+            self._stream_chat(completion_id, model, content, usage if include_usage else None)
+            return
+
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop", "logprobs": None}],
+            "usage": usage,
+        })
+
+    def _stream_chat(self, completion_id: str, model: str, content: str,
+                     usage: Optional[Dict[str, Any]] = None):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> bytes:
+            return ("data: " + json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }, ensure_ascii=False) + "\n\n").encode('utf-8')
+
+        try:
+            self.wfile.write(chunk({"role": "assistant", "content": ""}))
+            step = self.settings.stream_chunk_chars
+            for i in range(0, len(content), step):
+                time.sleep(self.settings.stream_chunk_delay_ms / 1000.0)
+                self.wfile.write(chunk({"content": content[i:i + step]}))
+                self.wfile.flush()
+            self.wfile.write(chunk({}, "stop"))
+            if usage:
+                self.wfile.write(("data: " + json.dumps({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                    "model": model, "choices": [], "usage": usage
+                }) + "\n\n").encode('utf-8'))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("🔌 Client closed the stream early")
+
+    def _record_chat(self, payload: Dict[str, Any], request_hash: str) -> Optional[Dict[str, Any]]:
+        import requests
+
+        upstream_payload = {**payload, "stream": False}
+        response = requests.post(f"{self.upstream}/chat/completions", json=upstream_payload, timeout=120,
+                                 headers={"Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}"})
+        if response.status_code != 200:
+            logger.warning(f"⚠️ Upstream returned {response.status_code}, not recording")
+            return None
+        entry = {"endpoint": CHAT_ENDPOINT, "request_hash": request_hash, "model": payload.get('model'),
+                 "content": response.json()['choices'][0]['message']['content'],
+                 "recorded_at": time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.fixtures.add(entry)
+        logger.info(f"📼 Recorded chat fixture {request_hash[:12]}")
+        return entry
+
+    # ---------- audio ----------
+
+    def _handle_transcription(self):
+        raw_body = self._read_body()
+        fields, audio_bytes, file_name = parse_multipart(raw_body, self.headers.get('Content-Type', ''))
+
+        latency = self.settings.audio_latency.sample_seconds()
+        time.sleep(latency)
+        if self._inject_failure(AUDIO_ENDPOINT, latency):
+            return
+
+        request_hash = audio_request_hash(audio_bytes, fields)
+        fixture = self.fixtures.find(AUDIO_ENDPOINT, request_hash, file_name)
+        if fixture is None and self.record and self.upstream:
+            fixture = self._record_transcription(fields, audio_bytes, file_name, request_hash)
+
+        result = builtin_transcription(audio_bytes)
+        if fixture:
+            result.update({k: v for k, v in fixture.items() if k in ('text', 'segments', 'duration')})
+        self.stats.record(AUDIO_ENDPOINT, 200, latency, fixture is not None)
+
+        response_format = fields.get('response_format', 'json')
+        if response_format == 'text':
+            data = result['text'].encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif response_format == 'verbose_json':
+            self._send_json(200, {"task": "transcribe", "language": fields.get('language', 'he'), **result})
+        else:
+            self._send_json(200, {"text": result['text']})
+
+    def _record_transcription(self, fields: Dict[str, str], audio_bytes: bytes, file_name: str,
+                              request_hash: str) -> Optional[Dict[str, Any]]:
+        import requests
+
+        data = {**fields, "response_format": "verbose_json"}
+        response = requests.post(f"{self.upstream}/audio/transcriptions", data=data, timeout=300,
+                                 files={"file": (file_name or "audio.mp3", audio_bytes)},
+                                 headers={"Authorization": f"Bearer {os.environ.get('OPENAI_API_KEY', '')}"})
+        if response.status_code != 200:
+            logger.warning(f"⚠️ Upstream returned {response.status_code}, not recording")
+            return None
+        body = response.json()
+        entry = {"endpoint": AUDIO_ENDPOINT, "request_hash": request_hash, "match": None,
+                 "text": body.get('text', ''), "segments": body.get('segments', []),
+                 "duration": body.get('duration'), "recorded_at": time.strftime('%Y-%m-%dT%H:%M:%S')}
+        self.fixtures.add(entry)
+        logger.info(f"📼 Recorded transcription fixture {request_hash[:12]} ({file_name})")
+        return entry
+
+
+def create_server(host: str = '127.0.0.1', port: int = 8099, settings: Optional[MockSettings] = None,
+                  fixtures_path: Optional[str] = None, upstream: Optional[str] = None,
+                  record: bool = False) -> ThreadingHTTPServer:
+    """Build (but do not start) a mock server; handy for in-process tests"""
+    handler = type('ConfiguredMockOpenAIHandler', (MockOpenAIHandler,), {
+        'settings': settings or MockSettings(),
+        'fixtures': FixtureStore(fixtures_path),
+        'stats': MockStats(),
+        'upstream': upstream.rstrip('/') if upstream else None,
+        'record': record,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenAI-compatible mock server for load testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--fixtures', help='Fixture JSON file (read, and written in --record mode)')
+    parser.add_argument('--chat-latency', default='fixed:0',
+                        help='fixed:MS | uniform:MIN,MAX | normal:MEAN,STD | lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--audio-latency', default='fixed:0', help='Same syntax as --chat-latency')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--rate-500', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--stream-chunk-chars', type=int, default=8)
+    parser.add_argument('--stream-chunk-delay-ms', type=float, default=0.0,
+                        help='Delay between streamed chunks (slow streaming)')
+    parser.add_argument('--seed', type=int, help='Seed for reproducible latency and failure injection')
+    parser.add_argument('--record', action='store_true',
+                        help='Forward fixture misses to --upstream and save them to --fixtures')
+    parser.add_argument('--upstream', default='https://api.openai.com/v1')
+
+    args = parser.parse_args()
+    if args.record and not args.fixtures:
+        parser.error('--record needs --fixtures')
+
+    settings = MockSettings(args.chat_latency, args.audio_latency, args.rate_429, args.rate_500,
+                            args.stream_chunk_chars, args.stream_chunk_delay_ms, args.seed)
+    server = create_server(args.host, args.port, settings, args.fixtures,
+                           args.upstream if args.record else None, args.record)
+
+    logger.info(f"🧪 Mock OpenAI server on http://{args.host}:{args.port}/v1 ({settings.to_dict()})")
+    logger.info(f"💡 Point the app at it with OPENAI_MOCK_SERVER_URL=http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("🛑 Mock server stopped")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
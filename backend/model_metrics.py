@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Model Call Metrics
+Latency, token, cost, cache and retry accounting for every OpenAI call.
+Calls are aggregated into in-memory histograms (served by /api/metrics) and
+attributed to the current job, whose summary is appended to the
+conversation folder when the job ends.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000]
+
+# Upper bounds of the token histogram buckets
+TOKEN_BUCKETS = [16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384]
+
+# USD per 1M tokens: (input, cached input, output)
+CHAT_PRICES_PER_MTOK = {
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-3.5-turbo': (0.50, 0.50, 1.50),
+}
+
+# USD per audio minute
+AUDIO_PRICES_PER_MINUTE = {
+    'whisper-1': 0.006,
+}
+
+JOB_SUMMARY_FILENAME = 'model_metrics.jsonl'
+
+
+class Histogram:
+    """Cumulative-bucket histogram with approximate quantiles"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets + ['+Inf'], self.counts)},
+        }
+
+
+class SeriesStats:
+    """All aggregates for one (endpoint, stage, model) series"""
+
+    def __init__(self):
+        self.wall_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.queue_wait_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.tokens_in = Histogram(TOKEN_BUCKETS)
+        self.tokens_out = Histogram(TOKEN_BUCKETS)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cached_prompt_tokens = 0
+        self.cost_usd = 0.0
+
+    def add(self, record: Dict[str, Any]):
+        if record['cache'] == 'hit':
+            self.cache_hits += 1
+            return
+        if record['cache'] == 'miss':
+            self.cache_misses += 1
+        self.calls += 1
+        self.errors += int(record['status'] != 'ok')
+        self.retries += record['retries']
+        self.wall_ms.observe(record['wall_ms'])
+        self.queue_wait_ms.observe(record['queue_wait_ms'])
+        if record['prompt_tokens'] is not None:
+            self.tokens_in.observe(record['prompt_tokens'])
+        if record['completion_tokens'] is not None:
+            self.tokens_out.observe(record['completion_tokens'])
+        self.cached_prompt_tokens += record.get('cached_tokens') or 0
+        self.cost_usd += record['cost_usd'] or 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "cost_usd": round(self.cost_usd, 6),
+            "wall_ms": self.wall_ms.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+            "tokens_in": self.tokens_in.snapshot(),
+            "tokens_out": self.tokens_out.snapshot(),
+        }
+
+
+class ModelJob:
+    """Calls made while handling one request or background job"""
+
+    def __init__(self, name: str, conversation_dir: Optional[str] = None, queue_wait_ms: float = 0.0):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.conversation_dir = conversation_dir
+        self.queue_wait_ms = queue_wait_ms
+        self.started_at = time.time()
+        self.records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict[str, Any]):
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            records = list(self.records)
+        stages: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            stage = stages.setdefault(f"{record['endpoint']}:{record['stage']}", {
+                "calls": 0, "cache_hits": 0, "wall_ms": 0.0, "prompt_tokens": 0,
+                "completion_tokens": 0, "cost_usd": 0.0, "retries": 0, "errors": 0
+            })
+            if record['cache'] == 'hit':
+                stage["cache_hits"] += 1
+                continue
+            stage["calls"] += 1
+            stage["wall_ms"] = round(stage["wall_ms"] + record['wall_ms'], 1)
+            stage["prompt_tokens"] += record['prompt_tokens'] or 0
+            stage["completion_tokens"] += record['completion_tokens'] or 0
+            stage["cost_usd"] = round(stage["cost_usd"] + (record['cost_usd'] or 0.0), 6)
+            stage["retries"] += record['retries']
+            stage["errors"] += int(record['status'] != 'ok')
+        return {
+            "job_id": self.id,
+            "job": self.name,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "duration_ms": round((time.time() - self.started_at) * 1000, 1),
+            "queue_wait_ms": round(self.queue_wait_ms, 1),
+            "model_calls": sum(s["calls"] for s in stages.values()),
+            "model_wall_ms": round(sum(s["wall_ms"] for s in stages.values()), 1),
+            "cost_usd": round(sum(s["cost_usd"] for s in stages.values()), 6),
+            "stages": stages,
+            "calls": records,
+        }
+
+
+_series: Dict[tuple, SeriesStats] = {}
+_series_lock = threading.Lock()
+_current_job: contextvars.ContextVar = contextvars.ContextVar('model_job', default=None)
+_started_at = time.time()
+
+
+def estimate_cost(model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int],
+                  cached_tokens: int = 0, audio_seconds: Optional[float] = None) -> Optional[float]:
+    """USD cost of one call, None for models without a known price"""
+    if model in AUDIO_PRICES_PER_MINUTE:
+        if audio_seconds is None:
+            return None
+        return AUDIO_PRICES_PER_MINUTE[model] * audio_seconds / 60.0
+    for prefix, (input_price, cached_price, output_price) in CHAT_PRICES_PER_MTOK.items():
+        if model == prefix or model.startswith(prefix + '-'):
+            uncached = max(0, (prompt_tokens or 0) - cached_tokens)
+            return (uncached * input_price + cached_tokens * cached_price
+                    + (completion_tokens or 0) * output_price) / 1_000_000
+    return None
+
+
+def _usage_from_response(response: Any) -> Dict[str, Optional[int]]:
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return {"prompt_tokens": None, "completion_tokens": None, "cached_tokens": 0}
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return {
+        "prompt_tokens": getattr(usage, 'prompt_tokens', None),
+        "completion_tokens": getattr(usage, 'completion_tokens', None),
+        "cached_tokens": (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0,
+    }
+
+
+def _audio_seconds(response: Any, audio_file: Any) -> Optional[float]:
+    """Duration from a verbose_json response, else estimated from the uploaded file size"""
+    duration = getattr(response, 'duration', None)
+    if duration:
+        return float(duration)
+    name = getattr(audio_file, 'name', None)
+    if isinstance(name, str) and os.path.exists(name):
+        size = os.path.getsize(name)
+        # 16 kHz mono PCM for preprocessed WAV, ~128 kbps for compressed uploads
+        return size / 32000.0 if name.lower().endswith('.wav') else size / 16000.0
+    return None
+
+
+def record_call(endpoint: str, stage: str, model: str, wall_ms: float, queue_wait_ms: float = 0.0,
+                retries: int = 0, status: str = 'ok', response: Any = None, request_kwargs: Optional[Dict] = None,
+                cache: Optional[str] = None):
+    """Record one model call (or one cache lookup when cache='hit')"""
+    usage = _usage_from_response(response) if response is not None else {
+        "prompt_tokens": None, "completion_tokens": None, "cached_tokens": 0}
+    audio_seconds = None
+    if endpoint == 'audio.transcriptions' and status == 'ok':
+        audio_seconds = _audio_seconds(response, (request_kwargs or {}).get('file'))
+
+    record = {
+        "ts": round(time.time(), 3),
+        "endpoint": endpoint,
+        "stage": stage,
+        "model": model,
+        "status": status,
+        "cache": cache,
+        "wall_ms": round(wall_ms, 1),
+        "queue_wait_ms": round(queue_wait_ms, 1),
+        "retries": retries,
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "cached_tokens": usage["cached_tokens"],
+        "audio_seconds": round(audio_seconds, 2) if audio_seconds is not None else None,
+        "cost_usd": None if cache == 'hit' else estimate_cost(
+            model, usage["prompt_tokens"], usage["completion_tokens"], usage["cached_tokens"], audio_seconds),
+    }
+
+    with _series_lock:
+        series = _series.setdefault((endpoint, stage, model), SeriesStats())
+        series.add(record)
+
+    job = _current_job.get()
+    if job is not None:
+        job.add(record)
+
+    if cache != 'hit':
+        logger.info(f"📈 {endpoint}[{stage}] {model} {status} {record['wall_ms']:.0f}ms "
+                    f"in={record['prompt_tokens']} out={record['completion_tokens']} retries={retries}")
+    return record
+
+
+def record_cache_hit(endpoint: str, stage: str, model: str):
+    """A model call that was answered from a local cache"""
+    return record_call(endpoint, stage, model, wall_ms=0.0, cache='hit')
+
+
+def current_job() -> Optional[ModelJob]:
+    return _current_job.get()
+
+
+@contextmanager
+def model_job(name: str, conversation_dir: Optional[str] = None, enqueued_at: Optional[float] = None):
+    """
+    Attribute model calls in this block to a job. On exit a one-line summary
+    is appended to <conversation_dir>/model_metrics.jsonl if any call was made.
+    Nested jobs fold into the outer one.
+    """
+    if _current_job.get() is not None:
+        yield _current_job.get()
+        return
+
+    queue_wait_ms = (time.time() - enqueued_at) * 1000 if enqueued_at else 0.0
+    job = ModelJob(name, conversation_dir, queue_wait_ms)
+    token = _current_job.set(job)
+    try:
+        yield job
+    finally:
+        _current_job.reset(token)
+        if job.records:
+            write_job_summary(job)
+
+
+def write_job_summary(job: ModelJob):
+    summary = job.summary()
+    logger.info(f"🧾 Job {job.name} [{job.id}]: {summary['model_calls']} model calls, "
+                f"{summary['model_wall_ms']:.0f}ms model time, ${summary['cost_usd']:.4f}")
+    if not job.conversation_dir or not os.path.isdir(job.conversation_dir):
+        return
+    try:
+        with open(os.path.join(job.conversation_dir, JOB_SUMMARY_FILENAME), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(summary, ensure_ascii=False) + '\n')
+    except OSError as e:
+        logger.warning(f"⚠️ Could not write job metrics for {job.name}: {e}")
+
+
+def get_metrics_snapshot() -> Dict[str, Any]:
+    """All series, plus per-endpoint and per-stage totals"""
+    with _series_lock:
+        series = {f"{endpoint}|{stage}|{model}": stats.snapshot()
+                  for (endpoint, stage, model), stats in sorted(_series.items())}
+
+    totals: Dict[str, Dict[str, Any]] = {}
+    for key, stats in series.items():
+        endpoint = key.split('|')[0]
+        total = totals.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0, "cache_hits": 0,
+                                             "cost_usd": 0.0, "wall_ms_sum": 0.0})
+        total["calls"] += stats["calls"]
+        total["errors"] += stats["errors"]
+        total["retries"] += stats["retries"]
+        total["cache_hits"] += stats["cache_hits"]
+        total["cost_usd"] = round(total["cost_usd"] + stats["cost_usd"], 6)
+        total["wall_ms_sum"] = round(total["wall_ms_sum"] + stats["wall_ms"]["sum"], 1)
+
+    return {
+        "uptime_seconds": round(time.time() - _started_at, 1),
+        "totals": totals,
+        "series": series,
+    }
+
+
+def format_prometheus() -> str:
+    """Prometheus text exposition of the latency histograms and counters"""
+    lines = [
+        "# TYPE model_call_duration_ms histogram",
+        "# TYPE model_call_tokens_total counter",
+        "# TYPE model_call_cost_usd_total counter",
+        "# TYPE model_call_retries_total counter",
+        "# TYPE model_call_cache_hits_total counter",
+    ]
+    with _series_lock:
+        items = sorted(_series.items())
+        for (endpoint, stage, model), stats in items:
+            labels = f'endpoint="{endpoint}",stage="{stage}",model="{model}"'
+            cumulative = 0
+            for bound, count in zip(stats.wall_ms.buckets + ['+Inf'], stats.wall_ms.counts):
+                cumulative += count
+                lines.append(f'model_call_duration_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'model_call_duration_ms_sum{{{labels}}} {stats.wall_ms.total:.3f}')
+            lines.append(f'model_call_duration_ms_count{{{labels}}} {stats.wall_ms.count}')
+            lines.append(f'model_call_tokens_total{{{labels},direction="in"}} {stats.tokens_in.total:.0f}')
+            lines.append(f'model_call_tokens_total{{{labels},direction="out"}} {stats.tokens_out.total:.0f}')
+            lines.append(f'model_call_cost_usd_total{{{labels}}} {stats.cost_usd:.6f}')
+            lines.append(f'model_call_retries_total{{{labels}}} {stats.retries}')
+            lines.append(f'model_call_cache_hits_total{{{labels}}} {stats.cache_hits}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    with _series_lock:
+        _series.clear()
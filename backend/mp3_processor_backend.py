@@ -2,103 +2,215 @@
 """
 MP3 Processor Backend
 Handles MP3 segmentation, silence detection, and speaker diarization.
+Voice activity, cut points and silent-segment labels all come from one set
+of per-millisecond energy sums over the decoded PCM sidecar: fixed-length
+cut points are moved into the nearest detected silence and each segment's
+level is read back from the same sums. Run with --benchmark to log the
+time spent in each stage.
 """
 
 import argparse
 import json
 import os
 from pathlib import Path
-from pydub import AudioSegment
-from pydub.silence import split_on_silence
 import logging
-import shutil
 import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backend.pcm_cache import load_pcm, pcm_to_audio_segment, PCM_SAMPLE_RATE
+from backend.audio_cutter import cut_segments
+from backend.silence_detection import audio_length_ms, millisecond_energy, detect_silence
+from backend.diarization import diarize_ranges
+from backend.loudness_envelope import envelopes_for_ranges, encode_envelope, store_segment_envelopes
+from backend.json_files import atomic_write_json, update_json
+from backend.backup_store import backup_store
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def process_mp3(source_file: str, output_dir: str, config: dict):
+# Shortest pause that counts as silence for voice activity
+VAD_MIN_SILENCE_MS = 100
+
+
+def snap_cut_points(duration_ms: int, segment_ms: int, silences: List[List[int]], snap_window_ms: int) -> List[List[int]]:
+    """
+    Back-to-back ranges of about segment_ms. A cut moves into the detected
+    silence nearest its nominal position when one overlaps the snap window,
+    as close to the middle of that silence as the window allows; segments
+    are never shorter than half segment_ms.
+    """
+    silence_starts = np.array([start for start, _ in silences], dtype=np.int64)
+    silence_ends = np.array([end for _, end in silences], dtype=np.int64)
+    min_length = max(1, segment_ms // 2)
+    ranges = []
+    start = 0
+    while start < duration_ms:
+        target = start + segment_ms
+        if target >= duration_ms:
+            ranges.append([start, duration_ms])
+            break
+        cut = target
+        window_start, window_end = target - snap_window_ms, target + snap_window_ms
+        first = np.searchsorted(silence_ends, window_start, side='right')
+        last = np.searchsorted(silence_starts, window_end, side='left')
+        for silence_start, silence_end in zip(silence_starts[first:last], silence_ends[first:last]):
+            low, high = max(silence_start, window_start), min(silence_end, window_end)
+            point = int(min(max((silence_start + silence_end) // 2, low), high))
+            if start + min_length <= point < duration_ms and (cut == target or abs(point - target) < abs(cut - target)):
+                cut = point
+        ranges.append([start, cut])
+        start = cut
+    # A short tail joins the previous segment
+    if len(ranges) > 1 and ranges[-1][1] - ranges[-1][0] < min_length:
+        tail = ranges.pop()
+        ranges[-1][1] = tail[1]
+    return ranges
+
+
+def plan_segments(pcm: np.ndarray, segment_ms: int, silence_thresh: float, snap_window_ms: int,
+                  sample_rate: int = PCM_SAMPLE_RATE, silent_segment_thresh: Optional[float] = None) -> Dict:
+    """
+    Voice activity, cut points and per-segment levels from one energy pass.
+    Returns the silences, the segment ranges and metadata for each segment.
+    A segment is silent when it is digital silence, or, with
+    silent_segment_thresh, when its level is at or below that dBFS
+    (silence_thresh only places the cuts: quiet speech stays speech).
+    """
+    duration_ms = audio_length_ms(len(pcm), sample_rate)
+    energy = millisecond_energy(pcm, sample_rate)
+    silences = detect_silence(pcm, sample_rate, min_silence_len=VAD_MIN_SILENCE_MS,
+                              silence_thresh=silence_thresh, energy=energy)
+    segment_ranges = snap_cut_points(duration_ms, segment_ms, silences, snap_window_ms)
+
+    # Level of every segment from the same prefix sums (pydub's integer RMS, as segment.dBFS)
+    prefix, boundaries = energy
+    bounds = np.array(segment_ranges, dtype=np.int64).reshape(-1, 2)
+    sums = prefix[bounds[:, 1]] - prefix[bounds[:, 0]]
+    n_samples = boundaries[bounds[:, 1]] - boundaries[bounds[:, 0]]
+    rms = np.floor(np.sqrt(np.divide(sums.astype(np.float64), n_samples,
+                                     out=np.zeros(len(bounds)), where=n_samples > 0)))
+
+    # Milliseconds of each segment covered by detected silence
+    silent = np.zeros(duration_ms, dtype=bool)
+    for start, end in silences:
+        silent[start:end] = True
+    silent_prefix = np.concatenate(([0], np.cumsum(silent)))
+
+    segments = []
+    for (start, end), level in zip(segment_ranges, rms):
+        level_dbfs = 20 * np.log10(level / 32768.0) if level > 0 else None
+        silent_part = (silent_prefix[end] - silent_prefix[start]) / max(1, end - start)
+        segments.append({
+            "start_ms": start,
+            "end_ms": end,
+            "rms_dbfs": None if level_dbfs is None else round(float(level_dbfs), 2),
+            "voice_ratio": round(1.0 - float(silent_part), 3),
+            "is_silent": bool(level_dbfs is None or
+                              (silent_segment_thresh is not None and level_dbfs <= silent_segment_thresh)),
+        })
+    return {"silences": silences, "ranges": segment_ranges, "segments": segments}
+
+
+def process_mp3(source_file: str, output_dir: str, config: dict, timings: Optional[Dict[str, float]] = None):
     """
     Process an MP3 file into segments and create emotion JSON data.
+    Stage durations in seconds are added to `timings` when it is given.
     """
     logger.info(f"🔄 Processing {source_file}...")
+    timings = {} if timings is None else timings
     
     try:
-        # Load audio file
-        audio = AudioSegment.from_mp3(source_file)
-        logger.info(f"📊 Audio loaded: {len(audio) / 1000:.2f}s, {audio.frame_rate}Hz")
+        # Load the decoded 16kHz mono sidecar (decoded once per file); segments are cut from the source itself
+        stage_start = time.perf_counter()
+        pcm = load_pcm(source_file)
+        duration_ms = audio_length_ms(len(pcm), PCM_SAMPLE_RATE)
+        timings["decode"] = time.perf_counter() - stage_start
+        logger.info(f"📊 Audio loaded: {duration_ms / 1000:.2f}s")
         
         # Get processing settings from config
         segment_ms = config.get('segment_duration_ms', 1000)
         silence_thresh = config.get('silence_threshold_db', -40)
+        snap_window_ms = config.get('snap_window_ms', segment_ms // 4)
+        # Optional level below which a whole segment counts as silent (default: only digital silence)
+        silent_segment_thresh = config.get('silent_segment_threshold_db')
         
-        # Detect voice activity
-        voice_segments = split_on_silence(
-            audio,
-            min_silence_len=100,
-            silence_thresh=silence_thresh,
-            keep_silence=True
-        )
+        # Voice activity, cut points and silence labels in one pass over the energy
+        stage_start = time.perf_counter()
+        plan = plan_segments(pcm, segment_ms, silence_thresh, snap_window_ms,
+                             silent_segment_thresh=silent_segment_thresh)
+        segment_ranges = plan["ranges"]
+        timings["segmentation"] = time.perf_counter() - stage_start
         
-        logger.info(f"🎤 Found {len(voice_segments)} voice segments")
+        voiced = [segment for segment in plan["segments"] if not segment["is_silent"]]
+        logger.info(f"🎤 Found {len(plan['silences'])} pauses, {len(voiced)}/{len(segment_ranges)} segments with voice")
         
         # Create directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
-        # Split audio into segments
-        segments = []
-        for start_ms in range(0, len(audio), segment_ms):
-            end_ms = min(start_ms + segment_ms, len(audio))
-            segment = audio[start_ms:end_ms]
-            segments.append(segment)
-        
-        logger.info(f"✂️ Created {len(segments)} segments of {segment_ms}ms each")
+        logger.info(f"✂️ Created {len(segment_ranges)} segments of ~{segment_ms}ms, cut in pauses where possible")
         
         # Process segments and create emotion data
         emotion_data = {}
-        segment_counter = 1
-        
-        # CONSISTENT SPEAKER ASSIGNMENT: Ensure דובר 1 is always left (speaker 0) and דובר 2 is always right (speaker 1)
-        # Use a deterministic pattern that ensures balanced representation
-        speaker_pattern = []
-        for i in range(len(segments)):
-            # Create a balanced pattern that alternates speakers but ensures consistent positioning
-            # דובר 1 (speaker 0) = left side, דובר 2 (speaker 1) = right side
-            if i % 4 in [0, 1]:  # First half of 4-segment cycle goes to speaker 0 (דובר 1 - left)
-                speaker_pattern.append(0)
-            else:  # Second half goes to speaker 1 (דובר 2 - right)
-                speaker_pattern.append(1)
-        
-        for i, segment in enumerate(segments):
-            is_silent = segment.dBFS == -float('inf')
-            
-            # Export the segment
-            segment_filename = f"{segment_counter:03d}.mp3"
-            segment_path = os.path.join(output_dir, segment_filename)
-            segment.export(segment_path, format="mp3")
+        
+        # CONSISTENT SPEAKER ASSIGNMENT: דובר 1 (speaker 0, left) is the first voice heard,
+        # דובר 2 (speaker 1, right) the other one, from local voice-embedding diarization
+        stage_start = time.perf_counter()
+        segment_speakers = diarize_ranges(pcm, segment_ranges)
+        last_speaker = 0
+        timings["diarization"] = time.perf_counter() - stage_start
+        
+        # Export every segment in one ffmpeg pass (stream copy for MP3 sources)
+        stage_start = time.perf_counter()
+        segment_filenames = [f"{i + 1:03d}.mp3" for i in range(len(segment_ranges))]
+        cut_segments(source_file, segment_ranges,
+                     [os.path.join(output_dir, segment_filename) for segment_filename in segment_filenames])
+        timings["cut"] = time.perf_counter() - stage_start
+        
+        # Playback loudness envelopes from the PCM already in memory
+        stage_start = time.perf_counter()
+        segment_envelopes = envelopes_for_ranges(pcm, segment_ranges)
+        store_segment_envelopes(output_dir, segment_filenames, segment_envelopes)
+        timings["envelopes"] = time.perf_counter() - stage_start
+        
+        stage_start = time.perf_counter()
+        for i, (segment_filename, (start_ms, end_ms)) in enumerate(zip(segment_filenames, segment_ranges)):
+            segment_info = plan["segments"][i]
+            is_silent = segment_info["is_silent"]
             
             # --- CONSISTENT SPEAKER ASSIGNMENT ---
-            # Use the deterministic pattern to ensure consistent speaker positioning
-            speaker_id = speaker_pattern[i] if not is_silent else -1  # -1 for silence
+            # Segments with too little speech to embed keep the previous speaker
+            if is_silent:
+                speaker_id = -1  # -1 for silence
+            else:
+                speaker_id = segment_speakers[i] if segment_speakers[i] is not None else last_speaker
+                last_speaker = speaker_id
             
             emotion_entry = create_emotion_entry(
                 speaker=speaker_id,
                 is_silent=is_silent,
-                duration_ms=len(segment)
+                duration_ms=end_ms - start_ms
             )
+            emotion_entry.update({
+                "start_ms": start_ms,
+                "end_ms": end_ms,
+                "rms_dbfs": segment_info["rms_dbfs"],
+                "voice_ratio": segment_info["voice_ratio"],
+                "loudness_envelope": encode_envelope(segment_envelopes[i])
+            })
             
             emotion_data[segment_filename] = emotion_entry
             
-            logger.info(f"   📄 Exported {segment_filename} | Duration: {len(segment) / 1000:.2f}s | Silent: {is_silent} | Speaker: {speaker_id}")
-            segment_counter += 1
+            logger.info(f"   📄 Exported {segment_filename} | Duration: {(end_ms - start_ms) / 1000:.2f}s | Silent: {is_silent} | Speaker: {speaker_id}")
             
         # Save the emotion JSON file
         json_filename = f"emotions{Path(output_dir).name.replace('convo', '')}.json"
         json_path = os.path.join(output_dir, json_filename)
         
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(emotion_data, f, indent=2, ensure_ascii=False)
+        atomic_write_json(json_path, emotion_data)
+        timings["emotion_json"] = time.perf_counter() - stage_start
             
         logger.info(f"✅ Emotion JSON file created: {json_path}")
         logger.info(f"🎭 Speaker assignment: דובר 1 (speaker 0) = LEFT side, דובר 2 (speaker 1) = RIGHT side")
@@ -168,41 +280,37 @@ def ensure_consistent_speaker_positioning(emotion_data_file: str) -> bool:
             logger.warning(f"File not found: {emotion_data_file}")
             return False
             
-        # Load existing emotion data
-        with open(emotion_data_file, 'r', encoding='utf-8') as f:
-            emotion_data = json.load(f)
-        
-        # Update speaker positioning
-        updated_count = 0
-        for filename, data in emotion_data.items():
-            if isinstance(data, dict) and 'speaker' in data:
-                speaker = data['speaker']
-                
-                # Ensure consistent home region assignment
-                correct_home_region = None
-                if speaker == 0:
-                    correct_home_region = "center-left"    # דובר 1 - LEFT SIDE
-                elif speaker == 1:
-                    correct_home_region = "center-right"   # דובר 2 - RIGHT SIDE
-                elif speaker == -1:
-                    correct_home_region = "center"         # Silence
-                
-                if correct_home_region and data.get('blobHomeRegion') != correct_home_region:
-                    data['blobHomeRegion'] = correct_home_region
-                    updated_count += 1
-                    logger.info(f"Updated {filename}: speaker {speaker} -> {correct_home_region}")
-        
-        # Save updated data if changes were made
-        if updated_count > 0:
-            # Create backup
-            backup_file = f"{emotion_data_file}.backup_positioning_{int(time.time())}"
-            shutil.copy2(emotion_data_file, backup_file)
-            logger.info(f"📦 Created backup: {backup_file}")
-            
-            # Save updated data
-            with open(emotion_data_file, 'w', encoding='utf-8') as f:
-                json.dump(emotion_data, f, indent=2, ensure_ascii=False)
+        def enforce(emotion_data):
+            # Update speaker positioning
+            updated_count = 0
+            for filename, data in emotion_data.items():
+                if isinstance(data, dict) and 'speaker' in data:
+                    speaker = data['speaker']
+                    
+                    # Ensure consistent home region assignment
+                    correct_home_region = None
+                    if speaker == 0:
+                        correct_home_region = "center-left"    # דובר 1 - LEFT SIDE
+                    elif speaker == 1:
+                        correct_home_region = "center-right"   # דובר 2 - RIGHT SIDE
+                    elif speaker == -1:
+                        correct_home_region = "center"         # Silence
+                    
+                    if correct_home_region and data.get('blobHomeRegion') != correct_home_region:
+                        data['blobHomeRegion'] = correct_home_region
+                        updated_count += 1
+                        logger.info(f"Updated {filename}: speaker {speaker} -> {correct_home_region}")
             
+            if updated_count > 0:
+                # Back up the current version (unchanged content is stored once)
+                backup_file = backup_store.add(emotion_data_file)
+                logger.info(f"📦 Created backup: {backup_file or 'unchanged since last backup'}")
+            return updated_count
+        
+        # Load, update and (if changes were made) atomically save the emotion data
+        updated_count = update_json(emotion_data_file, enforce)
+        
+        if updated_count > 0:
             logger.info(f"✅ Updated {updated_count} segments in {emotion_data_file}")
             logger.info(f"🎭 Positioning enforced: דובר 1 (speaker 0) = LEFT, דובר 2 (speaker 1) = RIGHT")
             return True
@@ -214,11 +322,24 @@ def ensure_consistent_speaker_positioning(emotion_data_file: str) -> bool:
         logger.error(f"❌ Error updating speaker positioning: {e}", exc_info=True)
         return False
 
+def legacy_vad_seconds(pcm: np.ndarray, segment_ms: int, silence_thresh: float) -> float:
+    """Time of the pass the fused segmentation replaced: pydub VAD, then dBFS per fixed slice"""
+    from pydub.silence import split_on_silence
+    
+    started = time.perf_counter()
+    audio = pcm_to_audio_segment(pcm)
+    split_on_silence(audio, min_silence_len=VAD_MIN_SILENCE_MS, silence_thresh=silence_thresh, keep_silence=True)
+    for start_ms in range(0, len(audio), segment_ms):
+        audio[start_ms:start_ms + segment_ms].dBFS
+    return time.perf_counter() - started
+
 def main():
     parser = argparse.ArgumentParser(description="Process and segment MP3 files for conversation analysis.")
     parser.add_argument("--source", "-s", required=True, help="Path to the source MP3 file.")
     parser.add_argument("--output-dir", "-o", required=True, help="Directory to save segmented MP3s and JSON.")
     parser.add_argument("--config", "-c", help="Path to a JSON config file with processing parameters.")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Log the time of each stage, and of the previous pydub VAD + per-segment dBFS pass.")
     
     args = parser.parse_args()
     
@@ -239,12 +360,22 @@ def main():
         except (FileNotFoundError, json.JSONDecodeError):
             logger.warning(f"⚠️  Config file not found or invalid. Using default settings.")
             
+    timings = {}
     success = process_mp3(
         source_file=args.source,
         output_dir=args.output_dir,
-        config=config
+        config=config,
+        timings=timings
     )
     
+    if args.benchmark and success:
+        timings["legacy_vad"] = legacy_vad_seconds(load_pcm(args.source), config.get('segment_duration_ms', 1000),
+                                                   config.get('silence_threshold_db', -40))
+        for stage, seconds in timings.items():
+            logger.info(f"⏱️ {stage:<14} {seconds:8.3f}s")
+        logger.info(f"⏱️ fused segmentation vs pydub VAD + per-segment dBFS: "
+                    f"{timings['segmentation']:.3f}s vs {timings['legacy_vad']:.3f}s")
+    
     if success:
         logger.info("🎉 Processing complete!")
     else:
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+OpenAI Client Wrapper
+Jittered exponential retries and a circuit breaker around every
+chat completion and audio transcription call made by the server.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+from backend.model_metrics import record_call
+
+logger = logging.getLogger(__name__)
+
+# Tunables (environment overrides keep deployment scripts unchanged)
+OPENAI_TIMEOUT_SECONDS = float(os.environ.get('OPENAI_TIMEOUT_SECONDS', 30))
+OPENAI_MAX_ATTEMPTS = int(os.environ.get('OPENAI_MAX_ATTEMPTS', 3))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.environ.get('OPENAI_BACKOFF_BASE_SECONDS', 0.5))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.environ.get('OPENAI_BACKOFF_MAX_SECONDS', 8.0))
+OPENAI_BREAKER_THRESHOLD = int(os.environ.get('OPENAI_BREAKER_THRESHOLD', 5))
+OPENAI_BREAKER_RESET_SECONDS = float(os.environ.get('OPENAI_BREAKER_RESET_SECONDS', 30))
+
+# Route every client to the local stand-in (backend/mock_openai_server.py), e.g. http://127.0.0.1:8099/v1
+OPENAI_MOCK_SERVER_URL = os.environ.get('OPENAI_MOCK_SERVER_URL', '').strip()
+
+# Well-formed placeholder so the usual key checks pass against the mock server
+MOCK_API_KEY = 'sk-mock-' + '0' * 48
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# openai>=1.0 exception classes that carry no status code but are transient
+RETRYABLE_ERROR_NAMES = {'APIConnectionError', 'APITimeoutError', 'RateLimitError', 'InternalServerError'}
+
+
+class CircuitOpenError(Exception):
+    """Raised immediately when the circuit breaker refuses a call"""
+
+    def __init__(self, operation: str, retry_in: float):
+        super().__init__(f"OpenAI circuit open for {operation} (retry in {retry_in:.1f}s)")
+        self.operation = operation
+        self.retry_in = retry_in
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Decide whether an OpenAI error is transient and worth another attempt"""
+    status_code = getattr(error, 'status_code', None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES or isinstance(error, (TimeoutError, ConnectionError))
+
+
+class CircuitBreaker:
+    """
+    Classic closed → open → half-open breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and every
+    call is refused until `recovery_timeout` has passed; then a single probe
+    call is let through and its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = OPENAI_BREAKER_THRESHOLD,
+                 recovery_timeout: float = OPENAI_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.total_short_circuited = 0
+        self._lock = threading.Lock()
+
+    def retry_in(self) -> float:
+        """Seconds until the breaker will allow a probe call"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at))
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.retry_in() <= 0:
+                self.state = self.HALF_OPEN
+                self.probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            self.total_short_circuited += 1
+            return False
+
+    def is_open(self) -> bool:
+        """True while calls would be refused without a probe slot"""
+        with self._lock:
+            return self.state == self.OPEN and self.retry_in() > 0
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"✅ OpenAI circuit '{self.name}' closed again")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"🔌 OpenAI circuit '{self.name}' opened after "
+                                   f"{self.consecutive_failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "retry_in_seconds": round(self.retry_in(), 2),
+                "short_circuited": self.total_short_circuited
+            }
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, max_attempts: int = OPENAI_MAX_ATTEMPTS,
+                 base_delay: float = OPENAI_BACKOFF_BASE_SECONDS,
+                 max_delay: float = OPENAI_BACKOFF_MAX_SECONDS):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int) -> float:
+        """Sleep before retry number `attempt` (0-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+# One breaker per remote operation, shared by every client in this process
+_breakers = {
+    'chat.completions': CircuitBreaker('chat.completions'),
+    'audio.transcriptions': CircuitBreaker('audio.transcriptions'),
+}
+
+
+def get_breaker(operation: str) -> CircuitBreaker:
+    if operation not in _breakers:
+        _breakers[operation] = CircuitBreaker(operation)
+    return _breakers[operation]
+
+
+def is_circuit_open(operation: str = 'chat.completions') -> bool:
+    """Check the breaker without consuming a probe slot"""
+    return get_breaker(operation).is_open()
+
+
+def get_breaker_status() -> Dict[str, Any]:
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
+
+
+def call_with_resilience(func: Callable, operation: str, policy: Optional[RetryPolicy] = None,
+                         *args, **kwargs) -> Any:
+    """
+    Run `func(*args, **kwargs)` behind the breaker for `operation`, retrying
+    transient failures. Raises CircuitOpenError without calling `func` when
+    the breaker is open, and re-raises the last error once retries run out.
+    An optional `_call_info` dict receives the attempt count and the start
+    time of the last attempt.
+    """
+    policy = policy or RetryPolicy()
+    breaker = get_breaker(operation)
+    call_info = kwargs.pop('_call_info', None)
+    if call_info is None:
+        call_info = {}
+
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow_request():
+            raise CircuitOpenError(operation, breaker.retry_in())
+        call_info['attempts'] = attempt + 1
+        call_info['attempt_started'] = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            retryable = is_retryable_error(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                # Bad requests say nothing about provider health
+                breaker.record_success()
+            if not retryable or attempt == policy.max_attempts - 1:
+                raise
+            delay = policy.delay(attempt)
+            logger.warning(f"🔁 {operation} attempt {attempt + 1}/{policy.max_attempts} failed "
+                           f"({type(e).__name__}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+class _MeteredStream:
+    """
+    Wraps a `stream=True` response and records the call once the stream ends,
+    so wall time covers the whole completion. Pass
+    stream_options={"include_usage": True} to have token usage recorded too.
+    """
+
+    def __init__(self, stream, on_finish: Callable):
+        self._stream = stream
+        self._on_finish = on_finish
+        self._finished = False
+
+    def _finish(self, status: str, usage_chunk: Any = None):
+        if not self._finished:
+            self._finished = True
+            self._on_finish(status, usage_chunk)
+
+    def __iter__(self):
+        usage_chunk = None
+        try:
+            for chunk in self._stream:
+                if getattr(chunk, 'usage', None) is not None:
+                    usage_chunk = chunk
+                yield chunk
+        except GeneratorExit:
+            self._finish('client_closed', usage_chunk)
+            raise
+        except Exception as e:
+            self._finish(type(e).__name__, usage_chunk)
+            raise
+        self._finish('ok', usage_chunk)
+
+    def close(self):
+        self._finish('client_closed')
+        close = getattr(self._stream, 'close', None)
+        if close:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _ResilientEndpoint:
+    """
+    Proxy exposing `create` with retries + breaker + metrics, everything else
+    passed through. `metrics_stage` and `metrics_cache` keyword arguments label
+    the call in backend.model_metrics and are not sent to the API.
+    """
+
+    def __init__(self, endpoint, operation: str, policy: RetryPolicy):
+        self._endpoint = endpoint
+        self._operation = operation
+        self._policy = policy
+
+    def create(self, *args, **kwargs):
+        stage = kwargs.pop('metrics_stage', 'default')
+        cache = kwargs.pop('metrics_cache', None)
+        call_info = {}
+        started = time.monotonic()
+
+        def record(status: str, response: Any = None):
+            finished = time.monotonic()
+            attempt_started = call_info.get('attempt_started', started)
+            record_call(
+                self._operation, stage, kwargs.get('model', 'unknown'),
+                wall_ms=(finished - attempt_started) * 1000,
+                queue_wait_ms=(attempt_started - started) * 1000,
+                retries=max(0, call_info.get('attempts', 1) - 1),
+                status=status, response=response, request_kwargs=kwargs, cache=cache
+            )
+
+        try:
+            response = call_with_resilience(self._endpoint.create, self._operation, self._policy,
+                                            *args, _call_info=call_info, **kwargs)
+        except CircuitOpenError:
+            record('circuit_open')
+            raise
+        except Exception as e:
+            record(type(e).__name__)
+            raise
+        if kwargs.get('stream'):
+            # Recorded when the stream is drained, with usage from its final chunk
+            return _MeteredStream(response, record)
+        record('ok', response)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._endpoint, name)
+
+
+class ResilientOpenAIClient:
+    """Drop-in replacement for `openai.OpenAI` used throughout the server"""
+
+    def __init__(self, client, policy: Optional[RetryPolicy] = None):
+        self._client = client
+        policy = policy or RetryPolicy()
+        self.chat = SimpleNamespace(
+            completions=_ResilientEndpoint(client.chat.completions, 'chat.completions', policy)
+        )
+        self.audio = SimpleNamespace(
+            transcriptions=_ResilientEndpoint(client.audio.transcriptions, 'audio.transcriptions', policy)
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def use_mock_server() -> bool:
+    """
+    True when OPENAI_MOCK_SERVER_URL is set. Installs a placeholder API key
+    if none is configured, so startup and per-route key validation pass offline.
+    """
+    if not OPENAI_MOCK_SERVER_URL:
+        return False
+    if not os.environ.get('OPENAI_API_KEY', '').strip():
+        os.environ['OPENAI_API_KEY'] = MOCK_API_KEY
+    logger.info(f"🧪 OpenAI calls routed to mock server at {OPENAI_MOCK_SERVER_URL}")
+    return True
+
+
+def create_openai_client(api_key: str, **kwargs) -> ResilientOpenAIClient:
+    """
+    Build an OpenAI client whose calls are retried and guarded by the breaker.
+    The SDK's own retries are disabled so only one retry loop is in play.
+    """
+    import openai
+
+    if OPENAI_MOCK_SERVER_URL:
+        kwargs.setdefault('base_url', OPENAI_MOCK_SERVER_URL)
+    kwargs.setdefault('timeout', OPENAI_TIMEOUT_SECONDS)
+    kwargs.setdefault('max_retries', 0)
+    return ResilientOpenAIClient(openai.OpenAI(api_key=api_key, **kwargs))
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Decoded PCM Sidecar Cache
+Every audio file is decoded once to 16 kHz mono int16 and stored as a .npy
+sidecar under cache/pcm, keyed by the source path, mtime and size. Later
+reads memory-map the sidecar, so re-running any stage does no decoding and
+any time range can be sliced as a view without copying.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Iterator, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PCM_CACHE_DIR = os.environ.get('PCM_CACHE_DIR', os.path.join('cache', 'pcm'))
+PCM_CACHE_ENABLED = os.environ.get('PCM_CACHE', '1').lower() not in ('0', 'false', 'no')
+
+# Same canonical format the transcription cache hashes
+PCM_SAMPLE_RATE = 16000
+PCM_CHANNELS = 1
+PCM_SAMPLE_WIDTH = 2
+PCM_DTYPE = np.int16
+
+# Samples read from the ffmpeg pipe per chunk when streaming (10 s)
+STREAM_CHUNK_SAMPLES = int(os.environ.get('PCM_STREAM_CHUNK_SECONDS', 10)) * PCM_SAMPLE_RATE
+
+_decode_locks = {}
+_decode_locks_guard = threading.Lock()
+
+
+def _source_key(path: str) -> str:
+    return hashlib.sha1(os.path.realpath(path).encode('utf-8')).hexdigest()[:20]
+
+
+def sidecar_path(path: str) -> str:
+    """Sidecar location for the current version (mtime + size) of `path`"""
+    stat = os.stat(path)
+    return os.path.join(PCM_CACHE_DIR, _source_key(path), f"{stat.st_mtime_ns}-{stat.st_size}.npy")
+
+
+def _is_temporary(path: str) -> bool:
+    """Upload temp files are decoded in memory only; caching them would just leak disk"""
+    temp_root = os.path.realpath(tempfile.gettempdir())
+    return os.path.realpath(path).startswith(temp_root + os.sep)
+
+
+def decode_to_pcm(path: str) -> np.ndarray:
+    """Decode any audio file to a 16 kHz mono int16 array (ffmpeg, else pydub)"""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        result = subprocess.run(
+            [ffmpeg, '-nostdin', '-v', 'error', '-i', path,
+             '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', str(PCM_CHANNELS), '-ar', str(PCM_SAMPLE_RATE), '-'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False
+        )
+        if result.returncode == 0:
+            return np.frombuffer(result.stdout, dtype=PCM_DTYPE)
+        logger.warning(f"⚠️ ffmpeg could not decode {path}: {result.stderr.decode('utf-8', 'replace').strip()[:200]}")
+
+    from pydub import AudioSegment
+    audio = AudioSegment.from_file(path)
+    audio = audio.set_frame_rate(PCM_SAMPLE_RATE).set_channels(PCM_CHANNELS).set_sample_width(PCM_SAMPLE_WIDTH)
+    return np.frombuffer(audio.raw_data, dtype=PCM_DTYPE)
+
+
+def _npy_header(n_samples: int) -> bytes:
+    header = io.BytesIO()
+    np.lib.format.write_array_header_1_0(header, {
+        'descr': np.lib.format.dtype_to_descr(np.dtype(PCM_DTYPE)), 'fortran_order': False, 'shape': (n_samples,)
+    })
+    return header.getvalue()
+
+
+def companion_path(path: str, kind: str) -> str:
+    """
+    Path for data derived from the current version of `path` (e.g. a speaker
+    embedding), stored next to its sidecar and pruned with it.
+    """
+    target = sidecar_path(path)
+    return f"{target[:-len('.npy')]}.{kind}.npy"
+
+
+def _prune_stale_sidecars(target: str):
+    # Sidecars (and companions) of older versions of the same source are never read again
+    directory = os.path.dirname(target)
+    version = os.path.basename(target)[:-len('.npy')]
+    for name in os.listdir(directory):
+        stale = os.path.join(directory, name)
+        if name.endswith('.npy') and name.split('.', 1)[0] != version:
+            try:
+                os.unlink(stale)
+            except OSError:
+                pass
+
+
+def _write_sidecar(target: str, pcm: np.ndarray):
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, pcm, allow_pickle=False)
+    os.replace(tmp_path, target)
+    _prune_stale_sidecars(target)
+
+
+class _SidecarWriter:
+    """Appends streamed chunks to a .npy sidecar whose header is filled in on commit"""
+
+    def __init__(self, target: str):
+        self.target = target
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self.tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.header_size = len(_npy_header(0))
+        self.n_samples = 0
+        self.file = open(self.tmp_path, 'wb')
+        self.file.write(b'\0' * self.header_size)
+
+    def write(self, chunk: np.ndarray):
+        self.file.write(np.ascontiguousarray(chunk, dtype=PCM_DTYPE).data)
+        self.n_samples += len(chunk)
+
+    def commit(self):
+        header = _npy_header(self.n_samples)
+        if len(header) != self.header_size:
+            raise OSError(f"npy header grew to {len(header)} bytes")
+        self.file.seek(0)
+        self.file.write(header)
+        self.file.close()
+        os.replace(self.tmp_path, self.target)
+        _prune_stale_sidecars(self.target)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.unlink(self.tmp_path)
+        except OSError:
+            pass
+
+
+def _iter_ffmpeg_pcm(ffmpeg: str, path: str, chunk_samples: int) -> Iterator[np.ndarray]:
+    process = subprocess.Popen(
+        [ffmpeg, '-nostdin', '-v', 'error', '-i', path,
+         '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', str(PCM_CHANNELS), '-ar', str(PCM_SAMPLE_RATE), '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    chunk_bytes = chunk_samples * PCM_SAMPLE_WIDTH
+    pending = b''
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            data = pending + data
+            usable = len(data) - len(data) % PCM_SAMPLE_WIDTH
+            pending = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=PCM_DTYPE)
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg could not decode {path}: {stderr.decode('utf-8', 'replace').strip()[:200]}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def stream_pcm(path: str, chunk_samples: int = STREAM_CHUNK_SAMPLES, persist: Optional[bool] = None) -> Iterator[np.ndarray]:
+    """
+    16 kHz mono int16 samples of `path` in chunks, with memory bounded by the
+    chunk size whatever the recording length. Reads the sidecar when there is
+    one; otherwise decodes through an ffmpeg pipe and (when persisting)
+    writes the sidecar on the way, so a full pass leaves it in place.
+    """
+    if persist is None:
+        persist = PCM_CACHE_ENABLED and not _is_temporary(path)
+    target = sidecar_path(path) if persist else None
+    if target and os.path.exists(target):
+        try:
+            pcm = _open_sidecar(target)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Unreadable PCM sidecar {target}, decoding again: {e}")
+        else:
+            for start in range(0, len(pcm), chunk_samples):
+                yield pcm[start:start + chunk_samples]
+            return
+
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        # pydub has no streaming decoder; decode fully as before
+        pcm = load_pcm(path, persist=persist)
+        for start in range(0, len(pcm), chunk_samples):
+            yield pcm[start:start + chunk_samples]
+        return
+
+    writer = None
+    if target:
+        try:
+            writer = _SidecarWriter(target)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write PCM sidecar for {path}: {e}")
+    try:
+        for chunk in _iter_ffmpeg_pcm(ffmpeg, path, chunk_samples):
+            if writer:
+                writer.write(chunk)
+            yield chunk
+    except BaseException:
+        if writer:
+            writer.discard()
+        raise
+    if writer:
+        try:
+            writer.commit()
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write PCM sidecar for {path}: {e}")
+            writer.discard()
+
+
+def _open_sidecar(target: str) -> np.ndarray:
+    if os.path.getsize(target) <= 128:
+        # Zero-length arrays cannot be memory-mapped
+        return np.load(target, allow_pickle=False)
+    return np.load(target, mmap_mode='r', allow_pickle=False)
+
+
+def load_pcm(path: str, persist: Optional[bool] = None) -> np.ndarray:
+    """
+    16 kHz mono int16 samples of `path`, memory-mapped from its sidecar.
+    The file is decoded only when no sidecar matches its current mtime and
+    size. Temp files (and PCM_CACHE=0) are decoded without writing a sidecar
+    unless `persist` says otherwise.
+    """
+    if persist is None:
+        persist = PCM_CACHE_ENABLED and not _is_temporary(path)
+    if not persist:
+        return decode_to_pcm(path)
+
+    target = sidecar_path(path)
+    if os.path.exists(target):
+        try:
+            return _open_sidecar(target)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Unreadable PCM sidecar {target}, decoding again: {e}")
+
+    with _decode_locks_guard:
+        lock = _decode_locks.setdefault(target, threading.Lock())
+    with lock:
+        if not os.path.exists(target):
+            if shutil.which('ffmpeg'):
+                # Streamed straight into the sidecar; the decoded audio is never held in memory
+                try:
+                    n_samples = sum(len(chunk) for chunk in stream_pcm(path, persist=True))
+                except RuntimeError as e:
+                    logger.warning(f"⚠️ {e}")
+                    return decode_to_pcm(path)
+                if not os.path.exists(target):
+                    return decode_to_pcm(path)
+            else:
+                pcm = decode_to_pcm(path)
+                try:
+                    _write_sidecar(target, pcm)
+                except OSError as e:
+                    logger.warning(f"⚠️ Could not write PCM sidecar for {path}: {e}")
+                    return pcm
+                n_samples = len(pcm)
+            logger.info(f"💽 Decoded {os.path.basename(path)} once: "
+                        f"{n_samples / PCM_SAMPLE_RATE:.1f}s → {target}")
+    with _decode_locks_guard:
+        _decode_locks.pop(target, None)
+    return _open_sidecar(target)
+
+
+def pcm_duration(pcm: np.ndarray) -> float:
+    return len(pcm) / float(PCM_SAMPLE_RATE)
+
+
+def pcm_slice(pcm: np.ndarray, start_seconds: float, end_seconds: Optional[float] = None) -> np.ndarray:
+    """Time range of a PCM array as a view (no copy)"""
+    start = max(0, int(round(start_seconds * PCM_SAMPLE_RATE)))
+    end = len(pcm) if end_seconds is None else min(len(pcm), int(round(end_seconds * PCM_SAMPLE_RATE)))
+    return pcm[start:max(start, end)]
+
+
+def pcm_sha256(pcm: np.ndarray) -> str:
+    """Same digest as transcription_cache.canonical_pcm_sha256 for the equivalent AudioSegment"""
+    return hashlib.sha256(np.ascontiguousarray(pcm, dtype=PCM_DTYPE).data).hexdigest()
+
+
+def pcm_to_audio_segment(pcm: np.ndarray):
+    """pydub AudioSegment over the samples, for code that still needs one"""
+    from pydub import AudioSegment
+    return AudioSegment(
+        data=np.ascontiguousarray(pcm, dtype=PCM_DTYPE).tobytes(),
+        sample_width=PCM_SAMPLE_WIDTH, frame_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS
+    )
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Prompt Templates for GPT Emotion Analysis
+Static instructions and the emotion list are rendered once per emotions
+config version and sent as the leading system message, so consecutive calls
+share a long identical prefix the provider-side prompt cache can reuse.
+Only the per-segment facts and text go into the trailing user message.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the template wording below changes
+PROMPT_TEMPLATE_REVISION = 3
+
+EMOTIONS_PER_LINE = 6
+
+DETECTION_CACHE_SIZE = 512
+
+
+def compute_config_version(raw_config: bytes) -> str:
+    """Short content hash identifying one emotions_config.json revision"""
+    return hashlib.sha256(raw_config).hexdigest()[:12]
+
+
+def make_cache_key(prompt_version: str, *parts: Any) -> str:
+    """Cache key that changes whenever the prompt or its emotion list changes"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+        digest.update(b'\x00')
+    return f"{prompt_version}:{digest.hexdigest()[:24]}"
+
+
+DETECTION_INSTRUCTIONS = """אתה מומחה מתקדם לניתוח רגשות בעברית עם גישה לכל {emotion_count} רגשות זמינים.
+נתח את הטקסט בעומק וזהה את הרגשות הדומיננטיים (1-3 רגשות מקסימום).
+
+🎭 כל {emotion_count} הרגשות הזמינים (השתמש בדיוק ברגשות האלה):
+{emotion_list}
+
+📊 הנחיות מתקדמות לניתוח:
+• **בחר 1-3 רגשות המשקפים הכי טוב את הטקסט**
+• **השתמש רק ברגשות מהרשימה למעלה**
+• **אל תבטח על "ניטרלי" אלא אם כן באמת אין רגש מזוהה**
+
+🎯 מדריך זיהוי רגשות מתקדם:
+• שאלות ידידותיות ("מה שלומך?", "רוצה משהו?") → סקרנות, חיבה, נעים
+• ביטויי אהבה וחיבה → אהבה, חיבה, התרגשות
+• שמחה ואושר → שמחה, שמח, התרגשות
+• עצב ודכאון → עצב, דכאון, אכזבה
+• כעס וזעם → כעס, תסכול, עצבנות
+• פחד וחרדה → חרד, דאגה, פחד
+• עייפות → תשישות, מתוח קלות
+• תמיכה ועידוד → תומך, מעודד, דאגה
+• הכרת תודה → הכרת תודה, הערכה
+• הערצה והשראה → הערצה, התרגשות
+• הפתעה → הפתעה, מופתע
+• סקרנות → סקרנות, מעוניין, סקרן
+• בלבול → מבולבל, אי ודאות, לא בטוח
+• ביקורת ואי הסכמה → אי הסכמה, ביקורת, ספקנות
+• דחיפות → דחוף, דחיפות
+• נחישות → נחוש, נחישות, ביטחון
+
+🎭 דוגמאות מתקדמות:
+• "איך אתה מרגיש? מקווה שהכל בסדר" → דאגה, סקרנות
+• "אני אוהב אותך כל כך, זה מדהים!" → אהבה, התרגשות, שמחה
+• "אני עייף מהיום אבל שמח שהצלחתי" → תשישות, שמחה, סיפוק
+• "לא הבנתי מה קורה פה, זה מבלבל" → מבולבל, אי ודאות
+• "תודה רבה! זה באמת עזר לי" → הכרת תודה, הערכה
+• "אני לא מסכים איתך בנושא הזה" → אי הסכמה
+• "מתי נפגש? אני מצפה לזה!" → ציפייה, התרגשות
+
+השב עם 1-3 רגשות מהרשימה למעלה, מופרדים בפסיק."""
+
+DETECTION_USER = """📝 טקסט לניתוח: "{text}\""""
+
+ANALYSIS_INSTRUCTIONS = """אתה מנתח מתקדם לטקסט ואודיו בעברית. נתח את הטקסט ושלב עם מידע האודיו לקבלת פרמטרים ויזואליים מדויקים.
+המידע המוכן, מידע האודיו והטקסט לניתוח מופיעים בהודעת המשתמש.
+
+🎭 הרגשות הזמינים:
+{emotion_list}
+
+🎯 הנחיות לפרמטרים ויזואליים (התבסס על הטקסט + האודיו):
+• humor_score: עוצמת הומור בטקסט (0-10)
+• blur: טשטוש על פי עוצמת הרגש - רגשות חזקים = פחות טשטוש
+• spark: ברק/זוהר על פי התרגשות ואנרגיה
+• blob_size: גודל בהתאם לעוצמת האודיו ורגש
+• blob_intensity: עוצמה על פי אנרגיית האודיו + רגש
+• blobiness: נזילות על פי סוג הרגש (רגשות רכים = יותר נזיל)
+• proximity: קרבה בין אלמנטים על פי אינטימיות הטקסט
+
+החזר JSON (השתמש בערכים המסופקים במידע המוכן בדיוק):
+{{
+  "emotions_detected": <רשימת הרגשות המזוהים מהמידע המוכן>,
+  "primary_emotion": "<הרגש הראשי מהמידע המוכן>",
+  "word_count": <ספירת המילים מהמידע המוכן>,
+  "humor_score": <0-10, התבסס על הומור בטקסט>,
+  "tone": "<נייטרלי | קליל | מתוח | ציני | חם | קר>",
+  "is_question": <true/false>,
+  "intention": "<פתיחת שיחה | הצעת פעולה | הסכמה | בדיחה | בקשת מידע | ביקורת | ביטוי רגש>",
+  "godel_to_regesh": <0.5-5.0, עוצמת הרגש מהטקסט>,
+  "kamut_to_regesh": <0-200, כמות תווי רגש>,
+  "blur": <0-12, פחות טשטוש לרגשות חזקים>,
+  "spark": <0-10, ברק על פי התרגשות ואנרגיה>,
+  "godel_to_regular": <0.2-2.0, גודל תווים רגילים>,
+  "grid_resolution": <רזולוציית הגריד המחושבת מהמידע המוכן>,
+  "blob_size": <1-10, התבסס על עוצמת אודיו + רגש>,
+  "blob_intensity": <0-5000, התבסס על אנרגיית אודיו>,
+  "dominance": <0-5000, דומיננטיות הרגש>,
+  "blobiness": <0-10, נזילות על פי סוג הרגש>,
+  "speaker_position": "<המיקום הקבוע של הדובר מהמידע המוכן>",
+  "proximity": "<מחובר | קרוב מאוד | קרוב | בינוני | רחוק | רחוק מאוד>",
+  "volume_factor": <0.1-2.0, מכפיל על פי עוצמת האודיו>,
+  "energy_factor": <0.1-2.0, מכפיל על פי אנרגיית האודיו>,
+  "summary": "<הסבר קצר בעברית על הניתוח>"
+}}"""
+
+ANALYSIS_USER = """📊 מידע מוכן:
+• רגשות מזוהים: {emotions}
+• רגש ראשי לויזואליזציה: {primary_emotion}
+• ספירת מילים: {word_count}
+• רזולוציית גריד מחושבת: {grid_resolution} (מילים × 10)
+• דובר: {speaker_text} - מיקום קבוע: "{speaker_position}"
+
+🎧 מידע אודיו (שלב עם הטקסט):
+• עוצמת קול: {volume:.1f}%
+• אנרגיה: {energy:.1f}%
+• משך: {duration:.1f} שניות
+{audio_details}
+📝 טקסט לניתוח: "{text}\""""
+
+# Extra lines when backend.audio_features measured the segment
+AUDIO_DETAILS = """• שיא עוצמה: {peak_dbfs:.1f} dBFS
+• אחוז דיבור בקטע: {speech_ratio:.0f}%
+• מרכז ספקטרלי (בהירות הקול): {spectral_centroid:.0f} Hz
+• קצב מעברי אפס: {zcr:.3f}
+"""
+
+
+class EmotionPromptTemplates:
+    """Both analysis prompts pre-rendered for one emotion list"""
+
+    def __init__(self, emotions_hebrew: List[str], config_version: str):
+        self.emotion_count = len(emotions_hebrew)
+        self.version = f"emo-v{PROMPT_TEMPLATE_REVISION}-{config_version}"
+
+        emotion_lines = []
+        for i in range(0, len(emotions_hebrew), EMOTIONS_PER_LINE):
+            emotion_lines.append(' | '.join(emotions_hebrew[i:i + EMOTIONS_PER_LINE]))
+        emotion_list = '\n'.join(emotion_lines)
+
+        self.detection_system = DETECTION_INSTRUCTIONS.format(
+            emotion_count=self.emotion_count, emotion_list=emotion_list
+        )
+        self.analysis_system = ANALYSIS_INSTRUCTIONS.format(emotion_list=emotion_list)
+
+    def detection_messages(self, text: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.detection_system},
+            {"role": "user", "content": DETECTION_USER.format(text=text)},
+        ]
+
+    def analysis_messages(self, text: str, emotions: List[str], primary_emotion: str, word_count: int,
+                          grid_resolution: int, speaker_text: str, speaker_position: str,
+                          audio_analysis: Dict[str, Any]) -> List[Dict[str, str]]:
+        audio_details = ''
+        if 'speech_ratio' in audio_analysis:
+            audio_details = AUDIO_DETAILS.format(
+                peak_dbfs=audio_analysis.get('peak_dbfs', 0.0),
+                speech_ratio=audio_analysis.get('speech_ratio', 0.0) * 100,
+                spectral_centroid=audio_analysis.get('spectral_centroid', 0.0),
+                zcr=audio_analysis.get('zcr', 0.0),
+            )
+        user_content = ANALYSIS_USER.format(
+            emotions=', '.join(emotions),
+            primary_emotion=primary_emotion,
+            word_count=word_count,
+            grid_resolution=grid_resolution,
+            speaker_text=speaker_text,
+            speaker_position=speaker_position,
+            volume=audio_analysis.get('volume', 0.5) * 100,
+            energy=audio_analysis.get('energy_level', audio_analysis.get('energy', 0.5)) * 100,
+            duration=audio_analysis.get('duration', 1.0),
+            audio_details=audio_details,
+            text=text,
+        )
+        return [
+            {"role": "system", "content": self.analysis_system},
+            {"role": "user", "content": user_content},
+        ]
+
+
+_templates: Dict[str, EmotionPromptTemplates] = {}
+_templates_lock = threading.Lock()
+
+
+def get_prompt_templates(emotions_data: Dict[str, Any]) -> EmotionPromptTemplates:
+    """
+    Templates for the given load_emotions_config() result, built only when
+    its config version has not been seen before.
+    """
+    config_version = emotions_data.get('version') or compute_config_version(
+        json.dumps(emotions_data['active_hebrew'], ensure_ascii=False).encode('utf-8')
+    )
+    with _templates_lock:
+        templates = _templates.get(config_version)
+        if templates is None:
+            templates = EmotionPromptTemplates(emotions_data['active_hebrew'], config_version)
+            # Old config versions are never asked for again
+            _templates.clear()
+            _templates[config_version] = templates
+            logger.info(f"🧩 Built prompt templates {templates.version} "
+                        f"({templates.emotion_count} emotions)")
+        return templates
+
+
+class DetectionCache:
+    """Small thread-safe LRU for step-1 emotion detection answers"""
+
+    def __init__(self, max_entries: int = DETECTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+detection_cache = DetectionCache()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Vectorized Silence Detection
+Drop-in replacement for pydub's detect_silence / split_on_silence working on
+a NumPy sample array. pydub probes every seek_step with a Python-level RMS
+over an overlapping window; here per-millisecond sums of squares are built
+once, and every window's RMS is a difference of prefix sums. With the
+default hysteresis of 0 dB the silent ranges, and so the cut points, are
+identical to pydub's (same window bounds, same integer RMS, same merging).
+
+StreamingSilenceSplitter gives the same ranges for audio fed in chunks
+(e.g. from an ffmpeg pipe) with memory independent of the recording length.
+
+Run `python -m backend.silence_detection <audio> [...]` to benchmark against
+pydub on the same file.
+"""
+
+import argparse
+import logging
+import os
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds of audio squared and summed per block (bounds memory on long files)
+BLOCK_MS = 10000
+# Extra dB above silence_thresh a silence may rise to before it ends (0 = pydub behaviour)
+SILENCE_HYSTERESIS_DB = float(os.environ.get('SILENCE_HYSTERESIS_DB', 0))
+
+
+def samples_from_audio_segment(audio) -> np.ndarray:
+    """Interleaved samples of a pydub AudioSegment without copying 16-bit data"""
+    if audio.sample_width == 2:
+        return np.frombuffer(audio.raw_data, dtype=np.int16)
+    return np.array(audio.get_array_of_samples())
+
+
+def audio_length_ms(n_frames: int, sample_rate: int) -> int:
+    """Length in ms exactly as pydub reports it (len(AudioSegment))"""
+    return round(1000 * (n_frames / float(sample_rate)))
+
+
+def _frame_at(ms: np.ndarray, sample_rate: int) -> np.ndarray:
+    # pydub: int(ms * (frame_rate / 1000.0))
+    return (ms * (sample_rate / 1000.0)).astype(np.int64)
+
+
+def millisecond_energy(samples: np.ndarray, sample_rate: int, channels: int = 1):
+    """
+    Prefix sums of squared samples at every millisecond boundary pydub slices
+    on, plus those boundaries as frame indices (may run past the last frame,
+    where pydub pads with silence).
+    """
+    n_frames = len(samples) // channels
+    length_ms = audio_length_ms(n_frames, sample_rate)
+    boundaries = _frame_at(np.arange(length_ms + 1), sample_rate)
+
+    # int16 squares fit in int32; sums are accumulated exactly in int64
+    square_dtype = np.int32 if samples.dtype.itemsize <= 2 else np.float64
+    per_ms = np.zeros(length_ms, dtype=np.int64 if square_dtype is np.int32 else np.float64)
+    for block_start in range(0, length_ms, BLOCK_MS):
+        block_end = min(block_start + BLOCK_MS, length_ms)
+        first = min(int(boundaries[block_start]), n_frames)
+        last = min(int(boundaries[block_end]), n_frames)
+        if last <= first:
+            continue
+        squares = np.asarray(samples[first * channels:last * channels]).astype(square_dtype)
+        np.multiply(squares, squares, out=squares)
+        starts = (boundaries[block_start:block_end] - first) * channels
+        ends = (np.minimum(boundaries[block_start + 1:block_end + 1], last) - first) * channels
+        non_empty = np.flatnonzero(ends > starts)
+        if len(non_empty):
+            per_ms[block_start + non_empty] = np.add.reduceat(squares, starts[non_empty], dtype=per_ms.dtype)
+
+    prefix = np.concatenate(([0], np.cumsum(per_ms)))
+    return prefix, boundaries
+
+
+def window_rms(prefix: np.ndarray, boundaries: np.ndarray, starts_ms: np.ndarray, window_ms: int,
+               channels: int = 1) -> np.ndarray:
+    """Integer RMS (as audioop.rms) of the windows [start, start + window_ms)"""
+    ends_ms = starts_ms + window_ms
+    energy = prefix[ends_ms] - prefix[starts_ms]
+    n_samples = (boundaries[ends_ms] - boundaries[starts_ms]) * channels
+    mean_square = np.divide(energy.astype(np.float64), n_samples,
+                            out=np.zeros(len(starts_ms)), where=n_samples > 0)
+    return np.floor(np.sqrt(mean_square))
+
+
+def _runs_with_hysteresis(enter: np.ndarray, stay: np.ndarray) -> np.ndarray:
+    """
+    Windows that are silent under hysteresis: a run of `stay` windows counts
+    only if at least one window in it also meets the stricter `enter` test.
+    """
+    if not stay.any():
+        return stay
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], stay.view(np.int8), [0]))))
+    run_starts, run_ends = edges[::2], edges[1::2]
+    has_entry = np.maximum.reduceat(enter.view(np.int8), run_starts) > 0 if len(run_starts) else []
+    silent = np.zeros_like(stay)
+    for start, end, keep in zip(run_starts, run_ends, has_entry):
+        if keep:
+            silent[start:end] = True
+    return silent
+
+
+def detect_silence(samples: np.ndarray, sample_rate: int, min_silence_len: int = 1000,
+                   silence_thresh: float = -16, seek_step: int = 1, channels: int = 1,
+                   sample_width: int = 2, hysteresis_db: float = 0.0,
+                   energy: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> List[List[int]]:
+    """
+    Silent [start_ms, end_ms] ranges, same contract as pydub.silence.detect_silence.
+    With hysteresis_db > 0 a silence, once entered below silence_thresh, also
+    extends over neighbouring windows up to silence_thresh + hysteresis_db.
+    `energy` is the millisecond_energy of the samples when the caller already has it.
+    """
+    n_frames = len(samples) // channels
+    seg_len = audio_length_ms(n_frames, sample_rate)
+    if seg_len < min_silence_len:
+        return []
+
+    max_amplitude = float(1 << (8 * sample_width - 1))
+    enter_thresh = (10 ** (silence_thresh / 20.0)) * max_amplitude
+    stay_thresh = (10 ** ((silence_thresh + hysteresis_db) / 20.0)) * max_amplitude
+
+    last_slice_start = seg_len - min_silence_len
+    starts = np.arange(0, last_slice_start + 1, seek_step, dtype=np.int64)
+    if last_slice_start % seek_step:
+        starts = np.append(starts, last_slice_start)
+
+    prefix, boundaries = energy if energy is not None else millisecond_energy(samples, sample_rate, channels)
+    rms = window_rms(prefix, boundaries, starts, min_silence_len, channels)
+    silent = rms <= enter_thresh
+    if hysteresis_db > 0:
+        silent = _runs_with_hysteresis(silent, rms <= stay_thresh)
+
+    silence_starts = starts[silent]
+    if len(silence_starts) == 0:
+        return []
+
+    # pydub's merge: a new range starts only where windows are neither
+    # consecutive nor overlapping the previous silent window
+    gaps = np.diff(silence_starts)
+    breaks = np.flatnonzero((gaps != seek_step) & (silence_starts[1:] > silence_starts[:-1] + min_silence_len))
+    range_starts = np.concatenate(([silence_starts[0]], silence_starts[breaks + 1]))
+    range_ends = np.concatenate((silence_starts[breaks], [silence_starts[-1]])) + min_silence_len
+    return [[int(s), int(e)] for s, e in zip(range_starts, range_ends)]
+
+
+def detect_nonsilent(samples: np.ndarray, sample_rate: int, min_silence_len: int = 1000,
+                     silence_thresh: float = -16, seek_step: int = 1, channels: int = 1,
+                     sample_width: int = 2, hysteresis_db: float = 0.0) -> List[List[int]]:
+    """Non-silent [start_ms, end_ms] ranges, same contract as pydub.silence.detect_nonsilent"""
+    silent_ranges = detect_silence(samples, sample_rate, min_silence_len, silence_thresh, seek_step,
+                                   channels, sample_width, hysteresis_db)
+    len_seg = audio_length_ms(len(samples) // channels, sample_rate)
+
+    if not silent_ranges:
+        return [[0, len_seg]]
+    if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+        return []
+
+    prev_end = 0
+    nonsilent_ranges = []
+    for start, end in silent_ranges:
+        nonsilent_ranges.append([prev_end, start])
+        prev_end = end
+    if silent_ranges[-1][1] != len_seg:
+        nonsilent_ranges.append([prev_end, len_seg])
+    if nonsilent_ranges[0] == [0, 0]:
+        nonsilent_ranges.pop(0)
+    return nonsilent_ranges
+
+
+def split_ranges_on_silence(samples: np.ndarray, sample_rate: int, min_silence_len: int = 1000,
+                            silence_thresh: float = -16, keep_silence=100, seek_step: int = 1,
+                            channels: int = 1, sample_width: int = 2, hysteresis_db: float = 0.0,
+                            min_segment_len: int = 0) -> List[List[int]]:
+    """
+    The [start_ms, end_ms] ranges pydub.silence.split_on_silence would cut,
+    so the caller can slice (or stream-copy) the audio itself. Ranges shorter
+    than min_segment_len are dropped afterwards.
+    """
+    len_seg = audio_length_ms(len(samples) // channels, sample_rate)
+    if isinstance(keep_silence, bool):
+        keep_silence = len_seg if keep_silence else 0
+
+    output_ranges = [[start - keep_silence, end + keep_silence]
+                     for start, end in detect_nonsilent(samples, sample_rate, min_silence_len, silence_thresh,
+                                                        seek_step, channels, sample_width, hysteresis_db)]
+    for current, following in zip(output_ranges, output_ranges[1:]):
+        if following[0] < current[1]:
+            current[1] = (current[1] + following[0]) // 2
+            following[0] = current[1]
+
+    ranges = [[max(start, 0), min(end, len_seg)] for start, end in output_ranges]
+    return [r for r in ranges if r[1] - r[0] >= min_segment_len]
+
+
+def split_audio_segment_on_silence(audio, min_silence_len: int = 1000, silence_thresh: float = -16,
+                                   keep_silence=100, seek_step: int = 1, hysteresis_db: float = 0.0):
+    """Same result as pydub.silence.split_on_silence(audio, ...), computed vectorized"""
+    ranges = split_ranges_on_silence(samples_from_audio_segment(audio), audio.frame_rate, min_silence_len,
+                                     silence_thresh, keep_silence, seek_step, audio.channels,
+                                     audio.sample_width, hysteresis_db)
+    return [audio[start:end] for start, end in ranges]
+
+
+class StreamingSilenceSplitter:
+    """
+    split_ranges_on_silence over audio that arrives in chunks. Keeps only
+    the per-millisecond energies of the current detection window, so memory
+    does not grow with the recording. `feed` returns the [start_ms, end_ms]
+    ranges whose bounds became final with that chunk; `finish` returns the
+    rest. Fed the same samples, the ranges equal split_ranges_on_silence's.
+    Sample rate must be a multiple of 1000 Hz (the 16 kHz sidecar format).
+    """
+
+    def __init__(self, sample_rate: int, min_silence_len: int = 1000, silence_thresh: float = -16,
+                 keep_silence=100, seek_step: int = 1, sample_width: int = 2,
+                 hysteresis_db: float = 0.0, min_segment_len: int = 0):
+        if sample_rate % 1000:
+            raise ValueError("Streaming silence detection needs a sample rate that is a multiple of 1000 Hz")
+        if isinstance(keep_silence, bool):
+            # keep_silence=True means "all of it", which needs the final length
+            raise ValueError("Streaming silence detection needs keep_silence in ms")
+        self.samples_per_ms = sample_rate // 1000
+        self.min_silence_len = min_silence_len
+        self.seek_step = seek_step
+        self.keep_silence = keep_silence
+        self.hysteresis_db = hysteresis_db
+        self.min_segment_len = min_segment_len
+        max_amplitude = float(1 << (8 * sample_width - 1))
+        self.enter_thresh = (10 ** (silence_thresh / 20.0)) * max_amplitude
+        self.stay_thresh = (10 ** ((silence_thresh + hysteresis_db) / 20.0)) * max_amplitude
+
+        self.total_ms = 0              # complete milliseconds received
+        self.length_ms: Optional[int] = None  # set by finish()
+        self._partial = np.zeros(0, dtype=np.int64)
+        self._energy = np.zeros(0, dtype=np.int64)  # per-ms energy from _energy_base onwards
+        self._energy_base = 0
+        self._next_window = 0
+        # Current run of windows passing the hysteresis "stay" test
+        self._run: Optional[List[List[int]]] = None   # [[first window, last window], ...]
+        self._run_entered = False
+        # Current merged silence range: [first silent window, last silent window]
+        self._silence: Optional[List[int]] = None
+        self._prev_silence_end = 0
+        # Start of the next segment when it was moved to the midpoint of an overlap
+        self._pending_start: Optional[int] = None
+        self._emitted: List[List[int]] = []
+
+    # -- energies -------------------------------------------------------
+
+    def _add_samples(self, samples: np.ndarray):
+        samples = np.concatenate((self._partial, np.asarray(samples, dtype=np.int64)))
+        complete = len(samples) - len(samples) % self.samples_per_ms
+        self._partial = samples[complete:]
+        if complete:
+            squares = samples[:complete] * samples[:complete]
+            per_ms = squares.reshape(-1, self.samples_per_ms).sum(axis=1)
+            self._energy = np.concatenate((self._energy, per_ms))
+            self.total_ms += len(per_ms)
+
+    def _evaluate(self, starts: np.ndarray):
+        if not len(starts):
+            return
+        prefix = np.concatenate(([0], np.cumsum(self._energy)))
+        offsets = starts - self._energy_base
+        energy = prefix[offsets + self.min_silence_len] - prefix[offsets]
+        rms = np.floor(np.sqrt(energy / float(self.min_silence_len * self.samples_per_ms)))
+        enter = rms <= self.enter_thresh
+        stay = rms <= self.stay_thresh if self.hysteresis_db > 0 else enter
+        for start, is_enter, is_stay in zip(starts.tolist(), enter.tolist(), stay.tolist()):
+            if not is_stay:
+                self._close_run()
+                continue
+            if self._run is None:
+                self._run = [[start, start]]
+                self._run_entered = False
+            else:
+                last = self._run[-1][1]
+                if start == last + self.seek_step or start <= last + self.min_silence_len:
+                    self._run[-1][1] = start
+                else:
+                    # Same hysteresis run, but pydub would not merge these windows
+                    self._run.append([start, start])
+            self._run_entered = self._run_entered or is_enter
+
+    def _advance(self, last_start: int):
+        """Evaluate every grid window starting at or before last_start"""
+        if last_start >= self._next_window:
+            starts = np.arange(self._next_window, last_start + 1, self.seek_step, dtype=np.int64)
+            self._evaluate(starts)
+            self._next_window = int(starts[-1]) + self.seek_step
+        # The final off-grid window may start as early as total_ms - min_silence_len
+        drop = min(self._next_window, self.total_ms - self.min_silence_len) - self._energy_base
+        if drop > 0:
+            self._energy = self._energy[drop:]
+            self._energy_base += drop
+
+    # -- silence runs → silence ranges → padded segments ----------------
+
+    def _close_run(self):
+        if self._run is None:
+            return
+        pieces = self._run
+        self._run = None
+        if not self._run_entered:
+            return
+        # Windows inside one piece merge, so only the gap before a piece can
+        # start a new range (pydub's merge rule)
+        for first, last in pieces:
+            if self._silence is not None and first > self._silence[1] + self.min_silence_len:
+                self._close_silence()
+            if self._silence is None:
+                self._silence = [first, last]
+            else:
+                self._silence[1] = last
+
+    def _close_silence(self, length_ms: Optional[int] = None):
+        start, last = self._silence
+        self._silence = None
+        silence_end = last + self.min_silence_len
+        # Audio continues after the silence unless it runs to the very end
+        next_start = silence_end if length_ms is None or silence_end != length_ms else None
+        self._add_nonsilent(self._prev_silence_end, start, next_start, length_ms)
+        self._prev_silence_end = silence_end
+
+    def _add_nonsilent(self, start: int, end: int, next_start: Optional[int], length_ms: Optional[int] = None):
+        """Pad a non-silent range; its end is final because the next range's start is known"""
+        if start == 0 and end == 0:
+            return
+        keep = self.keep_silence
+        segment = [start - keep if self._pending_start is None else self._pending_start, end + keep]
+        self._pending_start = None
+        if next_start is not None and next_start - keep < segment[1]:
+            segment[1] = (segment[1] + next_start - keep) // 2
+            self._pending_start = segment[1]
+        start, end = max(segment[0], 0), segment[1] if length_ms is None else min(segment[1], length_ms)
+        if end - start >= self.min_segment_len:
+            self._emitted.append([start, end])
+
+    def _take(self) -> List[List[int]]:
+        emitted, self._emitted = self._emitted, []
+        return emitted
+
+    # -- public ----------------------------------------------------------
+
+    def feed(self, samples: np.ndarray) -> List[List[int]]:
+        """Add the next chunk of samples; returns segments finalized by it"""
+        self._add_samples(samples)
+        # A window is final once all of its milliseconds have arrived
+        self._advance(self.total_ms - self.min_silence_len)
+        # A silence is final once no later window (not even the off-grid
+        # last one) can merge into it
+        if self._silence is not None and self._run is None \
+                and self._next_window - self.seek_step >= self._silence[1] + self.min_silence_len:
+            self._close_silence()
+        return self._take()
+
+    def finish(self) -> List[List[int]]:
+        """End of stream: flush the last windows and segments"""
+        n_samples = self.total_ms * self.samples_per_ms + len(self._partial)
+        length_ms = self.length_ms = round(n_samples / float(self.samples_per_ms))
+        if len(self._partial):
+            # pydub pads a slice running past the end with silence
+            padded = np.zeros(self.samples_per_ms * (length_ms - self.total_ms), dtype=np.int64)
+            padded[:min(len(self._partial), len(padded))] = self._partial[:len(padded)]
+            self._partial = np.zeros(0, dtype=np.int64)
+            if len(padded):
+                self._add_samples(padded)
+
+        if length_ms >= self.min_silence_len:
+            last_slice_start = length_ms - self.min_silence_len
+            self._advance(last_slice_start)
+            if last_slice_start % self.seek_step:
+                self._evaluate(np.array([last_slice_start], dtype=np.int64))
+        self._close_run()
+
+        if self._silence is not None:
+            self._close_silence(length_ms)
+        if self._prev_silence_end != length_ms:
+            self._add_nonsilent(self._prev_silence_end, length_ms, None, length_ms)
+        return self._take()
+
+
+def benchmark(path: str, min_silence_len: int = 300, silence_thresh: float = -35, keep_silence: int = 150,
+              seek_step: int = 50, max_seconds: Optional[float] = None) -> dict:
+    """Time pydub's split_on_silence against the vectorized detector on one file"""
+    from pydub import AudioSegment
+    from pydub.silence import split_on_silence
+
+    audio = AudioSegment.from_file(path)
+    if max_seconds:
+        audio = audio[:int(max_seconds * 1000)]
+    params = dict(min_silence_len=min_silence_len, silence_thresh=silence_thresh,
+                  keep_silence=keep_silence, seek_step=seek_step)
+
+    started = time.perf_counter()
+    pydub_chunks = split_on_silence(audio, **params)
+    pydub_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ranges = split_ranges_on_silence(samples_from_audio_segment(audio), audio.frame_rate,
+                                     channels=audio.channels, sample_width=audio.sample_width, **params)
+    numpy_seconds = time.perf_counter() - started
+
+    return {
+        "file": path,
+        "duration_s": round(len(audio) / 1000.0, 1),
+        "format": f"{audio.frame_rate}Hz x{audio.channels}",
+        "pydub_s": round(pydub_seconds, 3),
+        "numpy_s": round(numpy_seconds, 3),
+        "speedup": round(pydub_seconds / numpy_seconds, 1) if numpy_seconds else None,
+        "segments": len(ranges),
+        "same_cut_points": len(pydub_chunks) == len(ranges) and all(
+            chunk.raw_data == audio[start:end].raw_data for chunk, (start, end) in zip(pydub_chunks, ranges)),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark vectorized silence detection against pydub")
+    parser.add_argument('files', nargs='+', help='Audio files to split')
+    parser.add_argument('--min-silence-len', type=int, default=300)
+    parser.add_argument('--silence-thresh', type=float, default=-35)
+    parser.add_argument('--keep-silence', type=int, default=150)
+    parser.add_argument('--seek-step', type=int, default=50)
+    parser.add_argument('--max-seconds', type=float, help='Only use the first N seconds of each file')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    for path in args.files:
+        if not os.path.exists(path):
+            logger.error(f"❌ Not found: {path}")
+            continue
+        result = benchmark(path, args.min_silence_len, args.silence_thresh, args.keep_silence,
+                           args.seek_step, args.max_seconds)
+        status = "✅ same cut points" if result["same_cut_points"] else "⚠️ cut points differ"
+        logger.info(f"🔇 {result['file']} ({result['duration_s']}s, {result['format']}): "
+                    f"pydub {result['pydub_s']}s vs numpy {result['numpy_s']}s "
+                    f"(x{result['speedup']}), {result['segments']} segments, {status}")
+
+
+if __name__ == '__main__':
+    main()
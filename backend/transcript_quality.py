@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Transcript Quality Gate
+Decides whether a raw Whisper transcript needs the GPT-4o enhancement pass,
+using the verbose_json segment confidences (avg_logprob, no_speech_prob,
+compression_ratio) and a cheap Hebrew lexicon check. Clean transcripts skip
+the second round trip; only doubtful ones are sent for enhancement.
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+# Whisper segment thresholds (the same signals Whisper itself uses for fallback)
+MIN_AVG_LOGPROB = float(os.environ.get('ENHANCE_MIN_AVG_LOGPROB', -0.6))
+MAX_NO_SPEECH_PROB = float(os.environ.get('ENHANCE_MAX_NO_SPEECH_PROB', 0.5))
+MAX_COMPRESSION_RATIO = float(os.environ.get('ENHANCE_MAX_COMPRESSION_RATIO', 2.4))
+
+# Lexicon thresholds
+MIN_HEBREW_LETTER_RATIO = float(os.environ.get('ENHANCE_MIN_HEBREW_RATIO', 0.85))
+MIN_KNOWN_WORD_RATIO = float(os.environ.get('ENHANCE_MIN_KNOWN_WORD_RATIO', 0.5))
+
+# Set ENHANCE_TRANSCRIPTS=always to restore unconditional enhancement
+ENHANCE_MODE = os.environ.get('ENHANCE_TRANSCRIPTS', 'gated').lower()
+
+HEBREW_LETTER = re.compile(r'[א-ת]')
+LATIN_LETTER = re.compile(r'[A-Za-z]')
+WORD = re.compile(r'[א-ת׳״\'"]+')
+
+# One-letter prefixes (and, the, in, to, from, that, as) stripped before lookup
+HEBREW_PREFIXES = ('ו', 'ה', 'ב', 'ל', 'מ', 'ש', 'כ')
+
+# Frequent spoken-Hebrew words; enough to tell real speech from garbled output
+COMMON_HEBREW_WORDS = set("""
+אני אתה את הוא היא אנחנו אתם אתן הם הן לי לך לו לה לנו לכם להם שלי שלך שלו שלה שלנו שלכם שלהם
+אותי אותך אותו אותה אותנו אותם זה זאת זו אלה אלו כל כך כן לא גם רק עוד כבר עכשיו אז פה כאן שם
+מה מי איך למה מתי איפה כמה איזה איזו אם כי אבל או עם על אל של את מן בין לפני אחרי תחת בלי
+יש אין היה היתה היו יהיה תהיה להיות הייתי היינו אמר אמרה אמרתי אומר אומרת לעשות עושה עשיתי
+רוצה רוצים רציתי יודע יודעת יודעים ידעתי חושב חושבת חושבים חשבתי מרגיש מרגישה הרגשתי
+אוהב אוהבת אהבתי צריך צריכה צריכים יכול יכולה יכולים יכולתי בא באה באים הולך הולכת הולכים
+ללכת לבוא לראות רואה ראיתי לדבר מדבר מדברת לשמוע שומע שמעתי לקחת לתת נותן לחשוב להגיד
+טוב טובה טובים רע רעה יפה גדול גדולה קטן קטנה חדש חדשה ישן הרבה קצת מאוד ממש סתם בסדר
+נכון באמת אולי בטח ברור כאילו יאללה וואו אוקיי שלום תודה בבקשה סליחה בוקר ערב לילה יום
+היום אתמול מחר שנה שבוע רגע זמן פעם פעמים דבר דברים משהו מישהו אף אחד אחת שני שתיים שלוש
+בית עבודה חבר חברה חברים אמא אבא ילד ילדה ילדים אנשים איש אישה משפחה כסף אוכל מים
+שמח שמחה עצוב עצב כועס כעס פחד מפחד אהבה דאגה מתרגש הפתעה מבולבל עייף רגוע לחוץ
+ככה שוב תמיד אף פעם אחרת מאז עד בגלל לכן למרות כמו יותר פחות הכי ביחד לבד
+""".split())
+
+# Known Whisper hallucinations on silence / noise
+HALLUCINATION_PHRASES = ('טקסט בעברית', 'תודה שצפיתם', 'כתוביות', 'תרגום', 'הירשמו לערוץ')
+
+
+def _known(word: str) -> bool:
+    if word in COMMON_HEBREW_WORDS:
+        return True
+    # Strip up to two prefix letters: "וכשאני" → "כשאני" → "שאני"
+    stripped = word
+    for _ in range(2):
+        if len(stripped) > 2 and stripped[0] in HEBREW_PREFIXES:
+            stripped = stripped[1:]
+            if stripped in COMMON_HEBREW_WORDS:
+                return True
+    return False
+
+
+def lexicon_metrics(text: str) -> Dict[str, Any]:
+    """Letter-script and known-word ratios for a Hebrew transcript"""
+    hebrew_letters = len(HEBREW_LETTER.findall(text))
+    latin_letters = len(LATIN_LETTER.findall(text))
+    letters = hebrew_letters + latin_letters
+    words = [w.strip('\'"') for w in WORD.findall(text)]
+    words = [w for w in words if w]
+    known = sum(1 for w in words if _known(w))
+    return {
+        "hebrew_letter_ratio": round(hebrew_letters / letters, 3) if letters else 0.0,
+        "known_word_ratio": round(known / len(words), 3) if words else 0.0,
+        "word_count": len(words),
+    }
+
+
+def assess_transcript(text: str, segments: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Decide whether a raw Whisper transcript should go through GPT enhancement.
+    Returns {"enhance": bool, "reasons": [...], "metrics": {...}, "mode": ...}.
+    """
+    text = (text or '').strip()
+    reasons = []
+    metrics: Dict[str, Any] = {}
+
+    if segments:
+        avg_logprobs = [s.get('avg_logprob') for s in segments if s.get('avg_logprob') is not None]
+        no_speech = [s.get('no_speech_prob') for s in segments if s.get('no_speech_prob') is not None]
+        compression = [s.get('compression_ratio') for s in segments if s.get('compression_ratio') is not None]
+        metrics.update({
+            "segments": len(segments),
+            "min_avg_logprob": round(min(avg_logprobs), 3) if avg_logprobs else None,
+            "max_no_speech_prob": round(max(no_speech), 3) if no_speech else None,
+            "max_compression_ratio": round(max(compression), 3) if compression else None,
+        })
+        if avg_logprobs and min(avg_logprobs) < MIN_AVG_LOGPROB:
+            reasons.append("low_avg_logprob")
+        if no_speech and max(no_speech) > MAX_NO_SPEECH_PROB:
+            reasons.append("possible_no_speech")
+        if compression and max(compression) > MAX_COMPRESSION_RATIO:
+            reasons.append("repetitive_output")
+    else:
+        reasons.append("no_confidence_data")
+
+    lexicon = lexicon_metrics(text)
+    metrics.update(lexicon)
+    if lexicon["hebrew_letter_ratio"] < MIN_HEBREW_LETTER_RATIO:
+        reasons.append("non_hebrew_characters")
+    if lexicon["word_count"] >= 3 and lexicon["known_word_ratio"] < MIN_KNOWN_WORD_RATIO:
+        reasons.append("unknown_words")
+    if any(phrase in text for phrase in HALLUCINATION_PHRASES):
+        reasons.append("known_hallucination")
+
+    if ENHANCE_MODE == 'always':
+        reasons.append("forced")
+    elif ENHANCE_MODE == 'never':
+        reasons = []
+
+    return {"enhance": bool(reasons), "reasons": reasons, "metrics": metrics, "mode": ENHANCE_MODE}
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Transcription Cache
+Transcripts keyed by the SHA-256 of the decoded audio (16 kHz mono 16-bit
+PCM, the format every transcription path preprocesses to) plus model name
+and language. Identical audio in a re-segmented, re-run or copied
+conversation is transcribed once, whichever transcription path is used.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPTION_CACHE_DIR = os.environ.get('TRANSCRIPTION_CACHE_DIR', os.path.join('cache', 'transcriptions'))
+TRANSCRIPTION_CACHE_ENABLED = os.environ.get('TRANSCRIPTION_CACHE', '1').lower() not in ('0', 'false', 'no')
+
+# Canonical PCM format hashed for cache keys
+PCM_FRAME_RATE = 16000
+PCM_CHANNELS = 1
+PCM_SAMPLE_WIDTH = 2
+
+
+def canonical_pcm_sha256(audio) -> str:
+    """SHA-256 of a pydub AudioSegment converted to 16 kHz mono 16-bit PCM"""
+    audio = audio.set_frame_rate(PCM_FRAME_RATE).set_channels(PCM_CHANNELS).set_sample_width(PCM_SAMPLE_WIDTH)
+    return hashlib.sha256(audio.raw_data).hexdigest()
+
+
+def pcm_sha256_for_file(audio_path: str) -> Optional[str]:
+    """Hash a file's canonical PCM (read from its decoded sidecar); None if it cannot be decoded"""
+    try:
+        from backend.pcm_cache import load_pcm, pcm_sha256
+        return pcm_sha256(load_pcm(audio_path))
+    except Exception as e:
+        logger.warning(f"⚠️ Could not hash audio for transcription cache: {e}")
+        return None
+
+
+def make_transcription_key(pcm_hash: str, model: str, language: str) -> str:
+    return hashlib.sha256(f"{pcm_hash}|{model}|{language}".encode('utf-8')).hexdigest()
+
+
+class TranscriptionCache:
+    """One JSON file per entry under <cache_dir>/<key[:2]>/<key>.json"""
+
+    def __init__(self, cache_dir: str = TRANSCRIPTION_CACHE_DIR, enabled: bool = TRANSCRIPTION_CACHE_ENABLED):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get_entry(self, pcm_hash: Optional[str], model: str, language: str = 'he') -> Optional[Dict[str, Any]]:
+        """Full cached entry (text plus any extra fields), or None on a miss"""
+        if not self.enabled or not pcm_hash:
+            return None
+        key = make_transcription_key(pcm_hash, model, language)
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(f"💾 Transcription cache hit ({model}, {pcm_hash[:12]})")
+        return entry
+
+    def get(self, pcm_hash: Optional[str], model: str, language: str = 'he') -> Optional[str]:
+        """Cached transcript text, or None on a miss"""
+        entry = self.get_entry(pcm_hash, model, language)
+        return entry.get('text') if entry else None
+
+    def put(self, pcm_hash: Optional[str], model: str, text: str, language: str = 'he',
+            extra: Optional[Dict[str, Any]] = None):
+        """Store a non-empty transcript; failures are logged and ignored"""
+        if not self.enabled or not pcm_hash or not text:
+            return
+        key = make_transcription_key(pcm_hash, model, language)
+        path = self._path(key)
+        entry = {
+            "key": key,
+            "pcm_sha256": pcm_hash,
+            "model": model,
+            "language": language,
+            "text": text,
+            "created_at": datetime.now().isoformat(),
+            **(extra or {})
+        }
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{int(time.time() * 1000)}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write transcription cache entry: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "dir": self.cache_dir, "hits": self.hits, "misses": self.misses}
+
+
+transcription_cache = TranscriptionCache()
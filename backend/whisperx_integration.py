@@ -10,8 +10,20 @@ import json
 from pathlib import Path
 import logging
 
+from backend.diarization import diarize_files
+
 logger = logging.getLogger(__name__)
 
+def iter_segments(emotion_data):
+    """
+    (filename, segment) pairs of an emotion file: a dict keyed by segment
+    filename (emotionsN_ai_analyzed.json), or an older list of segments with
+    a "file" field
+    """
+    if isinstance(emotion_data, dict):
+        return [(filename, segment) for filename, segment in emotion_data.items() if isinstance(segment, dict)]
+    return [(segment.get("file", ""), segment) for segment in emotion_data if isinstance(segment, dict)]
+
 def enhance_transcript_with_whisperx(mp3_path, device="cpu", hf_token=None):
     """
     Enhanced transcription using WhisperX instead of regular Whisper
@@ -96,10 +108,11 @@ def update_emotion_json_with_whisperx(emotion_json_path, use_whisperx=True, hf_t
     audio_dir = Path(emotion_json_path).parent
     updated_count = 0
     
-    for i, segment in enumerate(emotion_data):
-        audio_file = audio_dir / segment.get("file", "")
+    segments = iter_segments(emotion_data)
+    for i, (filename, segment) in enumerate(segments):
+        audio_file = audio_dir / filename
         
-        if not audio_file.exists():
+        if not filename or not audio_file.is_file():
             logger.warning(f"Audio file not found: {audio_file}")
             continue
         
@@ -134,7 +147,18 @@ def update_emotion_json_with_whisperx(emotion_json_path, use_whisperx=True, hf_t
                 segment["speaker"] = 0 if speaker_id == "SPEAKER_00" else 1
             
             updated_count += 1
-            logger.info(f"✅ Updated segment {i+1}: {segment['file']}")
+            logger.info(f"✅ Updated segment {i+1}: {filename}")
+    
+    # pyannote needs a HuggingFace token; without one assign speakers with the local CPU diarizer
+    if not hf_token:
+        segment_files = [str(audio_dir / filename) for filename, _ in segments
+                         if filename and (audio_dir / filename).exists()]
+        speakers = diarize_files(segment_files)
+        for filename, segment in segments:
+            speaker = speakers.get(str(audio_dir / filename))
+            if speaker is not None:
+                segment["speaker"] = speaker
+                segment["speaker_source"] = "diarizer"
     
     # Save updated data
     output_path = emotion_json_path.replace('.json', '_whisperx.json')
@@ -155,8 +179,8 @@ def compare_transcription_quality(original_json, whisperx_json):
     print("\n📊 Transcription Comparison:")
     print("=" * 60)
     
-    for i, (orig, wx) in enumerate(zip(original[:5], whisperx[:5])):
-        print(f"\n🎵 {orig['file']}:")
+    for (filename, orig), (_, wx) in zip(iter_segments(original)[:5], iter_segments(whisperx)[:5]):
+        print(f"\n🎵 {filename}:")
         print(f"Original: {orig.get('transcript', 'N/A')[:100]}")
         print(f"WhisperX: {wx.get('transcript', 'N/A')[:100]}")
         
@@ -165,7 +189,7 @@ def compare_transcription_quality(original_json, whisperx_json):
 
 if __name__ == "__main__":
     # Example: Update an existing emotion JSON with WhisperX
-    emotion_file = "conversations/convo1/emotions1.json"
+    emotion_file = "conversations/convo1/emotions1_ai_analyzed.json"
     
     if Path(emotion_file).exists():
         print("🚀 Upgrading transcription with WhisperX...")
@@ -787,6 +787,8 @@ const blobAsciiColor = [0, 0, 0]; // Black
         
         let isCurrentlyPlaying = false;
         let isMasterMuted = false;
+        // Decoded per-segment loudness envelopes (linear RMS per frame), keyed by segment file
+        const loudnessEnvelopes = new Map();
         let lastVolumeBeforeMute = 0.8;
         let isReadyToDrawVisualization = false;
         let visualOnlyMode = false; // Track when audio fails and we're in visual-only mode
@@ -2947,6 +2949,55 @@ const blobAsciiColor = [0, 0, 0]; // Black
             
         }
 
+        // Decode a segment's base64 uint8 dBFS envelope once into linear RMS levels
+        function getLoudnessEnvelope(file) {
+            const encoded = emotionData?.[file]?.loudness_envelope;
+            if (!encoded || !encoded.data) return null;
+            const cached = loudnessEnvelopes.get(file);
+            if (cached && cached.data === encoded.data) return cached;
+            const bytes = Uint8Array.from(atob(encoded.data), c => c.charCodeAt(0));
+            const floor = encoded.floor_dbfs ?? -60;
+            const levels = new Float32Array(bytes.length);
+            for (let i = 0; i < bytes.length; i++) {
+                levels[i] = bytes[i] === 0 ? 0 : Math.pow(10, (floor - floor * bytes[i] / 255) / 20);
+            }
+            const envelope = { data: encoded.data, hz: encoded.hz || 50, levels };
+            loudnessEnvelopes.set(file, envelope);
+            return envelope;
+        }
+        
+        // Level of the playing segment at its playback position, null without an envelope
+        function getEnvelopeLevel() {
+            if (!isCurrentlyPlaying || !convo || !convo[currentIndex]) return null;
+            const sfx = soundFiles[currentIndex];
+            if (!sfx || typeof sfx.isPlaying !== 'function' || !sfx.isPlaying()) return null;
+            const envelope = getLoudnessEnvelope(convo[currentIndex].file);
+            if (!envelope || envelope.levels.length === 0) return null;
+            const position = sfx.currentTime() * envelope.hz;
+            const last = envelope.levels.length - 1;
+            const i = Math.max(0, Math.min(last, Math.floor(position)));
+            return p.lerp(envelope.levels[i], envelope.levels[Math.min(last, i + 1)], Math.max(0, Math.min(1, position - i)));
+        }
+        
+        // Emotion files written before envelopes existed: fetch them once (no-op on static hosting)
+        function loadMissingLoudnessEnvelopes(folderPath) {
+            const match = folderPath.match(/convo[^/]+/);
+            if (!match || !emotionData) return;
+            const files = Object.keys(emotionData).filter(key => key !== 'conversation_details');
+            if (files.every(file => emotionData[file]?.loudness_envelope)) return;
+            fetch(`/api/loudness-envelopes/${match[0]}`)
+                .then(response => response.ok ? response.json() : null)
+                .then(result => {
+                    if (!result?.envelopes || !emotionData) return;
+                    Object.entries(result.envelopes).forEach(([file, envelope]) => {
+                        if (emotionData[file] && !emotionData[file].loudness_envelope) {
+                            emotionData[file].loudness_envelope = envelope;
+                        }
+                    });
+                })
+                .catch(() => {});
+        }
+        
         // Function to start continuous segment loop for focused editing
         function startContinuousSegmentLoop() {
             if (!soundFiles || !convo || currentIndex >= soundFiles.length) {
@@ -3893,6 +3944,7 @@ const blobAsciiColor = [0, 0, 0]; // Black
                         }
                         
                         emotionData = loadedData;
+                        loadMissingLoudnessEnvelopes(folderPath);
                         convo = []; 
                         let fileNames = Object.keys(emotionData).filter(key => key !== 'conversation_details'); 
                         fileNames.sort();
@@ -4834,7 +4886,14 @@ const blobAsciiColor = [0, 0, 0]; // Black
                 }
             }
 
-            if (analyzers?.masterAnalyzer) {
+            const envelopeVol = getEnvelopeLevel();
+            if (envelopeVol !== null) {
+                // Precomputed envelope of the playing segment: no audio analysis needed
+                const playingSpeaker = convo[currentIndex].speaker;
+                for (let i = 0; i < blobs.length; i++) {
+                    blobs[i].setAudioLevel(i === playingSpeaker ? envelopeVol : envelopeVol * 0.3);
+                }
+            } else if (analyzers?.masterAnalyzer) {
                 let masterVol = analyzers.masterAnalyzer.getLevel();
                 
                 for (let i = 0; i < blobs.length; i++) {
@@ -1,8 +1,42 @@
-bind = "0.0.0.0:8000"
-workers = 2
-worker_class = "sync"
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+# JSON files are written atomically and changed by locked read-modify-write (per-file fcntl locks),
+# so concurrent workers do not overwrite each other's changes
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread" if threads > 1 else "sync")
 worker_connections = 1000
-timeout = 120
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
 max_requests = 1000
 max_requests_jitter = 50
 preload_app = True
+
+
+def worker_exit(server, worker):
+    # Write segment edits still in the emotion store's write-behind buffer
+    from backend.emotion_store import emotion_store
+    emotion_store.flush()
+
+
+def post_worker_init(worker):
+    # Archive jobs run in one worker at a time: the one holding the background-jobs lock
+    # (released when it exits, so its replacement takes over)
+    import fcntl
+    from backend.json_files import JSON_LOCK_DIR
+    os.makedirs(JSON_LOCK_DIR, exist_ok=True)
+    lock_file = open(os.path.join(JSON_LOCK_DIR, "background-jobs.lock"), "a")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return
+    worker.background_jobs_lock = lock_file
+
+    # Bring the fingerprint index up to date with the archive (only new or changed files are decoded)
+    from backend.audio_fingerprint import fingerprint_index
+    fingerprint_index.update_async()
+
+    # Sweep backup copies into the backup store and apply its retention policy, now and every few hours
+    from backend.backup_store import backup_store
+    backup_store.start_maintenance()
@@ -1,4 +1,4 @@
-from flask import Flask, send_from_directory, request, jsonify, render_template_string, send_file
+from flask import Flask, send_from_directory, request, jsonify, render_template_string, send_file, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
@@ -11,6 +11,8 @@ import uuid
 import base64
 import time
 import threading
+import functools
+import concurrent.futures
 from io import BytesIO
 import logging
 import tempfile
@@ -23,6 +25,11 @@ try:
 except ImportError:
     print("⚠️ python-dotenv not installed, using system environment variables only")
 
+# Offline load testing: OPENAI_MOCK_SERVER_URL points every OpenAI client at backend/mock_openai_server.py
+from backend.openai_client import use_mock_server
+if use_mock_server():
+    print(f"🧪 Using mock OpenAI server: {os.environ['OPENAI_MOCK_SERVER_URL']}")
+
 # Validate critical environment variables
 def validate_environment():
     """Validate that all required environment variables are properly set"""
@@ -77,6 +84,74 @@ except ImportError:
     VIDEO_CAPTURE_AVAILABLE = False
     print("⚠️ Video capture not available - selenium and related dependencies missing")
 
+# OpenAI client with retries, backoff and circuit breaker
+from backend.openai_client import create_openai_client, CircuitOpenError, is_circuit_open, get_breaker_status
+
+# Versioned prompt templates with a stable, cacheable prefix
+from backend.prompt_templates import get_prompt_templates, compute_config_version, make_cache_key, detection_cache
+
+# Per-call latency, token and cost accounting
+from backend.model_metrics import model_job, record_cache_hit, get_metrics_snapshot, format_prometheus
+
+# Transcripts keyed by decoded-audio hash + model + language, shared by every transcription path
+from backend.transcription_cache import transcription_cache
+
+# Decides per segment whether the GPT-4o transcript enhancement pass is needed
+from backend.transcript_quality import assess_transcript
+
+# Reports top-level fields of a streamed JSON completion as they complete
+from backend.incremental_json import IncrementalJSONObjectParser
+
+# Every audio file is decoded once to a memory-mapped 16kHz mono int16 sidecar
+from backend.pcm_cache import stream_pcm, PCM_SAMPLE_RATE
+
+# Vectorized RMS / peak / ZCR / spectral centroid / speech-ratio features
+from backend.audio_features import analyze_audio_file, analyze_audio_files
+
+# CPU speaker diarization (MFCC voice embeddings cached beside the PCM sidecars, 2-speaker clustering)
+from backend.diarization import diarize_files
+
+# 50 Hz uint8 loudness envelopes per segment, served with the emotion JSON for playback
+from backend.loudness_envelope import (
+    envelopes_for_ranges, store_segment_envelopes, conversation_envelopes, EnvelopeBuilder
+)
+
+# Transcription audio preprocessed in memory (NumPy loudness, WAV bytes), memoized per file version
+from backend.audio_preprocessing import prepare_audio_for_transcription
+
+# Vectorized silence detection (same cut points as pydub's split_on_silence)
+from backend.silence_detection import (
+    split_ranges_on_silence, samples_from_audio_segment, StreamingSilenceSplitter, SILENCE_HYSTERESIS_DB
+)
+
+# Chunked resumable uploads with a rolling SHA-256, and stored recordings indexed by hash
+from backend.chunked_upload import upload_manager, recording_index, save_stream_with_sha256, UploadError
+
+# Spectral-peak fingerprint index of all recordings and segments (duplicate / overlap detection)
+from backend.audio_fingerprint import fingerprint_index, conversation_files
+
+# Atomic JSON writes and per-file (thread + fcntl) locks for read-modify-write cycles
+from backend.json_files import atomic_write_json, update_json, file_lock
+
+# Parsed emotion files cached in memory (mtime/size validated) and the single write path for them
+from backend.emotion_store import emotion_store, thaw
+
+# Field-level change journal of emotion files (undo history, restore to a point in time)
+from backend.change_journal import entries as journal_entries, restore as restore_emotion_file, parse_timestamp
+
+# Content-addressed, deduplicated backup copies with a retention policy (backups/)
+from backend.backup_store import backup_store
+
+CONVERSATIONS_CONFIG_FILE = os.path.join('config', 'conversations_config.json')
+
+# All segments of a file cut in one ffmpeg call (stream copy for MP3, no per-segment re-encode)
+from backend.audio_cutter import cut_segments
+
+# Cache model ids for each transcription pipeline (bump the suffix when its prompts change)
+TRANSCRIBE_MODEL_WHISPER_ENHANCED = "whisper-1+gpt-4o-gated-v1"
+TRANSCRIBE_MODEL_GPT4_DIRECT = "whisper-1+gpt-4o-direct-v1"
+TRANSCRIBE_MODEL_WHISPERX = "whisperx-large-v2"
+
 app = Flask(__name__)
 CORS(app)
 
@@ -87,8 +162,9 @@ def load_emotions_config():
     try:
         emotions_config_path = os.path.join('config', 'emotions_config.json')
         if os.path.exists(emotions_config_path):
-            with open(emotions_config_path, 'r', encoding='utf-8') as f:
-                emotions_config = json.load(f)
+            with open(emotions_config_path, 'rb') as f:
+                raw_config = f.read()
+            emotions_config = json.loads(raw_config.decode('utf-8'))
             
             # Extract active emotions in Hebrew and English
             active_emotions_hebrew = []
@@ -110,7 +186,8 @@ def load_emotions_config():
                 'config': emotions_config,
                 'active_hebrew': active_emotions_hebrew,
                 'active_english': active_emotions_english,
-                'mapping': emotion_mapping
+                'mapping': emotion_mapping,
+                'version': compute_config_version(raw_config)  # Keys prompt templates and caches
             }
     except Exception as e:
         print(f"⚠️ Failed to load emotions config: {str(e)}")
@@ -121,7 +198,8 @@ def load_emotions_config():
         'config': {},
         'active_hebrew': default_emotions,
         'active_english': ['happiness', 'sadness', 'anger', 'fear', 'surprise', 'disgust', 'neutral', 'curiosity'],
-        'mapping': dict(zip(['happiness', 'sadness', 'anger', 'fear', 'surprise', 'disgust', 'neutral', 'curiosity'], default_emotions))
+        'mapping': dict(zip(['happiness', 'sadness', 'anger', 'fear', 'surprise', 'disgust', 'neutral', 'curiosity'], default_emotions)),
+        'version': 'default'
     }
 
 def get_emotion_from_config(detected_emotion, emotions_data):
@@ -178,6 +256,30 @@ def get_emotion_from_config(detected_emotion, emotions_data):
     else:
         return 'נייטרלי'
 
+# ==================== MODEL CALL METRICS ====================
+
+def track_model_job(job_name):
+    """
+    Attribute every model call made by a route to one job; the job summary is
+    appended to the conversation folder named in the request, if any.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with model_job(job_name, request_conversation_dir()):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def request_conversation_dir():
+    """Conversation folder named in the current request's JSON or form, if it exists"""
+    data = request.get_json(silent=True) or request.form or {}
+    for key in ('conversation', 'conversationFolder', 'conversation_id', 'conversation_key'):
+        value = data.get(key) if hasattr(data, 'get') else None
+        if isinstance(value, str) and value and os.path.isdir(os.path.join("conversations", value)):
+            return os.path.join("conversations", value)
+    return None
+
 # ==================== FLASK ROUTES ====================
 
 @app.route('/')
@@ -363,6 +465,7 @@ def test_api():
     return jsonify({"status": "success", "message": "API is working!"})
 
 @app.route('/api/test-analysis', methods=['POST'])
+@track_model_job('test-analysis')
 def test_analysis():
     """
     Test emotion analysis endpoint for admin panel
@@ -405,12 +508,12 @@ def test_analysis():
         # Test actual OpenAI connection if text provided
         if text:
             try:
-                import openai
-                client = openai.OpenAI(api_key=api_key)
+                client = create_openai_client(api_key)
                 
                 # Simple test call
                 response = client.chat.completions.create(
                     model="gpt-4o",
+                    metrics_stage="test_analysis",
                     messages=[{"role": "user", "content": f"Analyze emotion in this Hebrew text and respond with just one word emotion in Hebrew: {text}"}],
                     max_tokens=10,
                     temperature=0.3
@@ -455,6 +558,7 @@ def test_analysis():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/analyze-segment', methods=['POST'])
+@track_model_job('analyze-segment')
 def analyze_segment():
     """
     Analyze a single segment with AI + Audio Analysis
@@ -464,12 +568,16 @@ def analyze_segment():
         "mp3File": "001.mp3",
         "transcript": "text to analyze",
         "currentEmotions": ["neutral"],
-        "speaker": 0
+        "speaker": 0,
+        "wait_for_ai": false
     }
+
+    By default the local Hebrew analyzer answers immediately and the GPT
+    analysis runs in the background; the upgraded fields are written to the
+    emotion file under a new analysis_version which the frontend polls via
+    /api/analysis-status. Set "wait_for_ai": true to block on GPT instead.
     """
     try:
-        import openai
-        
         data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
@@ -496,177 +604,104 @@ def analyze_segment():
             return jsonify({"error": "OpenAI API key appears to be incomplete"}), 500
         
         try:
-            client = openai.OpenAI(api_key=api_key)
+            client = create_openai_client(api_key)
             print(f"🎯 Analyzing segment with OpenAI: {conversation}/{mp3_file}")
         except Exception as e:
             print(f"❌ Failed to create OpenAI client: {str(e)}")
             return jsonify({"error": "Failed to initialize OpenAI client"}), 500
         
-        # Analyze audio file if available
-        audio_analysis = {}
-        if conversation and mp3_file:
-            audio_path = os.path.join("conversations", conversation, mp3_file)
-            if os.path.exists(audio_path):
-                try:
-                    audio_analysis = analyze_volume_advanced(audio_path)
-                    print(f"🔊 Audio analysis: {audio_analysis}")
-                except Exception as e:
-                    print(f"⚠️ Audio analysis failed: {str(e)}")
-                    audio_analysis = {"volume": 0.5, "energy": 0.5, "duration": 1.0}
-        
         # Get the current speaker from emotion data to ensure consistent positioning
         current_speaker = None
-        if conversation and mp3_file:
-            emotion_file = f"conversations/{conversation}/emotions{conversation[5:]}_ai_analyzed.json"
-            if os.path.exists(emotion_file):
-                try:
-                    with open(emotion_file, 'r', encoding='utf-8') as f:
-                        emotion_data = json.load(f)
-                    if mp3_file in emotion_data:
-                        current_speaker = emotion_data[mp3_file].get('speaker', 0)
-                        print(f"🎭 Found existing speaker assignment: {current_speaker}")
-                except Exception as e:
-                    print(f"⚠️ Failed to read speaker from emotion data: {str(e)}")
-                    current_speaker = 0
+        existing_segment = None
+        emotion_file = get_segment_emotion_file(conversation) if conversation else None
+        if emotion_file and mp3_file and os.path.exists(emotion_file):
+            try:
+                existing_segment = emotion_store.get_segment(emotion_file, mp3_file)
+                if existing_segment is not None:
+                    current_speaker = existing_segment.get('speaker', 0)
+                    print(f"🎭 Found existing speaker assignment: {current_speaker}")
+            except Exception as e:
+                print(f"⚠️ Failed to read speaker from emotion data: {str(e)}")
+                current_speaker = 0
 
         # If no speaker found, default to 0
         if current_speaker is None:
             current_speaker = 0
 
-        # Analyze with OpenAI - now passing speaker information and audio analysis
-        ai_analysis = analyze_text_emotion_advanced(transcript, client, speaker=current_speaker, audio_analysis=audio_analysis)
+        auto_save = data.get('auto_save', True)  # Default to True for automatic saving
+        # The upgrade is published through the emotion file, so it needs a segment to land in
+        hybrid = not data.get('wait_for_ai', False) and auto_save and existing_segment is not None
+
+        if not hybrid:
+            audio_analysis = analyze_segment_audio(conversation, mp3_file)
+            # Analyze with OpenAI - now passing speaker information and audio analysis
+            ai_analysis = analyze_text_emotion_advanced(transcript, client, speaker=current_speaker, audio_analysis=audio_analysis)
+        else:
+            # Instant local answer; reuse the last audio analysis until the background job refreshes it
+            audio_analysis = {
+                key[len("audio_"):]: existing_segment[key]
+                for key in ("audio_volume", "audio_energy", "audio_duration") if key in existing_segment
+            }
+            ai_analysis = create_local_emotion_response_advanced(transcript, speaker=current_speaker, reason="hybrid_pending")
         
         if not ai_analysis or "error" in ai_analysis:
             return jsonify({"error": "AI analysis failed"}), 500
         
-        # Use detected emotions (multiple) from AI analysis
-        detected_emotions = ai_analysis.get("emotions_detected", [ai_analysis.get("emotion_detected", "נייטרלי")])
-        primary_emotion = ai_analysis.get("primary_emotion", detected_emotions[0] if detected_emotions else "נייטרלי")
-        
-        print(f"🎭 AI detected emotions: {detected_emotions} (primary: {primary_emotion})")
-        
         # Load current emotions configuration to ensure detected emotions are available
         emotions_data = load_emotions_config()
-        
-        # Validate and map each emotion
-        validated_emotions = []
-        emotion_keys = []
-        
-        for detected_emotion in detected_emotions:
-            # Use emotion validation to map to existing emotions or ensure it's available
-            validated_emotion = get_emotion_from_config(detected_emotion, emotions_data)
-            
-            # Find the corresponding English key for the validated emotion
-            emotion_key = None
-            for eng_key, config in emotions_data['config'].items():
-                if config.get('hebrew') == validated_emotion or eng_key == validated_emotion:
-                    emotion_key = eng_key
-                    break
-            
-            # If no matching key found, try to find by the emotion name itself
-            if not emotion_key:
-                emotion_key = validated_emotion
-            
-            # Add to lists if not already present
-            if validated_emotion not in validated_emotions:
-                validated_emotions.append(validated_emotion)
-                emotion_keys.append(emotion_key)
-            
-            # If the detected emotion was mapped to something else, log it
-            if validated_emotion != detected_emotion:
-                print(f"🎭 AI detected emotion: {detected_emotion} → validated: {validated_emotion} → key: {emotion_key}")
-            else:
-                print(f"🎭 AI detected emotion: {validated_emotion} → key: {emotion_key}")
-        
-        # Combine AI analysis with audio analysis
-        combined_analysis = {
-            "emotions": emotion_keys,  # Now supports multiple emotions
-            "blur": ai_analysis.get("blur", 0),
-            "shine": ai_analysis.get("spark", 0),
-            "humor": ai_analysis.get("humor_score", 0),
-            "blobSize": ai_analysis.get("blob_size", 3),
-            "blobStrength": ai_analysis.get("blob_intensity", 1000),
-            "gridResolution": ai_analysis.get("grid_resolution", 60),  # This should now use our calculated value
-            "confidence": 0.95,
-            "ai_analyzed": True,
-            "audio_volume": audio_analysis.get("volume", 0.5),
-            "audio_energy": audio_analysis.get("energy", 0.5),
-            "audio_duration": audio_analysis.get("duration", 1.0),
-            # Include emotions configuration info for frontend
-            "available_emotions": emotions_data['active_hebrew'],
-            "emotion_mapping": emotions_data['mapping'],
-            "detected_emotions_original": detected_emotions,  # Keep original detected emotions
-            "primary_emotion": primary_emotion
-        }
+        combined_analysis, emotion_keys = build_segment_analysis(ai_analysis, audio_analysis, emotions_data)
         
         print(f"✅ Combined analysis result: {combined_analysis}")
         
         # Auto-save detected emotions to JSON file if requested
-        auto_save = data.get('auto_save', True)  # Default to True for automatic saving
         segment_updates = {}  # Track what was actually saved
+        upgrade = None
         
         if auto_save and conversation and mp3_file:
             try:
-                # Construct emotion file path
-                emotion_file = f"conversations/{conversation}/emotions{conversation[5:]}_ai_analyzed.json"
-                
                 if os.path.exists(emotion_file):
-                    # Read current emotion data
-                    with open(emotion_file, 'r', encoding='utf-8') as f:
-                        emotion_data = json.load(f)
-                    
-                    # Update the segment with detected emotion and analysis parameters
-                    if mp3_file in emotion_data:
-                        # Ensure consistent blobHomeRegion based on speaker
-                        blob_home_region = "center-left"  # Default for דובר 1
-                        if current_speaker == 0:
-                            blob_home_region = "center-left"   # דובר 1 always LEFT
-                        elif current_speaker == 1:
-                            blob_home_region = "center-right"  # דובר 2 always RIGHT
-                        else:
-                            blob_home_region = "center"        # Silence or unknown
-                        
-                        updates = {
-                            "emotions": emotion_keys,
-                            "blur": ai_analysis.get("blur", 0),
-                            "shine": ai_analysis.get("spark", 0),
-                            "humor": ai_analysis.get("humor_score", 0),
-                            "blobSize": ai_analysis.get("blob_size", 3),
-                            "blobStrength": ai_analysis.get("blob_intensity", 1000),
-                            "gridResolution": ai_analysis.get("grid_resolution", 60),  # Will use calculated value from AI
-                            "blobHomeRegion": blob_home_region,  # Ensure consistent positioning
-                            "ai_analyzed": True,
-                            "ai_analysis_date": datetime.now().isoformat(),
-                            "ai_confidence": 95,
-                            "ai_insights": ai_analysis.get("summary", "AI analysis completed"),
-                            "transcript": transcript,  # Update transcript if changed
-                            "words": transcript,
-                            "audio_volume": audio_analysis.get("volume", 0.5),
-                            "audio_energy": audio_analysis.get("energy", 0.5),
-                            "audio_duration": audio_analysis.get("duration", 1.0)
-                        }
-                        
-                        print(f"🎭 Auto-save enforcing: speaker {current_speaker} → blobHomeRegion: {blob_home_region}")
-                        
-                        # Apply updates to the segment
-                        for key, value in updates.items():
-                            emotion_data[mp3_file][key] = value
-                        
+                    updates = build_segment_updates(ai_analysis, emotion_keys, audio_analysis, transcript, current_speaker)
+                    updates["analysis_status"] = "pending_upgrade" if hybrid else (
+                        "local_fallback" if updates["pending_ai_upgrade"] else "ai")
+                    version = save_segment_analysis(emotion_file, mp3_file, updates)
+
+                    if version is not None:
                         # Store the updates for frontend notification
                         segment_updates = updates.copy()
-                        
-                        # Create backup before saving
-                        backup_file = f"{emotion_file}.backup.{int(datetime.now().timestamp())}"
-                        with open(backup_file, 'w', encoding='utf-8') as f:
-                            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
-                        
-                        # Save updated emotion data
-                        with open(emotion_file, 'w', encoding='utf-8') as f:
-                            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
-                        
-                        print(f"💾 Auto-saved detected emotion '{emotion_key}' for {conversation}/{mp3_file}")
+                        segment_updates["analysis_version"] = version
+                        print(f"💾 Auto-saved detected emotion '{emotion_keys[0] if emotion_keys else ''}' for {conversation}/{mp3_file}")
                         combined_analysis["auto_saved"] = True
                         combined_analysis["updated_segment"] = segment_updates
+                        combined_analysis["analysis_version"] = version
+
+                        if hybrid:
+                            future = _analysis_upgrade_executor.submit(
+                                run_segment_analysis_upgrade, api_key, conversation, mp3_file,
+                                transcript, current_speaker, version, time.time(), updates
+                            )
+                            upgrade = {
+                                "status": "pending",
+                                "conversation": conversation,
+                                "filename": mp3_file,
+                                "version": version,
+                                "status_url": f"/api/analysis-status/{conversation}/{mp3_file}?since={version}"
+                            }
+                            # Deadline-bounded wait: a quick GPT answer replaces the local one in this response
+                            if ANALYSIS_UPGRADE_DEADLINE_SECONDS > 0:
+                                try:
+                                    upgraded = future.result(timeout=ANALYSIS_UPGRADE_DEADLINE_SECONDS)
+                                except concurrent.futures.TimeoutError:
+                                    upgraded = None
+                                if upgraded:
+                                    ai_analysis = upgraded["ai_analysis"]
+                                    audio_analysis = upgraded["audio_analysis"]
+                                    combined_analysis, emotion_keys = build_segment_analysis(ai_analysis, audio_analysis, emotions_data)
+                                    segment_updates = upgraded["updates"]
+                                    combined_analysis["auto_saved"] = True
+                                    combined_analysis["updated_segment"] = segment_updates
+                                    combined_analysis["analysis_version"] = upgraded["version"]
+                                    upgrade.update({"status": upgraded["updates"]["analysis_status"],
+                                                    "version": upgraded["version"]})
                     else:
                         print(f"⚠️ Segment {mp3_file} not found in emotion data")
                 else:
@@ -688,6 +723,9 @@ def analyze_segment():
                 "mapping": emotions_data['mapping']
             }
         }
+
+        if upgrade:
+            response_data["upgrade"] = upgrade
         
         # If auto-save occurred, include the updated segment data for frontend sync
         if auto_save and segment_updates:
@@ -728,7 +766,282 @@ def analyze_segment():
             }
         })
 
+# ==================== HYBRID SEGMENT ANALYSIS ====================
+
+# How long /api/analyze-segment may wait for GPT before answering with the local result
+ANALYSIS_UPGRADE_DEADLINE_SECONDS = float(os.environ.get('ANALYSIS_UPGRADE_DEADLINE_SECONDS', 0))
+ANALYSIS_UPGRADE_WORKERS = int(os.environ.get('ANALYSIS_UPGRADE_WORKERS', 4))
+
+_analysis_upgrade_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=ANALYSIS_UPGRADE_WORKERS, thread_name_prefix='analysis-upgrade'
+)
+
+def get_segment_emotion_file(conversation):
+    """Path of the AI-analyzed emotion file for a conversation folder (convoN)"""
+    return f"conversations/{conversation}/emotions{conversation[5:]}_ai_analyzed.json"
+
+def changed_segment_fields(before, after):
+    """Per-segment fields of `after` that are new or differ from `before` (the emotion data as loaded)"""
+    changes = {}
+    for filename, segment in after.items():
+        if not isinstance(segment, dict):
+            continue
+        original = before.get(filename)
+        if not isinstance(original, dict):
+            original = {}
+        fields = {key: value for key, value in segment.items() if key not in original or original[key] != value}
+        if fields:
+            changes[filename] = fields
+    return changes
+
+def assign_diarized_speaker(segment_data, diarized_speaker, last_speaker, created):
+    """
+    Set the segment's speaker from the local diarizer unless it already has
+    a diarized one. New segments without speech (no diarizer label) take the
+    previous segment's speaker; existing ones keep theirs. Returns True when
+    the speaker was set.
+    """
+    if segment_data.get('speaker_source') == 'diarizer':
+        return False
+    if diarized_speaker is not None:
+        segment_data['speaker'] = diarized_speaker
+        segment_data['speaker_source'] = 'diarizer'
+        return True
+    if created:
+        segment_data['speaker'] = last_speaker
+        return True
+    return False
+
+def save_segment_fields(emotion_file, segment_fields, source=None):
+    """
+    Merge per-segment field changes into the emotion file as it is now, so
+    edits saved while a long analysis ran are kept (only the fields it set
+    are overwritten). Missing segments start from the default segment data.
+    """
+    def apply(emotion_data):
+        for filename, fields in segment_fields.items():
+            segment = emotion_data.get(filename)
+            if not isinstance(segment, dict):
+                segment = emotion_data[filename] = create_default_segment_data()
+            segment.update(fields)
+    
+    emotion_store.update(emotion_file, apply, default={}, source=source)
+
+def analyze_segment_audio(conversation, mp3_file):
+    """Volume/energy analysis of a segment's audio file, empty when the file is missing"""
+    audio_analysis = {}
+    if conversation and mp3_file:
+        audio_path = os.path.join("conversations", conversation, mp3_file)
+        if os.path.exists(audio_path):
+            try:
+                audio_analysis = analyze_volume_advanced(audio_path)
+                print(f"🔊 Audio analysis: {audio_analysis}")
+            except Exception as e:
+                print(f"⚠️ Audio analysis failed: {str(e)}")
+                audio_analysis = {"volume": 0.5, "energy": 0.5, "duration": 1.0}
+    return audio_analysis
+
+def build_segment_analysis(ai_analysis, audio_analysis, emotions_data):
+    """
+    Map the detected emotions onto configured emotion keys and build the
+    combined analysis returned to the frontend. Returns (combined_analysis, emotion_keys).
+    """
+    # Use detected emotions (multiple) from AI analysis
+    detected_emotions = ai_analysis.get("emotions_detected", [ai_analysis.get("emotion_detected", "נייטרלי")])
+    primary_emotion = ai_analysis.get("primary_emotion", detected_emotions[0] if detected_emotions else "נייטרלי")
+    
+    print(f"🎭 AI detected emotions: {detected_emotions} (primary: {primary_emotion})")
+    
+    # Validate and map each emotion
+    validated_emotions = []
+    emotion_keys = []
+    
+    for detected_emotion in detected_emotions:
+        # Use emotion validation to map to existing emotions or ensure it's available
+        validated_emotion = get_emotion_from_config(detected_emotion, emotions_data)
+        
+        # Find the corresponding English key for the validated emotion
+        emotion_key = None
+        for eng_key, config in emotions_data['config'].items():
+            if config.get('hebrew') == validated_emotion or eng_key == validated_emotion:
+                emotion_key = eng_key
+                break
+        
+        # If no matching key found, try to find by the emotion name itself
+        if not emotion_key:
+            emotion_key = validated_emotion
+        
+        # Add to lists if not already present
+        if validated_emotion not in validated_emotions:
+            validated_emotions.append(validated_emotion)
+            emotion_keys.append(emotion_key)
+        
+        # If the detected emotion was mapped to something else, log it
+        if validated_emotion != detected_emotion:
+            print(f"🎭 AI detected emotion: {detected_emotion} → validated: {validated_emotion} → key: {emotion_key}")
+        else:
+            print(f"🎭 AI detected emotion: {validated_emotion} → key: {emotion_key}")
+    
+    # Combine AI analysis with audio analysis
+    combined_analysis = {
+        "emotions": emotion_keys,  # Now supports multiple emotions
+        "blur": ai_analysis.get("blur", 0),
+        "shine": ai_analysis.get("spark", 0),
+        "humor": ai_analysis.get("humor_score", 0),
+        "blobSize": ai_analysis.get("blob_size", 3),
+        "blobStrength": ai_analysis.get("blob_intensity", 1000),
+        "gridResolution": ai_analysis.get("grid_resolution", 60),  # This should now use our calculated value
+        "confidence": 0.95,
+        "ai_analyzed": not ai_analysis.get("pending_ai_upgrade", False),
+        "pending_ai_upgrade": ai_analysis.get("pending_ai_upgrade", False),
+        "audio_volume": audio_analysis.get("volume", 0.5),
+        "audio_energy": audio_analysis.get("energy", 0.5),
+        "audio_duration": audio_analysis.get("duration", 1.0),
+        # Include emotions configuration info for frontend
+        "available_emotions": emotions_data['active_hebrew'],
+        "emotion_mapping": emotions_data['mapping'],
+        "detected_emotions_original": detected_emotions,  # Keep original detected emotions
+        "primary_emotion": primary_emotion
+    }
+    return combined_analysis, emotion_keys
+
+def build_segment_updates(ai_analysis, emotion_keys, audio_analysis, transcript, speaker):
+    """Segment fields persisted to the emotion file for an analysis result"""
+    # Ensure consistent blobHomeRegion based on speaker
+    if speaker == 0:
+        blob_home_region = "center-left"   # דובר 1 always LEFT
+    elif speaker == 1:
+        blob_home_region = "center-right"  # דובר 2 always RIGHT
+    else:
+        blob_home_region = "center"        # Silence or unknown
+    
+    print(f"🎭 Auto-save enforcing: speaker {speaker} → blobHomeRegion: {blob_home_region}")
+    
+    return {
+        "emotions": emotion_keys,
+        "blur": ai_analysis.get("blur", 0),
+        "shine": ai_analysis.get("spark", 0),
+        "humor": ai_analysis.get("humor_score", 0),
+        "blobSize": ai_analysis.get("blob_size", 3),
+        "blobStrength": ai_analysis.get("blob_intensity", 1000),
+        "gridResolution": ai_analysis.get("grid_resolution", 60),  # Will use calculated value from AI
+        "blobHomeRegion": blob_home_region,  # Ensure consistent positioning
+        "ai_analyzed": not ai_analysis.get("pending_ai_upgrade", False),
+        "pending_ai_upgrade": ai_analysis.get("pending_ai_upgrade", False),
+        "ai_analysis_date": datetime.now().isoformat(),
+        "ai_confidence": 95,
+        "ai_insights": ai_analysis.get("summary", "AI analysis completed"),
+        "transcript": transcript,  # Update transcript if changed
+        "words": transcript,
+        "audio_volume": audio_analysis.get("volume", 0.5),
+        "audio_energy": audio_analysis.get("energy", 0.5),
+        "audio_duration": audio_analysis.get("duration", 1.0)
+    }
+
+def save_segment_analysis(emotion_file, mp3_file, updates, expected_version=None, base_fields=None):
+    """
+    Apply analysis updates to one segment and bump its analysis_version.
+    With expected_version the write is skipped when the segment was re-analyzed
+    in the meantime. With base_fields (the values the replaced analysis wrote),
+    fields edited by hand since then (emotions, sliders, ...) keep the edit.
+    Returns the new version, or None when nothing was written.
+    """
+    def apply(emotion_data):
+        if mp3_file not in emotion_data:
+            return None
+        
+        segment = emotion_data[mp3_file]
+        current_version = segment.get("analysis_version", 0)
+        if expected_version is not None and current_version != expected_version:
+            return None
+        
+        # Apply updates to the segment
+        edited = []
+        for key, value in updates.items():
+            if base_fields is not None and key in base_fields and segment.get(key) != base_fields[key]:
+                edited.append(key)
+                continue
+            segment[key] = value
+        if edited:
+            print(f"✋ Keeping manual edits of {mp3_file}: {', '.join(edited)}")
+        emotion_data[mp3_file]["analysis_version"] = current_version + 1
+        return current_version + 1
+    
+    return emotion_store.update(emotion_file, apply, source="analyze-segment")
+
+def run_segment_analysis_upgrade(api_key, conversation, mp3_file, transcript, speaker, base_version, enqueued_at=None,
+                                 base_fields=None):
+    """
+    Background half of /api/analyze-segment: run the full GPT analysis and
+    write it over the local result (base_fields), unless the segment moved
+    past base_version. Fields edited by hand since the local result are kept.
+    """
+    try:
+        with model_job('analysis-upgrade', os.path.join("conversations", conversation), enqueued_at=enqueued_at):
+            client = create_openai_client(api_key)
+            audio_analysis = analyze_segment_audio(conversation, mp3_file)
+            ai_analysis = analyze_text_emotion_advanced(transcript, client, speaker=speaker, audio_analysis=audio_analysis)
+        
+        emotions_data = load_emotions_config()
+        _, emotion_keys = build_segment_analysis(ai_analysis, audio_analysis, emotions_data)
+        updates = build_segment_updates(ai_analysis, emotion_keys, audio_analysis, transcript, speaker)
+        # GPT still unavailable: keep the local emotions flagged for a later upgrade
+        updates["analysis_status"] = "local_fallback" if updates["pending_ai_upgrade"] else "ai"
+        
+        emotion_file = get_segment_emotion_file(conversation)
+        version = save_segment_analysis(emotion_file, mp3_file, updates,
+                                        expected_version=base_version, base_fields=base_fields)
+        if version is None:
+            print(f"⏭️ Discarding GPT upgrade for {conversation}/{mp3_file}: segment changed since v{base_version}")
+            return None
+        
+        # What the segment holds now (manual edits may have kept some fields)
+        segment = emotion_store.get_segment(emotion_file, mp3_file) or {}
+        updates = {key: segment.get(key, value) for key, value in updates.items()}
+        print(f"⬆️ GPT upgrade saved for {conversation}/{mp3_file} (v{version}, {updates['analysis_status']})")
+        return {"version": version, "updates": {**updates, "analysis_version": version},
+                "ai_analysis": ai_analysis, "audio_analysis": audio_analysis}
+    except Exception as e:
+        print(f"❌ GPT upgrade failed for {conversation}/{mp3_file}: {str(e)}")
+        return None
+
+@app.route('/api/analysis-status/<conversation>/<filename>')
+def analysis_status(conversation, filename):
+    """
+    Poll endpoint for hybrid analysis. Returns the segment's current
+    analysis_version and status, plus the analysis fields once the version
+    is newer than ?since=<version>.
+    """
+    try:
+        since = request.args.get('since', type=int)
+        emotion_data = emotion_store.read(get_segment_emotion_file(conversation))
+        if emotion_data is None:
+            return jsonify({"error": "Emotion file not found"}), 404
+        
+        if filename not in emotion_data:
+            return jsonify({"error": "Segment not found"}), 404
+        
+        segment = emotion_data[filename]
+        version = segment.get("analysis_version", 0)
+        status = segment.get("analysis_status", "ai" if segment.get("ai_analyzed") else "none")
+        response_data = {
+            "success": True,
+            "conversation": conversation,
+            "filename": filename,
+            "version": version,
+            "status": status,
+            "pending": status == "pending_upgrade"
+        }
+        if since is None or version > since:
+            response_data["segment"] = segment
+        return jsonify(response_data)
+        
+    except Exception as e:
+        print(f"❌ Error in analysis-status: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/transcribe-and-analyze-segment', methods=['POST'])
+@track_model_job('transcribe-and-analyze-segment')
 def transcribe_and_analyze_segment():
     """
     Complete workflow: Transcribe + Analyze a single segment with AI
@@ -742,8 +1055,6 @@ def transcribe_and_analyze_segment():
     }
     """
     try:
-        import openai
-        
         data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
@@ -761,7 +1072,7 @@ def transcribe_and_analyze_segment():
             return jsonify({"error": "OpenAI API key not properly configured"}), 500
             
         try:
-            client = openai.OpenAI(api_key=api_key)
+            client = create_openai_client(api_key)
             print(f"🎯 Starting transcription + analysis for {conversation}/{mp3_file}")
         except Exception as e:
             return jsonify({"error": "Failed to initialize OpenAI client"}), 500
@@ -774,6 +1085,7 @@ def transcribe_and_analyze_segment():
         print(f"🎤 Transcribing {mp3_file} using {transcription_method}...")
         
         transcript = ""
+        transcription_enhancement = None
         
         # Enhanced transcription with multiple fallback options
         if transcription_method == "whisper_accurate":
@@ -820,9 +1132,11 @@ def transcribe_and_analyze_segment():
                 print("🔄 ChatGPT-4 failed, falling back to OpenAI Whisper with GPT-4...")
                 transcript = transcribe_with_openai_whisper(audio_path, client)
                 
-        else:  # openai_fast (with GPT-4 enhancement)
-            # Use OpenAI Whisper API with GPT-4 enhancement
-            transcript = transcribe_with_openai_whisper(audio_path, client)
+        else:  # openai_fast (with GPT-4 enhancement when the raw text looks doubtful)
+            whisper_result = transcribe_with_openai_whisper_detailed(audio_path, client)
+            if whisper_result:
+                transcript = whisper_result["text"]
+                transcription_enhancement = whisper_result["enhancement"]
             
         if not transcript:
             return jsonify({"error": "Transcription failed"}), 500
@@ -840,13 +1154,12 @@ def transcribe_and_analyze_segment():
         
         # Step 3: Get speaker information
         current_speaker = data.get('speaker', 0)
-        emotion_file = f"conversations/{conversation}/emotions{conversation[5:]}_ai_analyzed.json"
+        emotion_file = get_segment_emotion_file(conversation)
         if os.path.exists(emotion_file):
             try:
-                with open(emotion_file, 'r', encoding='utf-8') as f:
-                    emotion_data = json.load(f)
-                if mp3_file in emotion_data:
-                    current_speaker = emotion_data[mp3_file].get('speaker', current_speaker)
+                existing_segment = emotion_store.get_segment(emotion_file, mp3_file)
+                if existing_segment is not None:
+                    current_speaker = existing_segment.get('speaker', current_speaker)
             except Exception as e:
                 print(f"⚠️ Failed to read speaker from emotion data: {str(e)}")
         
@@ -898,7 +1211,8 @@ def transcribe_and_analyze_segment():
             "blobStrength": ai_analysis.get("blob_intensity", 1000),
             "gridResolution": ai_analysis.get("grid_resolution", 60),
             "confidence": 0.95,
-            "ai_analyzed": True,
+            "ai_analyzed": not ai_analysis.get("pending_ai_upgrade", False),
+            "pending_ai_upgrade": ai_analysis.get("pending_ai_upgrade", False),
             "transcribed": True,
             "transcription_method": transcription_method,
             "audio_volume": audio_analysis.get("volume", 0.5),
@@ -916,10 +1230,10 @@ def transcribe_and_analyze_segment():
         
         if auto_save and os.path.exists(emotion_file):
             try:
-                with open(emotion_file, 'r', encoding='utf-8') as f:
-                    emotion_data = json.load(f)
-                
-                if mp3_file in emotion_data:
+                def apply(emotion_data):
+                    if mp3_file not in emotion_data:
+                        return None
+                    
                     # Calculate speaker positioning
                     blob_home_region = "מרכז"
                     if current_speaker == 0:
@@ -939,9 +1253,11 @@ def transcribe_and_analyze_segment():
                         "blobStrength": ai_analysis.get("blob_intensity", 1000),
                         "gridResolution": ai_analysis.get("grid_resolution", 60),
                         "blobHomeRegion": blob_home_region,
-                        "ai_analyzed": True,
+                        "ai_analyzed": not ai_analysis.get("pending_ai_upgrade", False),
+                        "pending_ai_upgrade": ai_analysis.get("pending_ai_upgrade", False),
                         "transcribed": True,
                         "transcription_method": transcription_method,
+                        "transcription_enhancement": transcription_enhancement,
                         "ai_analysis_date": datetime.now().isoformat(),
                         "transcription_date": datetime.now().isoformat(),
                         "ai_confidence": 95,
@@ -953,18 +1269,11 @@ def transcribe_and_analyze_segment():
                     # Apply updates
                     for key, value in updates.items():
                         emotion_data[mp3_file][key] = value
-                    
+                    return updates
+                
+                updates = emotion_store.update(emotion_file, apply, source="transcribe-and-analyze-segment")
+                if updates is not None:
                     segment_updates = updates.copy()
-                    
-                    # Create backup
-                    backup_file = f"{emotion_file}.backup.{int(datetime.now().timestamp())}"
-                    with open(backup_file, 'w', encoding='utf-8') as f:
-                        json.dump(emotion_data, f, ensure_ascii=False, indent=2)
-                    
-                    # Save updated data
-                    with open(emotion_file, 'w', encoding='utf-8') as f:
-                        json.dump(emotion_data, f, ensure_ascii=False, indent=2)
-                    
                     print(f"💾 Auto-saved transcription + analysis for {conversation}/{mp3_file}")
                     combined_analysis["auto_saved"] = True
                     combined_analysis["updated_segment"] = segment_updates
@@ -981,6 +1290,7 @@ def transcribe_and_analyze_segment():
             "ai_raw": ai_analysis,
             "audio_raw": audio_analysis,
             "transcription_method": transcription_method,
+            "transcription_enhancement": transcription_enhancement,
             "emotions_data": {
                 "detected": emotion_keys,
                 "available": emotions_data['active_hebrew'],
@@ -1003,6 +1313,7 @@ def transcribe_and_analyze_segment():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/transcribe-and-analyze-conversation', methods=['POST'])
+@track_model_job('transcribe-and-analyze-conversation')
 def transcribe_and_analyze_conversation():
     """
     Complete workflow: Transcribe + Analyze entire conversation with AI
@@ -1015,8 +1326,6 @@ def transcribe_and_analyze_conversation():
     }
     """
     try:
-        import openai
-        
         data = request.get_json()
         conversation_folder = data.get('conversationFolder')
         transcription_method = data.get('transcription_method', 'openai_fast')
@@ -1036,7 +1345,7 @@ def transcribe_and_analyze_conversation():
             return jsonify({"error": "OpenAI API key not properly configured"}), 500
             
         try:
-            client = openai.OpenAI(api_key=api_key)
+            client = create_openai_client(api_key)
             print(f"🎯 Starting complete transcription + analysis for {conversation_folder}")
         except Exception as e:
             return jsonify({"error": "Failed to initialize OpenAI client"}), 500
@@ -1059,10 +1368,9 @@ def transcribe_and_analyze_conversation():
         emotion_filename = f"emotions{conversation_folder.replace('convo', '')}_ai_analyzed.json"
         emotion_file = os.path.join(conv_path, emotion_filename)
         
-        emotion_data = {}
-        if os.path.exists(emotion_file):
-            with open(emotion_file, 'r', encoding='utf-8') as f:
-                emotion_data = json.load(f)
+        # Work on a copy; only the fields this run sets are merged into the file at the end
+        loaded_emotion_data = emotion_store.read(emotion_file) or {}
+        emotion_data = thaw(loaded_emotion_data)
         
         # Load emotions configuration
         emotions_data = load_emotions_config()
@@ -1079,16 +1387,27 @@ def transcribe_and_analyze_conversation():
         results = {}
         speaker_counts = {0: 0, 1: 0}  # Track speaker distribution
         
+        # Audio features for every segment in one batch, read from the decoded sidecars
+        segment_features = analyze_audio_files([os.path.join(conv_path, f) for f in mp3_files])
+        # Speakers from local voice embeddings, clustered over the whole conversation
+        segment_speakers = diarize_files([os.path.join(conv_path, f) for f in mp3_files])
+        # Playback loudness envelopes (stored at segmentation time, computed for older segments)
+        segment_envelopes = conversation_envelopes(conv_path, mp3_files)
+        last_speaker = 0
+        
         for i, mp3_file in enumerate(mp3_files):
             try:
                 print(f"\n🔄 Processing {mp3_file} ({i+1}/{len(mp3_files)})...")
                 mp3_path = os.path.join(conv_path, mp3_file)
                 
                 # Initialize segment data if not exists, but preserve existing emotions
-                if mp3_file not in emotion_data:
+                created = mp3_file not in emotion_data
+                if created:
                     emotion_data[mp3_file] = create_default_segment_data()
                 
                 segment_data = emotion_data[mp3_file]
+                if segment_envelopes.get(mp3_file):
+                    segment_data['loudness_envelope'] = segment_envelopes[mp3_file]
                 
                 # Preserve existing emotions and transcripts to prevent loss during processing
                 original_emotions = segment_data.get('emotions', []).copy() if segment_data.get('emotions') else []
@@ -1110,16 +1429,22 @@ def transcribe_and_analyze_conversation():
                 print(f"  🎤 Transcribing {mp3_file} using {transcription_method}...")
                 
                 transcript = ""
+                transcription_enhancement = None
                 if transcription_method == "whisper_accurate":
                     transcript = transcribe_with_whisper(mp3_path)
                 else:  # openai_fast
-                    transcript = transcribe_with_openai_whisper(mp3_path, client)
+                    whisper_result = transcribe_with_openai_whisper_detailed(mp3_path, client)
+                    if whisper_result:
+                        transcript = whisper_result["text"]
+                        transcription_enhancement = whisper_result["enhancement"]
                 
                 if transcript and transcript.strip():
                     segment_data['transcript'] = transcript.strip()
                     segment_data['words'] = transcript.strip()
                     segment_data['transcribed'] = True
                     segment_data['transcription_method'] = transcription_method
+                    if transcription_enhancement:
+                        segment_data['transcription_enhancement'] = transcription_enhancement
                     segment_data['transcription_date'] = datetime.now().isoformat()
                     stats["transcribed"] += 1
                     print(f"    ✅ Transcribed: \"{transcript[:50]}...\"")
@@ -1137,7 +1462,7 @@ def transcribe_and_analyze_conversation():
                 
                 # Step 2: Audio Analysis
                 try:
-                    audio_analysis = analyze_volume_advanced(mp3_path)
+                    audio_analysis = segment_features.get(mp3_path) or analyze_volume_advanced(mp3_path)
                     segment_data.update({
                         'audio_volume': audio_analysis.get('volume', 0.5),
                         'audio_energy': audio_analysis.get('energy', 0.5),
@@ -1147,12 +1472,10 @@ def transcribe_and_analyze_conversation():
                     print(f"    ⚠️ Audio analysis failed: {str(e)}")
                     audio_analysis = {"volume": 0.5, "energy": 0.5, "duration": 1.0}
                 
-                # Step 3: Speaker Assignment (balanced pattern to ensure equal representation)
-                if 'speaker' not in segment_data:
-                    # Use a more balanced assignment pattern
-                    speaker_id = 0 if i % 2 == 0 else 1
-                    segment_data['speaker'] = speaker_id
-                    print(f"    👥 Assigned to דובר {speaker_id + 1}")
+                # Step 3: Speaker Assignment from the diarizer (new segments without speech keep the previous speaker)
+                if assign_diarized_speaker(segment_data, segment_speakers.get(mp3_path), last_speaker, created):
+                    print(f"    👥 Assigned to דובר {segment_data['speaker'] + 1}")
+                last_speaker = segment_data.get('speaker', last_speaker)
                 
                 # Track speaker distribution
                 speaker = segment_data.get('speaker', 0)
@@ -1164,7 +1487,7 @@ def transcribe_and_analyze_conversation():
                 
                 # Always analyze - don't skip segments based on transcript quality to ensure equal speaker representation
                 if transcript and transcript.strip():
-                    ai_result = analyze_text_emotion_advanced(transcript, speaker=speaker, audio_analysis=audio_analysis)
+                    ai_result = analyze_text_emotion_advanced(transcript, client, speaker=speaker, audio_analysis=audio_analysis)
                     
                     if ai_result and 'error' not in ai_result:
                         detected_emotions = ai_result.get("emotions_detected", [ai_result.get("emotion_detected", "ניטרלי")])
@@ -1191,7 +1514,8 @@ def transcribe_and_analyze_conversation():
                             'blobSize': ai_result.get('blob_size', 3),
                             'blobStrength': ai_result.get('blob_intensity', 1000),
                             'gridResolution': ai_result.get('grid_resolution', 60),
-                            'ai_analyzed': True,
+                            'ai_analyzed': not ai_result.get('pending_ai_upgrade', False),
+                            'pending_ai_upgrade': ai_result.get('pending_ai_upgrade', False),
                             'ai_analysis_date': datetime.now().isoformat(),
                             'ai_confidence': 95
                         })
@@ -1247,17 +1571,8 @@ def transcribe_and_analyze_conversation():
         
         # Save updated emotion data
         try:
-            # Create backup
-            if os.path.exists(emotion_file):
-                backup_file = f"{emotion_file}.backup.{int(datetime.now().timestamp())}"
-                with open(emotion_file, 'r', encoding='utf-8') as f:
-                    backup_data = f.read()
-                with open(backup_file, 'w', encoding='utf-8') as f:
-                    f.write(backup_data)
-            
-            # Save updated data
-            with open(emotion_file, 'w', encoding='utf-8') as f:
-                json.dump(emotion_data, f, ensure_ascii=False, indent=2)
+            save_segment_fields(emotion_file, changed_segment_fields(loaded_emotion_data, emotion_data),
+                                source="transcribe-and-analyze-conversation")
             
             print(f"💾 Saved emotion data for {conversation_folder}")
             
@@ -1296,6 +1611,65 @@ def transcribe_and_analyze_conversation():
         print(f"❌ Error in conversation transcription + analysis: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def allocate_conversation_folder(conversations_dir="conversations"):
+    """Create and claim the next free convoN folder (mkdir is the claim, so concurrent uploads never share one)"""
+    os.makedirs(conversations_dir, exist_ok=True)
+    convo_numbers = []
+    for convo in os.listdir(conversations_dir):
+        if convo.startswith('convo') and convo[5:].isdigit():
+            convo_numbers.append(int(convo[5:]))
+    next_num = max(convo_numbers) + 1 if convo_numbers else 1
+    while True:
+        conversation_folder = f"convo{next_num}"
+        try:
+            os.mkdir(os.path.join(conversations_dir, conversation_folder))
+            return conversation_folder
+        except FileExistsError:
+            next_num += 1
+
+def existing_recording_response(sha256, entry, matches=None):
+    """Response for an upload whose content is already stored: link to the existing copy"""
+    print(f"♻️ Recording already stored as {entry['path']} (sha256 {sha256[:12]}), not storing it again")
+    response = {
+        "success": True,
+        "duplicate": True,
+        "conversationFolder": entry.get('conversationFolder'),
+        "uploadedPath": entry['path'],
+        "sha256": sha256,
+        "message": f"Recording already exists in {entry.get('conversationFolder')}"
+    }
+    if matches:
+        response["fingerprintMatches"] = matches
+    return response
+
+def check_recording_fingerprint(upload_path, conversation_folder, sha256):
+    """
+    Look a newly stored recording up in the fingerprint index. Returns
+    (duplicate response or None, overlap matches). A duplicate (another
+    encoding of a stored recording) is removed again and its hash linked to
+    the stored copy, so it is never segmented or transcribed.
+    """
+    try:
+        matches = fingerprint_index.match(upload_path, exclude_conversation=conversation_folder)
+    except Exception as e:
+        print(f"⚠️ Fingerprint lookup failed for {upload_path}: {str(e)}")
+        return None, []
+    
+    for match in matches:
+        if match["type"] == "duplicate":
+            existing_path = match["original"] or os.path.join("conversations", match["conversation"])
+            print(f"🔎 {upload_path} is the same recording as {match['conversation']} "
+                  f"({match['coverage']:.0%} of fingerprints match)")
+            shutil.rmtree(os.path.join("conversations", conversation_folder), ignore_errors=True)
+            if match["original"]:
+                recording_index.register(sha256, existing_path, os.path.getsize(existing_path), match["conversation"])
+            return existing_recording_response(sha256, {"path": existing_path, "conversationFolder": match["conversation"]},
+                                               matches), matches
+    
+    for match in matches:
+        print(f"🔎 {upload_path} overlaps {match['conversation']} for ~{match['matchedSeconds']}s")
+    return None, matches
+
 @app.route('/api/upload-and-process', methods=['POST'])
 def upload_and_process():
     """
@@ -1306,6 +1680,7 @@ def upload_and_process():
     - conversationType: string 
     - segmentLength: int
     - transcriptionQuality: string
+    Large files should use the chunked /api/uploads endpoints instead.
     """
     try:
         if 'mp3File' not in request.files:
@@ -1320,31 +1695,23 @@ def upload_and_process():
         segment_length = int(request.form.get('segmentLength', 20))
         transcription_quality = request.form.get('transcriptionQuality', 'basic')
         
-        # Find next available conversation number
-        conversations_dir = "conversations"
-        if not os.path.exists(conversations_dir):
-            os.makedirs(conversations_dir)
-            
-        existing_convos = [d for d in os.listdir(conversations_dir) if d.startswith('convo') and os.path.isdir(os.path.join(conversations_dir, d))]
-        convo_numbers = []
-        for convo in existing_convos:
-            try:
-                num = int(convo.replace('convo', ''))
-                convo_numbers.append(num)
-            except:
-                continue
-                
-        next_num = max(convo_numbers) + 1 if convo_numbers else 1
-        conversation_folder = f"convo{next_num}"
-        
-        # Create conversation directory
-        conv_path = os.path.join(conversations_dir, conversation_folder)
-        os.makedirs(conv_path, exist_ok=True)
+        conversation_folder = allocate_conversation_folder()
+        conv_path = os.path.join("conversations", conversation_folder)
         
-        # Save uploaded file
-        original_filename = f"original_{file.filename}"
+        # Save uploaded file, hashing it on the way to disk
+        original_filename = f"original_{os.path.basename(file.filename)}"
         upload_path = os.path.join(conv_path, original_filename)
-        file.save(upload_path)
+        sha256, size = save_stream_with_sha256(file.stream, upload_path)
+        
+        existing = recording_index.find(sha256)
+        if existing:
+            shutil.rmtree(conv_path, ignore_errors=True)
+            return jsonify(existing_recording_response(sha256, existing))
+        duplicate, overlaps = check_recording_fingerprint(upload_path, conversation_folder, sha256)
+        if duplicate:
+            return jsonify(duplicate)
+        recording_index.register(sha256, upload_path, size, conversation_folder)
+        fingerprint_index.update_async([upload_path])
         
         print(f"✅ Uploaded {file.filename} to {upload_path}")
         
@@ -1352,6 +1719,8 @@ def upload_and_process():
             "success": True,
             "conversationFolder": conversation_folder,
             "uploadedPath": upload_path,
+            "sha256": sha256,
+            "overlaps": overlaps,
             "message": f"Successfully created {conversation_folder}"
         })
         
@@ -1359,6 +1728,135 @@ def upload_and_process():
         print(f"❌ Error in upload-and-process: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def upload_error_response(error):
+    body = {"error": str(error)}
+    if error.offset is not None:
+        body["offset"] = error.offset
+    return jsonify(body), error.status
+
+@app.route('/api/uploads', methods=['POST'])
+def start_upload():
+    """
+    Start (or resume) a chunked upload.
+    Expected JSON: {"filename": "talk.m4a", "size": 123456789, "resumeKey": "name:size:lastModified"}
+    Returns the upload id, the offset to continue from and the chunk size to use.
+    """
+    try:
+        data = request.get_json() or {}
+        filename = os.path.basename(str(data.get('filename') or '').strip())
+        if not filename:
+            return jsonify({"error": "Missing filename"}), 400
+        session = upload_manager.start(filename, int(data.get('size', 0)), data.get('resumeKey'))
+        return jsonify({"success": True, **session})
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        print(f"❌ Error starting upload: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Bytes received so far, to resume after a dropped connection"""
+    try:
+        return jsonify({"success": True, **upload_manager.status(upload_id)})
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Append one chunk (raw request body) starting at ?offset=N"""
+    try:
+        offset = int(request.args.get('offset', -1))
+        return jsonify({"success": True, **upload_manager.write_chunk(upload_id, offset, request.stream)})
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        print(f"❌ Error receiving chunk for upload {upload_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    try:
+        upload_manager.status(upload_id)
+        upload_manager.discard(upload_id)
+        return jsonify({"success": True})
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """
+    Verify a finished chunked upload, store it in a new conversation folder
+    and segment it right away.
+    Expected JSON: {"segmentLength": 20, "sha256": "<optional client hash>", "segment": true}
+    A recording that is already stored is not stored again: the response
+    points at the existing conversation with "duplicate": true.
+    """
+    try:
+        data = request.get_json() or {}
+        staged_path, sha256, session = upload_manager.finish(upload_id, data.get('sha256'))
+        
+        existing = recording_index.find(sha256)
+        if existing:
+            upload_manager.discard(upload_id)
+            return jsonify(existing_recording_response(sha256, existing))
+        
+        conversation_folder = allocate_conversation_folder()
+        conv_path = os.path.join("conversations", conversation_folder)
+        upload_path = os.path.join(conv_path, f"original_{session['filename']}")
+        os.replace(staged_path, upload_path)
+        upload_manager.discard(upload_id)
+        
+        # Same recording in another encoding: link to it before anything is segmented or transcribed
+        duplicate, overlaps = check_recording_fingerprint(upload_path, conversation_folder, sha256)
+        if duplicate:
+            return jsonify(duplicate)
+        recording_index.register(sha256, upload_path, session['size'], conversation_folder)
+        print(f"✅ Uploaded {session['filename']} to {upload_path} ({session['size']:,} bytes)")
+        
+        result = {
+            "success": True,
+            "conversationFolder": conversation_folder,
+            "uploadedPath": upload_path,
+            "sha256": sha256,
+            "overlaps": overlaps,
+            "message": f"Successfully created {conversation_folder}"
+        }
+        if not data.get('segment', True):
+            fingerprint_index.update_async([upload_path])
+            return jsonify(result)
+        
+        # Straight into the segmentation pipeline
+        segment_response = segment_audio_file(conversation_folder, int(data.get('segmentLength', 20)), upload_path,
+                                              streaming=bool(data.get('streaming')))
+        if isinstance(segment_response, tuple):
+            error_body = segment_response[0].get_json() or {}
+            result.update({"segmented": False, "segmentationError": error_body.get("error")})
+            fingerprint_index.update_async([upload_path])
+            return jsonify(result)
+        result.update(segment_response.get_json())
+        result["segmented"] = True
+        fingerprint_index.update_async(conversation_files(conv_path))
+        return jsonify(result)
+        
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        print(f"❌ Error completing upload {upload_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Files at least this large are segmented in streaming mode (bounded memory)
+STREAMING_SEGMENTATION_MIN_BYTES = int(float(os.environ.get('STREAMING_SEGMENTATION_MIN_MB', 50)) * 1024 * 1024)
+
+def fixed_length_ranges(duration_ms, segment_length_ms):
+    """Time-based [start_ms, end_ms] ranges, skipping a trailing piece of 500ms or less"""
+    ranges = []
+    for i in range(0, duration_ms, segment_length_ms):
+        end = min(i + segment_length_ms, duration_ms)
+        if end - i > 500:  # Only add segments longer than 500ms
+            ranges.append([i, end])
+    return ranges
+
 @app.route('/api/segment-audio', methods=['POST'])
 def segment_audio():
     """
@@ -1378,7 +1876,21 @@ def segment_audio():
         
         if not conversation_folder or not original_file:
             return jsonify({"error": "Missing required parameters"}), 400
-            
+        
+        response = segment_audio_file(conversation_folder, segment_length, original_file, streaming=bool(data.get('streaming')))
+        if not isinstance(response, tuple):
+            fingerprint_index.update_async(conversation_files(os.path.join("conversations", conversation_folder)))
+        return response
+    
+    except Exception as e:
+        print(f"❌ Error in segment-audio: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+def segment_audio_file(conversation_folder, segment_length, original_file, streaming=False):
+    """Segment an uploaded recording into conversations/<conversation_folder>; returns a Flask response"""
+    try:
         conv_path = os.path.join("conversations", conversation_folder)
         
         if not os.path.exists(original_file):
@@ -1397,10 +1909,13 @@ def segment_audio():
         print(f"📊 File size: {file_size:,} bytes ({file_size / (1024*1024):.2f} MB)")
         print(f"⏱️ Target segment length: {segment_length} seconds")
         
+        # Long recordings are never loaded whole: decode through an ffmpeg pipe in chunks
+        if streaming or file_size >= STREAMING_SEGMENTATION_MIN_BYTES:
+            return segment_audio_streaming(conversation_folder, segment_length, original_file, conv_path)
+        
         # Try real MP3 processing with pydub
         try:
             from pydub import AudioSegment
-            from pydub.silence import split_on_silence
             
             # Load the audio file (support multiple formats)
             print("🔊 Loading audio file...")
@@ -1455,57 +1970,64 @@ def segment_audio():
             
             # Method 1: Try silence-based segmentation first (optimized for conversation)
             print("🔍 Attempting intelligent conversation segmentation...")
-            segments = split_on_silence(
-                audio,
+            detection_start = time.time()
+            silence_ranges = split_ranges_on_silence(
+                samples_from_audio_segment(audio),
+                audio.frame_rate,
                 min_silence_len=min_silence_len,
                 silence_thresh=silence_thresh,
                 keep_silence=150,  # Keep 150ms of silence at the edges
-                seek_step=50       # More precise detection
+                seek_step=50,      # More precise detection
+                channels=audio.channels,
+                sample_width=audio.sample_width,
+                hysteresis_db=SILENCE_HYSTERESIS_DB,
+                min_segment_len=1000  # Filter out very short segments (less than 1 second)
             )
-            
-            # Filter out very short segments (less than 1 second)
-            segments = [seg for seg in segments if len(seg) >= 1000]
+            silence_detection_seconds = time.time() - detection_start
+            print(f"🔇 Silence detection: {len(silence_ranges)} ranges in {silence_detection_seconds:.3f}s")
+            segment_ranges = silence_ranges
             
             # If silence-based segmentation produces too few or too many segments,
             # fall back to time-based segmentation
-            if len(segments) < 2 or len(segments) > 100:
-                print(f"⚠️ Silence-based segmentation produced {len(segments)} segments, using time-based instead")
+            if len(segment_ranges) < 2 or len(segment_ranges) > 100:
+                print(f"⚠️ Silence-based segmentation produced {len(segment_ranges)} segments, using time-based instead")
                 
                 # Method 2: Fixed-duration segmentation
-                segments = []
-                for i in range(0, len(audio), segment_length_ms):
-                    segment = audio[i:i + segment_length_ms]
-                    if len(segment) > 500:  # Only add segments longer than 500ms
-                        segments.append(segment)
-            
-            print(f"✅ Audio segmented into {len(segments)} parts")
-            
-            # Export segments
-            segment_files = []
-            for i, segment in enumerate(segments):
-                segment_filename = f"{i+1:03d}.mp3"
-                segment_path = os.path.join(conv_path, segment_filename)
-                
-                # Export the segment as MP3
-                segment.export(segment_path, format="mp3", bitrate="128k")
-                segment_files.append(segment_filename)
-                
-                segment_duration = len(segment) / 1000
-                print(f"   📄 Exported {segment_filename} | Duration: {segment_duration:.1f}s")
+                segment_ranges = fixed_length_ranges(len(audio), segment_length_ms)
+            
+            print(f"✅ Audio segmented into {len(segment_ranges)} parts")
+            
+            # Export all segments in one pass
+            segment_files = [f"{i+1:03d}.mp3" for i in range(len(segment_ranges))]
+            cut_result = cut_segments(
+                original_file,
+                segment_ranges,
+                [os.path.join(conv_path, segment_filename) for segment_filename in segment_files],
+                bitrate="128k",
+                audio=audio
+            )
+            envelope_audio = audio if audio.sample_width == 2 else audio.set_sample_width(2)
+            store_segment_envelopes(conv_path, segment_files, envelopes_for_ranges(
+                samples_from_audio_segment(envelope_audio), segment_ranges, audio.frame_rate, audio.channels))
+            for segment_filename, (start, end) in zip(segment_files, segment_ranges):
+                print(f"   📄 Exported {segment_filename} | Duration: {(end - start) / 1000:.1f}s")
             
-            total_duration = sum(len(segment) for segment in segments) / 1000
+            total_duration = sum(end - start for start, end in segment_ranges) / 1000
             
-            print(f"✅ Successfully created {len(segments)} MP3 segments")
+            print(f"✅ Successfully created {len(segment_ranges)} MP3 segments ({cut_result['method']}, {cut_result['seconds']:.2f}s)")
             print(f"📊 Total duration: {total_duration:.1f} seconds")
             
             return jsonify({
                 "success": True,
-                "segmentCount": len(segments),
+                "segmentCount": len(segment_ranges),
                 "totalDuration": total_duration,
                 "segments": segment_files,
                 "method": "real_audio_processing",
                 "originalDuration": audio_duration_seconds,
-                "segmentLengthTarget": segment_length
+                "segmentLengthTarget": segment_length,
+                "silenceDetectionSeconds": round(silence_detection_seconds, 3),
+                "exportMethod": cut_result["method"],
+                "exportSeconds": cut_result["seconds"]
             })
             
         except ImportError as ie:
@@ -1519,6 +2041,68 @@ def segment_audio():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+def segment_audio_streaming(conversation_folder, segment_length, original_file, conv_path):
+    """
+    Bounded-memory segmentation: the file is decoded to 16kHz mono through an
+    ffmpeg pipe (or read from its PCM sidecar) in fixed-size chunks, silence
+    is detected incrementally and ranges are final as soon as their end is
+    known. Peak memory does not depend on the recording length.
+    """
+    print(f"🌊 Streaming segmentation for {conversation_folder}")
+    detection_start = time.time()
+    splitter = StreamingSilenceSplitter(
+        PCM_SAMPLE_RATE,
+        min_silence_len=300,
+        silence_thresh=-35,
+        keep_silence=150,
+        seek_step=50,
+        hysteresis_db=SILENCE_HYSTERESIS_DB,
+        min_segment_len=1000
+    )
+    envelope = EnvelopeBuilder(PCM_SAMPLE_RATE)
+    segment_ranges = []
+    for chunk in stream_pcm(original_file):
+        envelope.feed(chunk)
+        for start, end in splitter.feed(chunk):
+            segment_ranges.append([start, end])
+            print(f"   🔇 Segment {len(segment_ranges):03d}: {start / 1000:.1f}s - {end / 1000:.1f}s")
+    segment_ranges.extend(splitter.finish())
+    audio_duration_ms = splitter.length_ms
+    silence_detection_seconds = time.time() - detection_start
+    print(f"🔇 Silence detection: {len(segment_ranges)} ranges over {audio_duration_ms / 1000:.1f}s "
+          f"in {silence_detection_seconds:.2f}s")
+    
+    if len(segment_ranges) < 2 or len(segment_ranges) > 100:
+        print(f"⚠️ Silence-based segmentation produced {len(segment_ranges)} segments, using time-based instead")
+        segment_ranges = fixed_length_ranges(audio_duration_ms, segment_length * 1000)
+    
+    segment_files = [f"{i+1:03d}.mp3" for i in range(len(segment_ranges))]
+    cut_result = cut_segments(
+        original_file,
+        segment_ranges,
+        [os.path.join(conv_path, segment_filename) for segment_filename in segment_files],
+        bitrate="128k",
+        bounded_memory=True
+    )
+    store_segment_envelopes(conv_path, segment_files, [envelope.slice(start, end) for start, end in segment_ranges])
+    total_duration = sum(end - start for start, end in segment_ranges) / 1000
+    
+    print(f"✅ Successfully created {len(segment_ranges)} MP3 segments ({cut_result['method']}, {cut_result['seconds']:.2f}s)")
+    print(f"📊 Total duration: {total_duration:.1f} seconds")
+    
+    return jsonify({
+        "success": True,
+        "segmentCount": len(segment_ranges),
+        "totalDuration": total_duration,
+        "segments": segment_files,
+        "method": "streaming_audio_processing",
+        "originalDuration": audio_duration_ms / 1000,
+        "segmentLengthTarget": segment_length,
+        "silenceDetectionSeconds": round(silence_detection_seconds, 3),
+        "exportMethod": cut_result["method"],
+        "exportSeconds": cut_result["seconds"]
+    })
+
 def segment_audio_fallback(conversation_folder, segment_length, original_file, conv_path):
     """Fallback segmentation method when pydub is not available"""
     try:
@@ -1558,6 +2142,7 @@ def segment_audio_fallback(conversation_folder, segment_length, original_file, c
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/transcribe-audio', methods=['POST'])
+@track_model_job('transcribe-audio')
 def transcribe_audio():
     """
     Transcribe uploaded audio file (for live microphone recordings)
@@ -1587,6 +2172,7 @@ def transcribe_audio():
         # Transcribe using the specified method
         transcript = ""
         try:
+            client = create_openai_client(os.environ.get('OPENAI_API_KEY', '').strip())
             if transcription_method == 'openai_fast':
                 transcript = transcribe_with_openai_whisper(temp_path, client)
             elif transcription_method == 'whisper':
@@ -1673,29 +2259,22 @@ def create_conversation():
         }
         
         emotions_file = os.path.join(conversation_path, f"emotions{conversation_id}_ai_analyzed.json")
-        with open(emotions_file, 'w', encoding='utf-8') as f:
-            json.dump(emotions_data, f, ensure_ascii=False, indent=2)
+        emotion_store.write(emotions_file, emotions_data)
         print(f"💾 Created emotions file: {emotions_file}")
             
         # Update conversations config
-        try:
-            with open('config/conversations_config.json', 'r', encoding='utf-8') as f:
-                conversations_config = json.load(f)
-        except:
-            conversations_config = {}
-            
-        conversations_config[conversation_folder] = {
-            "title": f"שיחה מהמדריך {timestamp}",
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "participants": ["מקליט", "מערכת"],
-            "duration": data.get('duration', 0),
-            "wizard_generated": True,
-            "transcript": data.get('transcript', ''),
-            "emotions": data.get('emotions', ['ניטרלי'])
-        }
+        def add_conversation(conversations_config):
+            conversations_config[conversation_folder] = {
+                "title": f"שיחה מהמדריך {timestamp}",
+                "date": datetime.now().strftime("%Y-%m-%d"),
+                "participants": ["מקליט", "מערכת"],
+                "duration": data.get('duration', 0),
+                "wizard_generated": True,
+                "transcript": data.get('transcript', ''),
+                "emotions": data.get('emotions', ['ניטרלי'])
+            }
         
-        with open('config/conversations_config.json', 'w', encoding='utf-8') as f:
-            json.dump(conversations_config, f, ensure_ascii=False, indent=2)
+        update_json(CONVERSATIONS_CONFIG_FILE, add_conversation, default={})
         print(f"🔄 Updated conversations config")
             
         print(f"✅ Successfully created conversation: {conversation_folder}")
@@ -1760,6 +2339,7 @@ def transcribe():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/auto-transcribe-and-analyze', methods=['POST'])
+@track_model_job('auto-transcribe-and-analyze')
 def auto_transcribe_and_analyze():
     """
     Automatically transcribe and analyze all segments in a conversation folder
@@ -1795,11 +2375,9 @@ def auto_transcribe_and_analyze():
         emotion_filename = f"emotions{conversation_folder.replace('convo', '')}_ai_analyzed.json"
         emotion_file_path = os.path.join(conv_path, emotion_filename)
         
-        if os.path.exists(emotion_file_path):
-            with open(emotion_file_path, 'r', encoding='utf-8') as f:
-                emotion_data = json.load(f)
-        else:
-            emotion_data = {}
+        # Work on a copy; only the fields this run sets are merged into the file at the end
+        loaded_emotion_data = emotion_store.read(emotion_file_path) or {}
+        emotion_data = thaw(loaded_emotion_data)
         
         # Process each segment
         processed_count = 0
@@ -1813,21 +2391,31 @@ def auto_transcribe_and_analyze():
             return jsonify({"error": "OpenAI API key not configured"}), 500
             
         try:
-            import openai
-            client = openai.OpenAI(api_key=api_key)
+            client = create_openai_client(api_key)
         except Exception as e:
             return jsonify({"error": f"Failed to initialize OpenAI client: {str(e)}"}), 500
         
+        # Audio features for every segment in one batch, read from the decoded sidecars
+        segment_features = analyze_audio_files([os.path.join(conv_path, f) for f in mp3_files])
+        # Speakers from local voice embeddings, clustered over the whole conversation
+        segment_speakers = diarize_files([os.path.join(conv_path, f) for f in mp3_files])
+        # Playback loudness envelopes (stored at segmentation time, computed for older segments)
+        segment_envelopes = conversation_envelopes(conv_path, mp3_files)
+        last_speaker = 0
+        
         for i, mp3_file in enumerate(mp3_files):
             try:
                 print(f"🔄 Processing {mp3_file} ({i+1}/{len(mp3_files)})...")
                 mp3_path = os.path.join(conv_path, mp3_file)
                 
                 # Initialize segment data if not exists
-                if mp3_file not in emotion_data:
+                created = mp3_file not in emotion_data
+                if created:
                     emotion_data[mp3_file] = create_default_segment_data()
                 
                 segment_data = emotion_data[mp3_file]
+                if segment_envelopes.get(mp3_file):
+                    segment_data['loudness_envelope'] = segment_envelopes[mp3_file]
                 
                 # Step 1: Transcribe if needed
                 current_transcript = segment_data.get('transcript', '').strip()
@@ -1838,8 +2426,11 @@ def auto_transcribe_and_analyze():
                         # Use WhisperX or advanced transcription
                         transcript = transcribe_with_whisper(mp3_path)
                     else:  # openai_fast
-                        # Use OpenAI Whisper API (faster)
-                        transcript = transcribe_with_openai_whisper(mp3_path, client)
+                        # Use OpenAI Whisper API (faster); GPT-4 only for doubtful transcripts
+                        whisper_result = transcribe_with_openai_whisper_detailed(mp3_path, client)
+                        transcript = whisper_result["text"] if whisper_result else None
+                        if whisper_result and whisper_result["enhancement"]:
+                            segment_data['transcription_enhancement'] = whisper_result["enhancement"]
                     
                     if transcript:
                         segment_data['transcript'] = transcript
@@ -1850,12 +2441,11 @@ def auto_transcribe_and_analyze():
                         print(f"    ⚠️ Transcription failed for {mp3_file}")
                 
                 # Step 2: Assign speaker consistently (דובר 1 = left, דובר 2 = right)
-                # Use a balanced pattern that ensures consistent positioning
-                if 'speaker' not in segment_data:
-                    # Create a deterministic speaker assignment pattern
-                    speaker_id = 0 if i % 2 == 0 else 1  # Alternating pattern
-                    segment_data['speaker'] = speaker_id
+                # The first voice heard is דובר 1; new segments without speech keep the previous speaker
+                if assign_diarized_speaker(segment_data, segment_speakers.get(mp3_path), last_speaker, created):
+                    speaker_id = segment_data['speaker']
                     print(f"    👥 Assigned to דובר {speaker_id + 1} ({'שמאל' if speaker_id == 0 else 'ימין'})")
+                last_speaker = segment_data.get('speaker', last_speaker)
                 
                 # Track speaker distribution
                 speaker = segment_data.get('speaker', 0)
@@ -1870,8 +2460,9 @@ def auto_transcribe_and_analyze():
                     speaker = segment_data.get('speaker', 0)
                     
                     try:
-                        # Run AI analysis with speaker positioning (no audio analysis available in bulk mode)
-                        ai_result = analyze_text_emotion_advanced(transcript_for_analysis, client, speaker=speaker, audio_analysis=None)
+                        # Run AI analysis with speaker positioning and the segment's measured audio features
+                        ai_result = analyze_text_emotion_advanced(transcript_for_analysis, client, speaker=speaker,
+                                                                  audio_analysis=segment_features.get(mp3_path))
                         
                         if ai_result and 'error' not in ai_result:
                             # Update segment with AI analysis results
@@ -1885,7 +2476,8 @@ def auto_transcribe_and_analyze():
                                 'blobSize': ai_result.get('blob_size', 3),
                                 'blobStrength': ai_result.get('blob_intensity', 1000),
                                 'gridResolution': ai_result.get('grid_resolution', 60),
-                                'ai_analyzed': True,
+                                'ai_analyzed': not ai_result.get('pending_ai_upgrade', False),
+                                'pending_ai_upgrade': ai_result.get('pending_ai_upgrade', False),
                                 'ai_analysis_date': datetime.now().isoformat(),
                                 'ai_confidence': 95
                             })
@@ -1911,8 +2503,8 @@ def auto_transcribe_and_analyze():
                 continue
         
         # Save updated emotion data
-        with open(emotion_file_path, 'w', encoding='utf-8') as f:
-            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
+        save_segment_fields(emotion_file_path, changed_segment_fields(loaded_emotion_data, emotion_data),
+                            source="auto-transcribe-and-analyze")
         
         print(f"✅ Auto-processing completed for {conversation_folder}")
         print(f"📊 Processed: {processed_count}, Transcribed: {transcribed_count}, Analyzed: {analyzed_count}")
@@ -1984,60 +2576,48 @@ def create_default_segment_data():
     }
 
 def preprocess_audio_for_transcription(audio_path):
-    """Preprocess audio to improve transcription accuracy"""
-    try:
-        from pydub import AudioSegment
-        from pydub.effects import normalize
-        import tempfile
-        import os
-        
-        print(f"🔧 Preprocessing audio: {audio_path}")
-        
-        # Load audio with error handling
-        try:
-            audio = AudioSegment.from_file(audio_path)
-        except Exception as load_error:
-            print(f"⚠️ Failed to load audio: {str(load_error)}")
-            return audio_path
-        
-        # Check if audio is valid
-        if len(audio) < 100:  # Less than 100ms
-            print("⚠️ Audio file too short, using original")
-            return audio_path
-        
-        # Apply minimal preprocessing to preserve speech quality
-        # 1. Convert to optimal format for transcription
-        audio = audio.set_frame_rate(16000)  # 16kHz is optimal for Whisper
-        audio = audio.set_channels(1)  # Mono
-        audio = audio.set_sample_width(2)  # 16-bit
-        
-        # 2. Handle very quiet or very loud audio
-        if audio.dBFS < -50:
-            # Very quiet audio - boost slightly
-            audio = audio + 15
-        elif audio.dBFS > -10:
-            # Very loud audio - reduce slightly
-            audio = audio - 10
-        
-        # 3. Apply very gentle normalization
-        audio = normalize(audio, headroom=5.0)  # More headroom for stability
-        
-        # 4. Ensure minimum duration (add silence if needed)
-        if len(audio) < 500:  # Less than 0.5 seconds
-            silence = AudioSegment.silent(duration=500 - len(audio))
-            audio = audio + silence
-        
-        # Save preprocessed audio to temp file
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-        audio.export(temp_file.name, format="wav")
-        temp_file.close()
-        
-        print(f"✅ Audio preprocessed: {audio.dBFS:.1f}dB, {audio.frame_rate}Hz, {len(audio)}ms")
-        return temp_file.name
-        
-    except Exception as e:
-        print(f"⚠️ Audio preprocessing failed: {str(e)}, using original file")
-        return audio_path
+    """
+    Preprocess audio to improve transcription accuracy. Returns a PreparedAudio
+    holding a 16kHz mono WAV in memory plus the decoded-PCM hash that keys the
+    shared transcription cache; memoized per file version, so every path of
+    the transcription fallback chain reuses the same result.
+    """
+    prepared = prepare_audio_for_transcription(audio_path)
+    print(f"🔧 Audio ready for transcription: {os.path.basename(audio_path)} "
+          f"({prepared.size:,} bytes{', ' + str(prepared.duration_ms) + 'ms' if prepared.duration_ms is not None else ''})")
+    return prepared
+
+def transcribe_whisper_api_cached(prepared_audio, client, metrics_stage, with_segments=False):
+    """
+    Raw whisper-1 transcript of preprocessed audio, shared through the transcription cache.
+    Requests verbose_json so the segment confidences (avg_logprob, no_speech_prob)
+    are cached alongside the text; with_segments=True returns (text, segments).
+    """
+    pcm_hash = prepared_audio.pcm_hash
+    cached = transcription_cache.get_entry(pcm_hash, "whisper-1", "he")
+    if cached is not None:
+        record_cache_hit('audio.transcriptions', metrics_stage, 'whisper-1')
+        raw_result = cached.get('text', '')
+        return (raw_result, cached.get('segments')) if with_segments else raw_result
+    
+    transcript = client.audio.transcriptions.create(
+        model="whisper-1",
+        metrics_stage=metrics_stage,
+        metrics_cache="miss" if pcm_hash else None,
+        file=prepared_audio.upload(),
+        language="he",  # Hebrew
+        response_format="verbose_json",  # Text plus per-segment confidences
+        temperature=0.0  # More deterministic results
+    )
+    
+    raw_result = (getattr(transcript, 'text', None) or "").strip()
+    segments = [
+        {key: (seg.get(key) if isinstance(seg, dict) else getattr(seg, key, None))
+         for key in ("start", "end", "avg_logprob", "no_speech_prob", "compression_ratio")}
+        for seg in (getattr(transcript, 'segments', None) or [])
+    ]
+    transcription_cache.put(pcm_hash, "whisper-1", raw_result, "he", extra={"segments": segments})
+    return (raw_result, segments) if with_segments else raw_result
 
 def enhance_transcription_with_gpt4(raw_transcript, client):
     """Use GPT-4 to improve and correct Hebrew transcription with better prompts"""
@@ -2064,6 +2644,7 @@ def enhance_transcription_with_gpt4(raw_transcript, client):
 
         response = client.chat.completions.create(
             model="gpt-4o",  # Use the more powerful model for better Hebrew
+            metrics_stage="transcript_enhancement",
             messages=[
                 {"role": "system", "content": "אתה מומחה לתמלול עברית מדויק. תפקידך לתקן ולשפר תמלולים בעברית. החזר רק טקסט נקי ומתוקן ללא גרשיים."},
                 {"role": "user", "content": prompt}
@@ -2084,21 +2665,20 @@ def enhance_transcription_with_gpt4(raw_transcript, client):
 
 def transcribe_with_chatgpt4_direct(audio_path, client):
     """Direct transcription using ChatGPT-4 with audio analysis"""
+    if is_circuit_open('audio.transcriptions'):
+        print("🔌 OpenAI transcription circuit open - skipping ChatGPT-4 direct transcription")
+        return None
     try:
         # First, get a basic transcription with Whisper
-        processed_audio = preprocess_audio_for_transcription(audio_path)
-        
-        with open(processed_audio, "rb") as audio_file:
-            # Get basic transcription
-            basic_transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="he",
-                response_format="text",
-                temperature=0.0
-            )
+        prepared_audio = preprocess_audio_for_transcription(audio_path)
+        pcm_hash = prepared_audio.pcm_hash
+        
+        cached = transcription_cache.get(pcm_hash, TRANSCRIBE_MODEL_GPT4_DIRECT, "he")
+        if cached is not None:
+            print(f"✅ ChatGPT-4 transcription result (cached): '{cached}'")
+            return cached
         
-        raw_result = basic_transcript.strip() if basic_transcript else ""
+        raw_result = transcribe_whisper_api_cached(prepared_audio, client, "transcription_direct")
         print(f"🎯 Basic Whisper result: '{raw_result}'")
         
         if not raw_result or raw_result == "טקסט בעברית." or len(raw_result) < 3:
@@ -2125,6 +2705,7 @@ def transcribe_with_chatgpt4_direct(audio_path, client):
 
         response = client.chat.completions.create(
             model="gpt-4o",
+            metrics_stage="transcript_refinement",
             messages=[
                 {"role": "system", "content": "אתה מומחה לתמלול עברית מדויק. תפקידך לתקן ולשפר תמלולים בעברית."},
                 {"role": "user", "content": analysis_prompt}
@@ -2135,97 +2716,78 @@ def transcribe_with_chatgpt4_direct(audio_path, client):
         
         final_result = response.choices[0].message.content.strip()
         final_result = final_result.strip('"').strip("'")
-        
-        # Clean up temp file
-        if processed_audio and processed_audio != audio_path:
-            import os
-            try:
-                os.unlink(processed_audio)
-            except:
-                pass
+        if final_result != "לא ניתן לתמלל":
+            transcription_cache.put(pcm_hash, TRANSCRIBE_MODEL_GPT4_DIRECT, final_result, "he")
         
         print(f"✅ ChatGPT-4 transcription result: '{final_result}'")
         return final_result
         
-    except Exception as e:
-        print(f"⚠️ ChatGPT-4 direct transcription failed: {str(e)}")
-        
-        # Clean up temp file
-        if processed_audio and processed_audio != audio_path:
-            import os
-            try:
-                os.unlink(processed_audio)
-            except:
-                pass
-                
+    except Exception as e:
+        print(f"⚠️ ChatGPT-4 direct transcription failed: {str(e)}")
         return None
 
 def transcribe_with_openai_whisper(audio_path, client):
-    """Transcribe audio using OpenAI Whisper API with enhanced GPT-4 processing"""
-    import os
-    processed_audio = None
+    """Transcribe audio using OpenAI Whisper API with confidence-gated GPT-4 enhancement"""
+    result = transcribe_with_openai_whisper_detailed(audio_path, client)
+    return result["text"] if result else None
+
+def transcribe_with_openai_whisper_detailed(audio_path, client):
+    """
+    Whisper API transcription; the GPT-4 enhancement pass only runs when the
+    segment confidences or the Hebrew lexicon check flag the raw text as doubtful.
+    Returns {"text", "raw_text", "enhancement": decision} or None on failure.
+    """
+    if is_circuit_open('audio.transcriptions'):
+        print("🔌 OpenAI transcription circuit open - failing fast instead of waiting for timeouts")
+        return None
     try:
-        # Preprocess audio for better transcription
-        processed_audio = preprocess_audio_for_transcription(audio_path)
-        
-        # Check if file exists and has content
-        if not os.path.exists(processed_audio):
-            print(f"⚠️ Processed audio file not found: {processed_audio}")
+        # Preprocess audio for better transcription (shared with the direct path that may have just run)
+        prepared_audio = preprocess_audio_for_transcription(audio_path)
+        pcm_hash = prepared_audio.pcm_hash
+        
+        cached = transcription_cache.get_entry(pcm_hash, TRANSCRIBE_MODEL_WHISPER_ENHANCED, "he")
+        if cached is not None:
+            print(f"✅ Final transcription result (cached): '{cached['text']}'")
+            return {"text": cached['text'], "raw_text": cached.get('raw_text', cached['text']),
+                    "enhancement": cached.get('enhancement')}
+        
+        # Check size (avoid empty files)
+        if prepared_audio.size < 1000:  # Less than 1KB probably empty/corrupt
+            print(f"⚠️ Audio too small ({prepared_audio.size} bytes): {audio_path}")
             return None
-            
-        # Check file size (avoid empty files)
-        file_size = os.path.getsize(processed_audio)
-        if file_size < 1000:  # Less than 1KB probably empty/corrupt
-            print(f"⚠️ Audio file too small ({file_size} bytes): {processed_audio}")
-            return None
-        
-        with open(processed_audio, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                language="he",  # Hebrew
-                response_format="text",  # Simple text response
-                temperature=0.0  # More deterministic results
-            )
         
-        # For text response format, transcript is already a string
-        raw_result = transcript.strip() if transcript else ""
+        raw_result, segments = transcribe_whisper_api_cached(prepared_audio, client, "transcription",
+                                                             with_segments=True)
         print(f"🎯 OpenAI Whisper raw result: '{raw_result}'")
         
-        # Enhanced GPT-4 processing for better results
-        if raw_result and raw_result != "טקסט בעברית." and len(raw_result) > 2:
+        # Decide whether the GPT-4 round trip is worth paying for this segment
+        decision = assess_transcript(raw_result, segments)
+        if raw_result and raw_result != "טקסט בעברית." and len(raw_result) > 2 and decision["enhance"]:
+            print(f"🔧 Enhancing transcript ({', '.join(decision['reasons'])})")
             try:
                 enhanced_result = enhance_transcription_with_gpt4(raw_result, client)
                 result_text = enhanced_result if enhanced_result else raw_result
             except Exception as enhance_error:
                 print(f"⚠️ GPT-4 enhancement failed: {enhance_error}, using raw result")
                 result_text = raw_result
+            decision["applied"] = result_text != raw_result
         else:
+            if raw_result and not decision["enhance"]:
+                print(f"⏭️ Skipping GPT-4 enhancement - transcript looks clean {decision['metrics']}")
             result_text = raw_result
+            decision["applied"] = False
+        decision["decided_at"] = datetime.now().isoformat()
             
         print(f"✅ Final transcription result: '{result_text}'")
+        transcription_cache.put(pcm_hash, TRANSCRIBE_MODEL_WHISPER_ENHANCED, result_text, "he",
+                                extra={"raw_text": raw_result, "enhancement": decision})
         
-        # Clean up temp file
-        if processed_audio and processed_audio != audio_path and os.path.exists(processed_audio):
-            try:
-                os.unlink(processed_audio)
-            except Exception as cleanup_error:
-                print(f"⚠️ Failed to cleanup temp file: {cleanup_error}")
-                
-        return result_text
+        return {"text": result_text, "raw_text": raw_result, "enhancement": decision}
         
     except Exception as e:
         print(f"⚠️ OpenAI Whisper transcription failed: {str(e)}")
         import traceback
         traceback.print_exc()
-        
-        # Clean up temp file
-        if processed_audio and processed_audio != audio_path and os.path.exists(processed_audio):
-            try:
-                os.unlink(processed_audio)
-            except Exception as cleanup_error:
-                print(f"⚠️ Failed to cleanup temp file: {cleanup_error}")
-                
         return None
 
 def transcribe_with_azure_speech(audio_path):
@@ -2273,14 +2835,19 @@ def transcribe_with_google_speech(audio_path):
 
 def transcribe_with_whisper(audio_path):
     """Transcribe audio using local Whisper with improved accuracy"""
-    processed_audio = None
     try:
         # Try to use WhisperX if available
         import whisperx
         device = "cpu"
         
         # Preprocess audio for better transcription
-        processed_audio = preprocess_audio_for_transcription(audio_path)
+        prepared_audio = preprocess_audio_for_transcription(audio_path)
+        pcm_hash = prepared_audio.pcm_hash
+        
+        cached = transcription_cache.get(pcm_hash, TRANSCRIBE_MODEL_WHISPERX, "he")
+        if cached is not None:
+            print(f"🎯 WhisperX result (cached): '{cached}'")
+            return cached
         
         # Try different compute types to avoid compatibility issues
         compute_types = ["int8", "float32", "float16"]
@@ -2295,8 +2862,10 @@ def transcribe_with_whisper(audio_path):
                     compute_type=compute_type
                 )
                 
-                print("🎵 Loading preprocessed audio file...")
-                audio = whisperx.load_audio(processed_audio)
+                print("🎵 Using preprocessed audio from memory...")
+                audio = prepared_audio.float32()
+                if audio is None:
+                    audio = whisperx.load_audio(audio_path)
                 
                 print("🎤 Transcribing with WhisperX...")
                 result = model.transcribe(
@@ -2313,15 +2882,8 @@ def transcribe_with_whisper(audio_path):
                 if segments:
                     transcript = " ".join([seg.get("text", "").strip() for seg in segments])
                     print(f"🎯 WhisperX result: '{transcript}'")
-                    
-                    # Clean up temp file
-                    if processed_audio and processed_audio != audio_path:
-                        import os
-                        try:
-                            os.unlink(processed_audio)
-                        except:
-                            pass
-                            
+                    transcription_cache.put(pcm_hash, TRANSCRIBE_MODEL_WHISPERX, transcript.strip(), "he",
+                                            extra={"compute_type": compute_type})
                     return transcript.strip()
                 else:
                     print("⚠️ No segments found in WhisperX result")
@@ -2332,15 +2894,6 @@ def transcribe_with_whisper(audio_path):
                 continue
         
         print("⚠️ All compute types failed for WhisperX")
-        
-        # Clean up temp file
-        if processed_audio and processed_audio != audio_path:
-            import os
-            try:
-                os.unlink(processed_audio)
-            except:
-                pass
-                
         return None
         
     except ImportError:
@@ -2348,15 +2901,6 @@ def transcribe_with_whisper(audio_path):
         return None
     except Exception as e:
         print(f"⚠️ Local Whisper transcription failed: {str(e)}")
-        
-        # Clean up temp file
-        if processed_audio and processed_audio != audio_path:
-            import os
-            try:
-                os.unlink(processed_audio)
-            except:
-                pass
-                
         return None
 
 @app.route('/api/analyze-emotions', methods=['POST'])
@@ -2439,9 +2983,7 @@ def analyze_emotions():
         # Save emotion data file
         emotion_filename = f"emotions{conversation_folder.replace('convo', '')}_ai_analyzed.json"
         emotion_file_path = os.path.join(conv_path, emotion_filename)
-        
-        with open(emotion_file_path, 'w', encoding='utf-8') as f:
-            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
+        save_segment_fields(emotion_file_path, emotion_data, source="analyze-emotions")
         
         print(f"✅ Generated emotion analysis for {conversation_folder} with {len(emotion_data)} segments")
         
@@ -2480,22 +3022,9 @@ def update_system_config():
         if not conversation_folder:
             return jsonify({"error": "Missing conversation folder"}), 400
         
-        # Load or create conversations config
-        config_file = "config/conversations_config.json"
+        config_file = CONVERSATIONS_CONFIG_FILE
         os.makedirs("config", exist_ok=True)
         
-        if os.path.exists(config_file):
-            with open(config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-        else:
-            config = {"conversations": {}}
-        
-        # Extract conversation number from folder name
-        try:
-            conv_number = int(conversation_folder.replace('convo', ''))
-        except ValueError:
-            conv_number = len(config["conversations"]) + 1
-        
         # Find emotion file
         conv_path = os.path.join("conversations", conversation_folder)
         emotion_file = None
@@ -2507,40 +3036,47 @@ def update_system_config():
         # Count MP3 files
         mp3_count = len([f for f in os.listdir(conv_path) if f.endswith('.mp3') and not f.startswith('original_')])
         
-        # Create conversation config entry with proper file paths
-        conversation_config = {
-            "number": conv_number,
-            "mp3_count": mp3_count,
-            "ai_file": f"conversations/{conversation_folder}/{emotion_file}" if emotion_file else None,
-            "emotion_file": f"conversations/{conversation_folder}/{emotion_file}" if emotion_file else None,
-            "metadata": {
-                "name": metadata.get("name", f"שיחה {conv_number}"),
-                "date": datetime.now().strftime("%Y-%m-%d"),
-                "participants": [metadata.get("name", f"שיחה {conv_number}")],
-                "mainEmotions": ["neutral"],
-                "totalWords": 0,
-                "duration": f"{int(float(metadata.get('duration', 200))) // 60}:{int(float(metadata.get('duration', 200))) % 60:02d}",
-                "tags": [metadata.get("type", "general")],
-                "isImportant": False,
-                "isPrivate": False,
-                "needsReview": False
+        def add_conversation(config):
+            # Extract conversation number from folder name
+            try:
+                conv_number = int(conversation_folder.replace('convo', ''))
+            except ValueError:
+                conv_number = len(config["conversations"]) + 1
+            
+            # Create conversation config entry with proper file paths
+            conversation_config = {
+                "number": conv_number,
+                "mp3_count": mp3_count,
+                "ai_file": f"conversations/{conversation_folder}/{emotion_file}" if emotion_file else None,
+                "emotion_file": f"conversations/{conversation_folder}/{emotion_file}" if emotion_file else None,
+                "metadata": {
+                    "name": metadata.get("name", f"שיחה {conv_number}"),
+                    "date": datetime.now().strftime("%Y-%m-%d"),
+                    "participants": [metadata.get("name", f"שיחה {conv_number}")],
+                    "mainEmotions": ["neutral"],
+                    "totalWords": 0,
+                    "duration": f"{int(float(metadata.get('duration', 200))) // 60}:{int(float(metadata.get('duration', 200))) % 60:02d}",
+                    "tags": [metadata.get("type", "general")],
+                    "isImportant": False,
+                    "isPrivate": False,
+                    "needsReview": False
+                }
             }
-        }
-        
-        # Add to config
-        config["conversations"][conversation_folder] = conversation_config
-        
-        # Update file_mappings if it exists
-        if "file_mappings" not in config:
-            config["file_mappings"] = {}
-        
-        # Add the new conversation to file_mappings
-        if emotion_file:
-            config["file_mappings"][conversation_folder] = f"conversations/{conversation_folder}/{emotion_file}"
+            
+            # Add to config
+            config["conversations"][conversation_folder] = conversation_config
+            
+            # Update file_mappings if it exists
+            if "file_mappings" not in config:
+                config["file_mappings"] = {}
+            
+            # Add the new conversation to file_mappings
+            if emotion_file:
+                config["file_mappings"][conversation_folder] = f"conversations/{conversation_folder}/{emotion_file}"
+            return conv_number
         
-        # Save updated config
-        with open(config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        # Load or create conversations config, add the entry and save it
+        conv_number = update_json(config_file, add_conversation, default={"conversations": {}})
         
         print(f"✅ Updated system configuration for {conversation_folder}")
         
@@ -2567,76 +3103,58 @@ def update_segment():
         "updates": {
             "emotions": ["neutral", "happiness"],
             "coloredCircleCharSize": 4
-        }
+        },
+        "durable": false
     }
+    Updates are applied in memory at once and written with the
+    conversation's other edits by the emotion store's write-behind flush;
+    "durable": true writes them before responding. Until the flush, only
+    reads served by this worker see them, so the response carries the
+    updated segment. Either way the change lands in the conversation's
+    change journal (undo history).
     """
     try:
-        print(f"🔄 API Request received at {datetime.now().strftime('%H:%M:%S')}")
-        
         # Get request data
         data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
             
-        print(f"📥 Request data: {data}")
-        
         # Validate required fields
         conversation = data.get('conversation')
         filename = data.get('filename')
         updates = data.get('updates')
+        durable = bool(data.get('durable', False))
         
-        if not conversation or not filename or not updates:
+        if not conversation or not filename or not updates or not isinstance(updates, dict):
             return jsonify({"error": "Missing required fields: conversation, filename, updates"}), 400
             
         # Construct file path
-        emotion_file = f"conversations/{conversation}/emotions{conversation[5:]}_ai_analyzed.json"
-        
-        print(f"📂 Target emotion file: {emotion_file}")
+        emotion_file = get_segment_emotion_file(conversation)
         
         # Check if file exists
         if not os.path.exists(emotion_file):
             return jsonify({"error": f"Emotion file not found: {emotion_file}"}), 404
-            
-        # Read current emotion data
-        with open(emotion_file, 'r', encoding='utf-8') as f:
-            emotion_data = json.load(f)
-            
-        print(f"📖 Current emotion data loaded, segments: {len(emotion_data)}")
         
-        # Check if segment exists
-        if filename not in emotion_data:
+        # Apply in memory; the write is coalesced with other edits to this conversation
+        previous = emotion_store.stage(emotion_file, filename, updates)
+        if previous is None:
             return jsonify({"error": f"Segment {filename} not found in emotion data"}), 404
-            
-        # Apply updates
-        updated_fields = []
-        for key, value in updates.items():
-            if key in emotion_data[filename]:
-                old_value = emotion_data[filename][key]
-                emotion_data[filename][key] = value
-                updated_fields.append(f"{key}: {old_value} -> {value}")
-                print(f"✅ Updated {filename}.{key}: {old_value} -> {value}")
-            else:
-                # Add new field
-                emotion_data[filename][key] = value
-                updated_fields.append(f"{key}: NEW -> {value}")
-                print(f"➕ Added {filename}.{key}: {value}")
         
-        # Create backup before saving
-        backup_file = f"{emotion_file}.backup.{int(datetime.now().timestamp())}"
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
-        print(f"💾 Backup created: {backup_file}")
+        if durable and not emotion_store.flush(emotion_file, source="update-segment"):
+            return jsonify({"error": f"Could not save {filename}; the change is queued and will be retried"}), 500
         
-        # Save updated data
-        with open(emotion_file, 'w', encoding='utf-8') as f:
-            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
-            
-        print(f"✅ Successfully updated {emotion_file}")
+        updated_fields = [
+            f"{key}: {previous[key]} -> {value}" if key in previous else f"{key}: NEW -> {value}"
+            for key, value in updates.items()
+        ]
+        print(f"✏️ {conversation}/{filename}: {', '.join(updates)} ({'saved' if durable else 'buffered'})")
         
         return jsonify({
             "status": "success",
             "message": f"Updated {filename} in {conversation}",
             "updated_fields": updated_fields,
+            "buffered": not durable,
+            "segment": emotion_store.get_segment(emotion_file, filename),
             "timestamp": datetime.now().isoformat()
         })
         
@@ -2719,8 +3237,7 @@ def save_people_data():
         people_data_path = 'config/people_data.json'
         os.makedirs(os.path.dirname(people_data_path), exist_ok=True)
         
-        with open(people_data_path, 'w', encoding='utf-8') as f:
-            json.dump(people_data, f, ensure_ascii=False, indent=2)
+        atomic_write_json(people_data_path, people_data)
         
         print(f"✅ People data saved to {people_data_path}")
         return jsonify({'success': True})
@@ -2798,18 +3315,57 @@ def get_speaker_info(conversation_id):
         print(f"❌ Error getting speaker info: {e}")
         return jsonify({'speakers': {}}), 500
 
+@app.route('/api/emotion-history/<conversation>')
+def get_emotion_history(conversation):
+    """Journaled changes of a conversation's emotion file (newest last); ?since=<epoch or ISO>&limit=<n>"""
+    try:
+        emotion_file = get_segment_emotion_file(os.path.basename(conversation))
+        if not os.path.exists(emotion_file):
+            return jsonify({"error": f"Emotion file not found: {emotion_file}"}), 404
+        since = request.args.get('since')
+        limit = request.args.get('limit', 200, type=int)
+        history = journal_entries(emotion_file, since=parse_timestamp(since) if since else None)
+        return jsonify({
+            "success": True,
+            "conversation": conversation,
+            "total": len(history),
+            "entries": history[-limit:] if limit > 0 else history
+        })
+    except Exception as e:
+        print(f"❌ Error reading emotion history: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/emotion-history/<conversation>/restore', methods=['POST'])
+def restore_emotion_history(conversation):
+    """Restore a conversation's emotion file to its state at {"timestamp": <epoch or ISO>} ("dryRun" to preview)"""
+    try:
+        data = request.get_json() or {}
+        if data.get('timestamp') is None:
+            return jsonify({"error": "Missing timestamp"}), 400
+        emotion_file = get_segment_emotion_file(os.path.basename(conversation))
+        if not os.path.exists(emotion_file):
+            return jsonify({"error": f"Emotion file not found: {emotion_file}"}), 404
+        result = restore_emotion_file(emotion_file, parse_timestamp(str(data['timestamp'])),
+                                      dry_run=bool(data.get('dryRun', False)))
+        print(f"⏪ {'Previewed' if result['dry_run'] else 'Restored'} {conversation} to {data['timestamp']}: "
+              f"{result['changes']} fields in {len(result['segments'])} segments")
+        return jsonify({"success": True, **result})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"❌ Error restoring emotion history: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/get-segment/<conversation>/<filename>')
 def get_segment(conversation, filename):
     """Get current data for a specific segment"""
     try:
         emotion_file = f"conversations/{conversation}/emotions{conversation[5:]}_ai_analyzed.json"
         
-        if not os.path.exists(emotion_file):
+        emotion_data = emotion_store.read(emotion_file)
+        if emotion_data is None:
             return jsonify({"error": f"Emotion file not found: {emotion_file}"}), 404
             
-        with open(emotion_file, 'r', encoding='utf-8') as f:
-            emotion_data = json.load(f)
-            
         if filename not in emotion_data:
             return jsonify({"error": f"Segment {filename} not found"}), 404
             
@@ -2821,6 +3377,64 @@ def get_segment(conversation, filename):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/loudness-envelopes/<conversation>')
+def get_loudness_envelopes(conversation):
+    """Playback loudness envelopes of every segment (for emotion files written before they existed)"""
+    try:
+        conv_path = os.path.join("conversations", os.path.basename(conversation))
+        if not os.path.isdir(conv_path):
+            return jsonify({"error": f"Conversation not found: {conversation}"}), 404
+
+        segment_files = sorted(f for f in os.listdir(conv_path) if f.endswith('.mp3'))
+        envelopes = {name: envelope for name, envelope in conversation_envelopes(conv_path, segment_files).items() if envelope}
+        return jsonify({
+            "status": "success",
+            "envelopes": envelopes
+        })
+
+    except Exception as e:
+        print(f"❌ Error loading loudness envelopes for {conversation}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/fingerprints', methods=['GET'])
+def fingerprint_stats():
+    """Size of the audio fingerprint index"""
+    try:
+        return jsonify({"status": "success", **fingerprint_index.stats()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/fingerprints/update', methods=['POST'])
+def update_fingerprints():
+    """Fingerprint new and changed recordings and segments of the whole archive (incremental)"""
+    try:
+        if (request.get_json(silent=True) or {}).get('background', True):
+            fingerprint_index.update_async()
+            return jsonify({"status": "started"})
+        return jsonify({"status": "success", **fingerprint_index.update()})
+    except Exception as e:
+        print(f"❌ Error updating fingerprint index: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/backups/report', methods=['GET'])
+def backup_report():
+    """Dry run of backup maintenance: what would be moved into the store, deduplicated and pruned"""
+    try:
+        return jsonify({"status": "success", **backup_store.maintain(dry_run=True)})
+    except Exception as e:
+        print(f"❌ Error building backup report: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/backups/maintenance', methods=['POST'])
+def run_backup_maintenance():
+    """Move backup copies into the store, apply the retention policy and delete unreferenced content"""
+    try:
+        dry_run = bool((request.get_json(silent=True) or {}).get('dryRun', False))
+        return jsonify({"status": "success", **backup_store.maintain(dry_run=dry_run)})
+    except Exception as e:
+        print(f"❌ Error running backup maintenance: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/conversations')
 def list_conversations():
     """List all available conversations"""
@@ -2900,8 +3514,7 @@ def generate_video():
         
         # Save metadata
         metadata_file = os.path.join(videos_dir, f"{conversation_folder}_metadata.json")
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(video_metadata, f, ensure_ascii=False, indent=2)
+        atomic_write_json(metadata_file, video_metadata)
             
         print(f"✅ Real video generated: {video_path} ({file_size_mb}MB)")
         
@@ -2982,8 +3595,7 @@ def generate_enhanced_video():
         
         # Save metadata
         metadata_file = os.path.join(videos_dir, f"{conversation}_metadata.json")
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(video_metadata, f, ensure_ascii=False, indent=2)
+        atomic_write_json(metadata_file, video_metadata)
             
         print(f"✅ Enhanced video generated: {video_path} ({file_size_mb}MB)")
         
@@ -3556,16 +4168,14 @@ def save_visualization_parameters():
         # Ensure config directory exists
         os.makedirs('config', exist_ok=True)
         
-        # Create backup of existing config
+        # Back up the existing config (unchanged content is stored once)
         config_path = 'config/visualization_parameters.json'
         if os.path.exists(config_path):
-            backup_path = f'{config_path}.backup.{int(time.time())}'
-            shutil.copy2(config_path, backup_path)
-            print(f"📋 Created backup: {backup_path}")
+            backup_path = backup_store.add(config_path)
+            print(f"📋 Created backup: {backup_path or 'unchanged since last backup'}")
         
         # Save to config file
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(parameters_config, f, ensure_ascii=False, indent=2)
+        atomic_write_json(config_path, parameters_config)
         
         print(f"🎨 Saved visualization parameters configuration")
         
@@ -3594,8 +4204,7 @@ def save_emotions_config():
         
         # Save to config file
         config_path = 'config/emotions_config.json'
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(emotions_config, f, ensure_ascii=False, indent=2)
+        atomic_write_json(config_path, emotions_config)
         
         print(f"📊 Saved emotions configuration with {len(emotions_config)} emotions")
         
@@ -3643,45 +4252,32 @@ def update_all_emotion_colors():
                 emotion_file_path = os.path.join(conv_path, emotion_file)
                 
                 try:
-                    # Load emotion data
-                    with open(emotion_file_path, 'r', encoding='utf-8') as f:
-                        emotion_data = json.load(f)
-                    
-                    # Check if any segments need color updates
-                    file_changed = False
-                    segments_updated_in_file = 0
-                    
-                    for segment_key, segment_data in emotion_data.items():
-                        if segment_key.endswith('.mp3') and isinstance(segment_data, dict):
-                            emotions = segment_data.get('emotions', [])
-                            
-                            if emotions:
-                                # Initialize emotionColors if not present
-                                if 'emotionColors' not in segment_data:
-                                    segment_data['emotionColors'] = {}
+                    def apply(emotion_data):
+                        # Count segments needing color updates (the file is only rewritten when any changed)
+                        segments_updated_in_file = 0
+                        
+                        for segment_key, segment_data in emotion_data.items():
+                            if segment_key.endswith('.mp3') and isinstance(segment_data, dict):
+                                emotions = segment_data.get('emotions', [])
                                 
-                                # Update colors for each emotion in this segment
-                                for emotion in emotions:
-                                    if emotion in emotions_config and 'color' in emotions_config[emotion]:
-                                        new_color = emotions_config[emotion]['color']
-                                        old_color = segment_data['emotionColors'].get(emotion)
-                                        
-                                        if old_color != new_color:
-                                            segment_data['emotionColors'][emotion] = new_color
-                                            file_changed = True
-                                            segments_updated_in_file += 1
+                                if emotions:
+                                    # Initialize emotionColors if not present
+                                    if 'emotionColors' not in segment_data:
+                                        segment_data['emotionColors'] = {}
+                                    
+                                    # Update colors for each emotion in this segment
+                                    for emotion in emotions:
+                                        if emotion in emotions_config and 'color' in emotions_config[emotion]:
+                                            new_color = emotions_config[emotion]['color']
+                                            old_color = segment_data['emotionColors'].get(emotion)
+                                            
+                                            if old_color != new_color:
+                                                segment_data['emotionColors'][emotion] = new_color
+                                                segments_updated_in_file += 1
+                        return segments_updated_in_file
                     
-                    # Save if changes were made
-                    if file_changed:
-                        # Create backup
-                        backup_file = f"{emotion_file_path}.backup.{int(datetime.now().timestamp())}"
-                        with open(backup_file, 'w', encoding='utf-8') as f:
-                            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
-                        
-                        # Save updated data
-                        with open(emotion_file_path, 'w', encoding='utf-8') as f:
-                            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
-                        
+                    segments_updated_in_file = emotion_store.update(emotion_file_path, apply, source="update-all-emotion-colors")
+                    if segments_updated_in_file:
                         updated_conversations += 1
                         updated_segments += segments_updated_in_file
                         print(f"✅ Updated {conversation_folder}/{emotion_file}: {segments_updated_in_file} segments")
@@ -3718,9 +4314,9 @@ def save_config():
         # Ensure the directory exists
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         
-        # Save the file
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(content, f, ensure_ascii=False, indent=2)
+        # Save the file (under its lock, so concurrent read-modify-write cycles don't overwrite it)
+        with file_lock(filename):
+            atomic_write_json(filename, content)
         
         print(f"📝 Saved configuration: {filename}")
         
@@ -3833,18 +4429,13 @@ def delete_conversation():
         shutil.rmtree(conversation_path)
         
         # Remove from conversations_config.json
-        config_path = 'config/conversations_config.json'
-        if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            
+        def remove_conversation(config):
             if 'conversations' in config and folder in config['conversations']:
                 del config['conversations'][folder]
                 config['total_conversations'] = len(config['conversations'])
-                
-                # Save updated config
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, ensure_ascii=False, indent=2)
+        
+        if os.path.exists(CONVERSATIONS_CONFIG_FILE):
+            update_json(CONVERSATIONS_CONFIG_FILE, remove_conversation)
         
         print(f"🗑️ Deleted conversation: {folder} ({conversation_name})")
         
@@ -3876,11 +4467,21 @@ def server_status():
             "conversation_management": True,
             "sync_to_production": True
         },
+        "openai_circuit": get_breaker_status(),
         "timestamp": datetime.now().isoformat(),
         "version": "1.2.0"
     })
 
-
+@app.route('/api/metrics')
+def model_metrics():
+    """Model call latency/token/cost histograms; ?format=prometheus for text exposition"""
+    try:
+        if request.args.get('format') == 'prometheus':
+            return app.response_class(format_prometheus(), mimetype='text/plain; version=0.0.4')
+        return jsonify({"success": True, **get_metrics_snapshot()})
+    except Exception as e:
+        print(f"❌ Error in metrics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/videos')
 def api_videos():
@@ -4040,21 +4641,17 @@ def upload_mp4_preview():
         else:
             return jsonify({"error": "Conversations configuration not found"}), 404
             
-        # Create backup of existing video if it exists (check for both mp4 and webm)
+        # Move the existing video (mp4 or webm) into the backup store
         existing_preview_mp4 = os.path.join(videos_dir, f"{conversation_id}.mp4")
         existing_preview_webm = os.path.join(videos_dir, f"{conversation_id}.webm")
         
         if os.path.exists(existing_preview_mp4):
-            backup_path = os.path.join(videos_dir, f"{conversation_id}_backup_{int(time.time())}.mp4")
-            shutil.copy2(existing_preview_mp4, backup_path)
-            os.remove(existing_preview_mp4)  # Remove old format
-            print(f"📼 Created backup and removed old MP4: {backup_path}")
+            backup_path = backup_store.add(existing_preview_mp4, move=True)
+            print(f"📼 Backed up and removed old MP4: {backup_path or 'already backed up'}")
             
         if os.path.exists(existing_preview_webm):
-            backup_path = os.path.join(videos_dir, f"{conversation_id}_backup_{int(time.time())}.webm")
-            shutil.copy2(existing_preview_webm, backup_path)
-            os.remove(existing_preview_webm)  # Remove old format
-            print(f"📼 Created backup and removed old WebM: {backup_path}")
+            backup_path = backup_store.add(existing_preview_webm, move=True)
+            print(f"📼 Backed up and removed old WebM: {backup_path or 'already backed up'}")
             
         # Save the preview file with original extension
         preview_path = os.path.join(videos_dir, f"{conversation_id}{file_ext}")
@@ -4071,8 +4668,7 @@ def upload_mp4_preview():
         }
         
         metadata_path = os.path.join(videos_dir, f"{conversation_id}_metadata.json")
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        atomic_write_json(metadata_path, metadata)
             
         print(f"📼 Preview uploaded for {conversation_id}: {preview_file.filename}")
         
@@ -4141,11 +4737,10 @@ def generate_mp4_preview():
             # Generate the video using the visualization capture system
             preview_path = os.path.join(videos_dir, f"{conversation_id}.mp4")
             
-            # Create backup if existing video exists
+            # Back up the existing video (unchanged content is stored once)
             if os.path.exists(preview_path):
-                backup_path = os.path.join(videos_dir, f"{conversation_id}_backup_{int(time.time())}.mp4")
-                shutil.copy2(preview_path, backup_path)
-                print(f"📼 Created backup: {backup_path}")
+                backup_path = backup_store.add(preview_path)
+                print(f"📼 Created backup: {backup_path or 'unchanged since last backup'}")
             
             # Generate the video
             result = capture_video_visualization(
@@ -4169,8 +4764,7 @@ def generate_mp4_preview():
                 }
                 
                 metadata_path = os.path.join(videos_dir, f"{conversation_id}_metadata.json")
-                with open(metadata_path, 'w', encoding='utf-8') as f:
-                    json.dump(metadata, f, ensure_ascii=False, indent=2)
+                atomic_write_json(metadata_path, metadata)
                     
                 print(f"📼 Generated preview for {conversation_id}")
                 
@@ -4209,12 +4803,12 @@ if __name__ == '__main__':
 
 # Advanced conversation analysis endpoints
 @app.route('/api/analyze-advanced', methods=['POST'])
+@track_model_job('analyze-advanced')
 def analyze_advanced():
     """
     Advanced conversation analysis endpoint with OpenAI integration
     """
     try:
-        import openai
         import tempfile
         import numpy as np
         
@@ -4223,7 +4817,7 @@ def analyze_advanced():
         if not api_key:
             return jsonify({"error": "OpenAI API key not configured"}), 500
         
-        client = openai.OpenAI(api_key=api_key)
+        client = create_openai_client(api_key)
         
         # Debug logging
         print(f"🔍 Received advanced analysis request:")
@@ -4315,7 +4909,7 @@ def analyze_advanced():
                 
                 # Analyze emotion with OpenAI
                 try:
-                    emo = analyze_text_emotion_advanced(transcript, client)
+                    emo = analyze_text_emotion_advanced(transcript, client, audio_analysis=vol)
                     print(f"✅ Emotion analysis completed for conversation {i+1}")
                 except Exception as e:
                     print(f"⚠️ Emotion analysis failed for transcript {i+1}: {str(e)}")
@@ -4392,16 +4986,14 @@ def get_conversation_details(conversation_id):
         ai_file_path = conv_data.get('ai_file', '')
         transcript = ""
         
-        if os.path.exists(ai_file_path):
-            with open(ai_file_path, 'r', encoding='utf-8') as f:
-                ai_data = json.load(f)
-                # Extract transcript from segments if available
-                if 'segments' in ai_data:
-                    transcript_parts = []
-                    for segment in ai_data['segments']:
-                        if 'transcript' in segment:
-                            transcript_parts.append(segment['transcript'])
-                    transcript = ' '.join(transcript_parts)
+        ai_data = emotion_store.read(ai_file_path) if ai_file_path else None
+        # Extract transcript from segments if available
+        if ai_data is not None and 'segments' in ai_data:
+            transcript_parts = []
+            for segment in ai_data['segments']:
+                if 'transcript' in segment:
+                    transcript_parts.append(segment['transcript'])
+            transcript = ' '.join(transcript_parts)
         
         return jsonify({
             "success": True,
@@ -4447,46 +5039,40 @@ def apply_analysis_results():
         if not emotion_file:
             return jsonify({"error": f"No emotion file found for {conversation}"}), 404
         
-        # Load existing emotion data
-        with open(emotion_file, 'r', encoding='utf-8') as f:
-            emotion_data = json.load(f)
-        
-        # Create backup
-        backup_file = f"{emotion_file}.backup_{int(time.time())}"
-        shutil.copy2(emotion_file, backup_file)
+        restore_point = time.time()
         
-        # Update parameters based on analysis results
-        updated_segments = 0
-        for segment_name, segment_data in emotion_data.items():
-            if segment_name.endswith('.mp3'):
-                # Apply new parameters from analysis
-                if 'minBlobSpacing' not in segment_data:
-                    segment_data['minBlobSpacing'] = results.get('proximity', 'middle')
-                
-                # Update blob parameters
-                segment_data['blobSizeScale'] = results.get('blob_size', 3)
-                segment_data['blobStrength'] = results.get('blob_intensity', 1000)
-                segment_data['blobDensity'] = results.get('dominance', 1000) / 1000.0
-                segment_data['blobiness'] = results.get('blobiness', 5)
-                
-                # Update visual effects
-                segment_data['blur'] = results.get('blur', 0)
-                segment_data['shine'] = results.get('spark', 0)
-                
-                # Update emotion data
-                segment_data['emotion_detected'] = results.get('emotion_detected', 'neutral')
-                segment_data['humor_score'] = results.get('humor_score', 0)
-                segment_data['tone'] = results.get('tone', 'נייטרלי')
-                
-                # Update transcript if provided
-                if results.get('text'):
-                    segment_data['transcript'] = results['text']
+        def apply(emotion_data):
+            # Update parameters based on analysis results
+            updated_segments = 0
+            for segment_name, segment_data in emotion_data.items():
+                if segment_name.endswith('.mp3'):
+                    # Apply new parameters from analysis
+                    if 'minBlobSpacing' not in segment_data:
+                        segment_data['minBlobSpacing'] = results.get('proximity', 'middle')
+                    
+                    # Update blob parameters
+                    segment_data['blobSizeScale'] = results.get('blob_size', 3)
+                    segment_data['blobStrength'] = results.get('blob_intensity', 1000)
+                    segment_data['blobDensity'] = results.get('dominance', 1000) / 1000.0
+                    segment_data['blobiness'] = results.get('blobiness', 5)
+                    
+                    # Update visual effects
+                    segment_data['blur'] = results.get('blur', 0)
+                    segment_data['shine'] = results.get('spark', 0)
+                    
+                    # Update emotion data
+                    segment_data['emotion_detected'] = results.get('emotion_detected', 'neutral')
+                    segment_data['humor_score'] = results.get('humor_score', 0)
+                    segment_data['tone'] = results.get('tone', 'נייטרלי')
+                    
+                    # Update transcript if provided
+                    if results.get('text'):
+                        segment_data['transcript'] = results['text']
                 
-                updated_segments += 1
+                    updated_segments += 1
+            return updated_segments
         
-        # Save updated emotion data
-        with open(emotion_file, 'w', encoding='utf-8') as f:
-            json.dump(emotion_data, f, ensure_ascii=False, indent=2)
+        updated_segments = emotion_store.update(emotion_file, apply, source="apply-analysis-results")
         
         print(f"✅ Applied analysis results to {conversation}: {updated_segments} segments updated")
         
@@ -4494,7 +5080,7 @@ def apply_analysis_results():
             "status": "success",
             "conversation": conversation,
             "updatedSegments": updated_segments,
-            "backupFile": os.path.basename(backup_file),
+            "restorePoint": restore_point,
             "message": f"עודכנו {updated_segments} קטעים בשיחה {conversation}"
         })
         
@@ -4507,60 +5093,13 @@ def apply_analysis_results():
         }), 500
 
 def analyze_volume_advanced(file_path):
-    """Analyze volume characteristics from audio file"""
+    """
+    Analyze volume characteristics from audio file: the legacy mean/max/std/
+    duration/energy keys plus 0..1 volume and energy levels, peak, ZCR,
+    spectral centroid, speech ratio and the RMS envelope (backend.audio_features)
+    """
     try:
-        import numpy as np
-        if file_path.lower().endswith('.mp3'):
-            audio = AudioSegment.from_mp3(file_path)
-        elif file_path.lower().endswith('.wav'):
-            audio = AudioSegment.from_wav(file_path)
-        elif file_path.lower().endswith('.m4a'):
-            audio = AudioSegment.from_file(file_path, format="mp4")
-        else:
-            audio = AudioSegment.from_file(file_path)
-        
-        audio = audio.set_channels(1)
-        samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
-        
-        if len(samples) == 0:
-            return {"mean": 0.0, "max": 0.0, "std": 0.0, "duration": 0.0, "energy": 0.0}
-        
-        frame_rate = audio.frame_rate
-        duration = len(audio) / 1000.0
-        
-        chunk_ms = 500
-        chunk_size = int(frame_rate * (chunk_ms / 1000.0))
-        if chunk_size == 0:
-            chunk_size = 1
-        
-        rms = []
-        for i in range(0, len(samples), chunk_size):
-            chunk = samples[i:i+chunk_size]
-            if len(chunk) > 0:
-                rms_val = np.sqrt(np.mean(chunk**2))
-                rms.append(rms_val)
-        
-        if not rms:
-            return {"mean": 0.0, "max": 0.0, "std": 0.0, "duration": duration, "energy": 0.0}
-        
-        rms = np.array(rms)
-        rms_min = np.min(rms)
-        rms_max = np.max(rms)
-        ptp_val = rms_max - rms_min
-        
-        if ptp_val != 0:
-            normalized = (rms - rms_min) / ptp_val
-        else:
-            normalized = rms
-        
-        return {
-            "mean": float(normalized.mean()),
-            "max": float(normalized.max()),
-            "std": float(normalized.std()),
-            "duration": duration,
-            "energy": float(np.mean(rms))
-        }
-        
+        return analyze_audio_file(file_path)
     except Exception as e:
         print(f"❌ Error analyzing volume: {str(e)}")
         return {"mean": 0.0, "max": 0.0, "std": 0.0, "duration": 0.0, "energy": 0.0}
@@ -4634,7 +5173,12 @@ def analyze_text_emotion_advanced(text, client, speaker=None, audio_analysis=Non
         text = text.strip()
         if not text:
             return create_default_emotion_response_advanced("טקסט ריק")
-        
+
+        # Provider is known to be down - answer locally right away instead of waiting out timeouts
+        if is_circuit_open('chat.completions'):
+            print("🔌 OpenAI circuit open - answering with local Hebrew analyzer")
+            return create_local_emotion_response_advanced(text, speaker=speaker, reason="circuit_open")
+
         if len(text) > 1000:
             text = text[:1000] + "..."
         
@@ -4648,71 +5192,30 @@ def analyze_text_emotion_advanced(text, client, speaker=None, audio_analysis=Non
         
         print(f"🎭 Loaded {len(all_emotions_hebrew)} active emotions from admin panel")
         
-        # Step 1: Enhanced emotion detection with ALL 92 available emotions
-        # Format emotions for GPT in manageable chunks for better readability
-        emotions_per_line = 6  # Better readability with 6 emotions per line
-        emotion_lines = []
-        for i in range(0, len(all_emotions_hebrew), emotions_per_line):
-            chunk = all_emotions_hebrew[i:i + emotions_per_line]
-            emotion_lines.append(' | '.join(chunk))
-        
-        all_emotions_formatted = '\n'.join(emotion_lines)
-        
-        print(f"🎭 Using ALL {len(all_emotions_hebrew)} emotions from emotions management for ChatGPT analysis")
-        print(f"📋 Complete emotion list: {', '.join(all_emotions_hebrew[:10])}...") # Show first 10
-        
-        emotion_prompt = f"""אתה מומחה מתקדם לניתוח רגשות בעברית עם גישה לכל {len(all_emotions_hebrew)} רגשות זמינים. 
-נתח את הטקסט בעומק וזהה את הרגשות הדומיננטיים (1-3 רגשות מקסימום).
-
-🎭 כל {len(all_emotions_hebrew)} הרגשות הזמינים (השתמש בדיוק ברגשות האלה):
-{all_emotions_formatted}
-
-📊 הנחיות מתקדמות לניתוח:
-• **בחר 1-3 רגשות המשקפים הכי טוב את הטקסט**
-• **השתמש רק ברגשות מהרשימה למעלה**
-• **אל תבטח על "ניטרלי" אלא אם כן באמת אין רגש מזוהה**
-
-🎯 מדריך זיהוי רגשות מתקדם:
-• שאלות ידידותיות ("מה שלומך?", "רוצה משהו?") → סקרנות, חיבה, נעים
-• ביטויי אהבה וחיבה → אהבה, חיבה, התרגשות
-• שמחה ואושר → שמחה, שמח, התרגשות
-• עצב ודכאון → עצב, דכאון, אכזבה
-• כעס וזעם → כעס, תסכול, עצבנות
-• פחד וחרדה → חרד, דאגה, פחד
-• עייפות → תשישות, מתוח קלות
-• תמיכה ועידוד → תומך, מעודד, דאגה
-• הכרת תודה → הכרת תודה, הערכה
-• הערצה והשראה → הערצה, התרגשות
-• הפתעה → הפתעה, מופתע
-• סקרנות → סקרנות, מעוניין, סקרן
-• בלבול → מבולבל, אי ודאות, לא בטוח
-• ביקורת ואי הסכמה → אי הסכמה, ביקורת, ספקנות
-• דחיפות → דחוף, דחיפות
-• נחישות → נחוש, נחישות, ביטחון
-
-🎭 דוגמאות מתקדמות:
-• "איך אתה מרגיש? מקווה שהכל בסדר" → דאגה, סקרנות
-• "אני אוהב אותך כל כך, זה מדהים!" → אהבה, התרגשות, שמחה
-• "אני עייף מהיום אבל שמח שהצלחתי" → תשישות, שמחה, סיפוק
-• "לא הבנתי מה קורה פה, זה מבלבל" → מבולבל, אי ודאות
-• "תודה רבה! זה באמת עזר לי" → הכרת תודה, הערכה
-• "אני לא מסכים איתך בנושא הזה" → אי הסכמה
-• "מתי נפגש? אני מצפה לזה!" → ציפייה, התרגשות
-
-📝 טקסט לניתוח: "{text}"
-
-השב עם 1-3 רגשות מהרשימה למעלה, מופרדים בפסיק:"""
-
-        # Get emotion first
-        emotion_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": emotion_prompt}],
-            temperature=0.2,
-            max_tokens=30  # Increased to allow for multiple emotions
-        )
+        # Static instructions + emotion list are pre-rendered once per emotions config version
+        templates = get_prompt_templates(emotions_data)
         
-        detected_emotion = emotion_response.choices[0].message.content.strip()
-        print(f"🎭 Step 1 - Detected emotion(s): {detected_emotion}")
+        print(f"🎭 Using ALL {len(all_emotions_hebrew)} emotions from emotions management for ChatGPT analysis (prompt {templates.version})")
+        
+        # Step 1: Enhanced emotion detection with ALL available emotions
+        detection_key = make_cache_key(templates.version, "detect", "gpt-4o", text)
+        detected_emotion = detection_cache.get(detection_key)
+        if detected_emotion is not None:
+            print(f"🎭 Step 1 - Detected emotion(s) (cached, {templates.version}): {detected_emotion}")
+            record_cache_hit('chat.completions', 'emotion_detection', 'gpt-4o')
+        else:
+            emotion_response = client.chat.completions.create(
+                model="gpt-4o",
+                metrics_stage="emotion_detection",
+                metrics_cache="miss",
+                messages=templates.detection_messages(text),
+                temperature=0.2,
+                max_tokens=30  # Increased to allow for multiple emotions
+            )
+            
+            detected_emotion = emotion_response.choices[0].message.content.strip()
+            detection_cache.put(detection_key, detected_emotion)
+            print(f"🎭 Step 1 - Detected emotion(s) ({templates.version}): {detected_emotion}")
         
         # Parse multiple emotions from response
         # Handle formats like "רגש1", "רגש1, רגש2", "רגש1,רגש2", etc.
@@ -4778,61 +5281,14 @@ def analyze_text_emotion_advanced(text, client, speaker=None, audio_analysis=Non
                 
         print(f"🎭 Consistent positioning: {speaker_text} (speaker {speaker}) → {speaker_position}")
 
-        # Step 2: Comprehensive analysis combining TEXT + AUDIO with all 92 emotions
-        prompt = f"""אתה מנתח מתקדם לטקסט ואודיו בעברית. נתח את הטקסט ושלב עם מידע האודיו לקבלת פרמטרים ויזואליים מדויקים.
-
-📊 מידע מוכן:
-• רגשות מזוהים: {', '.join(validated_emotions)}
-• רגש ראשי לויזואליזציה: {primary_emotion}
-• ספירת מילים: {word_count}
-• רזולוציית גריד מחושבת: {calculated_grid_resolution} (מילים × 10)
-• דובר: {speaker_text} - מיקום קבוע: "{speaker_position}"
-
-🎧 מידע אודיו (שלב עם הטקסט):
-• עוצמת קול: {audio_analysis.get('volume', 0.5) * 100:.1f}%
-• אנרגיה: {audio_analysis.get('energy', 0.5) * 100:.1f}%
-• משך: {audio_analysis.get('duration', 1.0):.1f} שניות
-
-📝 טקסט לניתוח: "{text}"
-
-🎯 הנחיות לפרמטרים ויזואליים (התבסס על הטקסט + האודיו):
-• humor_score: עוצמת הומור בטקסט (0-10)
-• blur: טשטוש על פי עוצמת הרגש - רגשות חזקים = פחות טשטוש
-• spark: ברק/זוהר על פי התרגשות ואנרגיה 
-• blob_size: גודל בהתאם לעוצמת האודיו ורגש
-• blob_intensity: עוצמה על פי אנרגיית האודיו + רגש
-• blobiness: נזילות על פי סוג הרגש (רגשות רכים = יותר נזיל)
-• proximity: קרבה בין אלמנטים על פי אינטימיות הטקסט
-
-החזר JSON (השתמש בערכים המסופקים בדיוק):
-{{
-  "emotions_detected": {validated_emotions},
-  "primary_emotion": "{primary_emotion}",
-  "word_count": {word_count},
-  "humor_score": <0-10, התבסס על הומור בטקסט>,
-  "tone": "<נייטרלי | קליל | מתוח | ציני | חם | קר>",
-  "is_question": <true/false>,
-  "intention": "<פתיחת שיחה | הצעת פעולה | הסכמה | בדיחה | בקשת מידע | ביקורת | ביטוי רגש>",
-  "godel_to_regesh": <0.5-5.0, עוצמת הרגש מהטקסט>,
-  "kamut_to_regesh": <0-200, כמות תווי רגש>,
-  "blur": <0-12, פחות טשטוש לרגשות חזקים>,
-  "spark": <0-10, ברק על פי התרגשות ואנרגיה>,
-  "godel_to_regular": <0.2-2.0, גודל תווים רגילים>,
-  "grid_resolution": {calculated_grid_resolution},
-  "blob_size": <1-10, התבסס על עוצמת אודיו + רגש>,
-  "blob_intensity": <0-5000, התבסס על אנרגיית אודיו>,
-  "dominance": <0-5000, דומיננטיות הרגש>,
-  "blobiness": <0-10, נזילות על פי סוג הרגש>,
-  "speaker_position": "{speaker_position}",
-  "proximity": "<מחובר | קרוב מאוד | קרוב | בינוני | רחוק | רחוק מאוד>",
-  "volume_factor": <0.1-2.0, מכפיל על פי עוצמת האודיו>,
-  "energy_factor": <0.1-2.0, מכפיל על פי אנרגיית האודיו>,
-  "summary": "<הסבר קצר בעברית על הניתוח>"
-}}"""
-
+        # Step 2: Comprehensive analysis combining TEXT + AUDIO - only the trailing user message varies
         response = client.chat.completions.create(
             model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
+            metrics_stage="emotion_parameters",
+            messages=templates.analysis_messages(
+                text, validated_emotions, primary_emotion, word_count, calculated_grid_resolution,
+                speaker_text, speaker_position, audio_analysis
+            ),
             temperature=0.4,
             max_tokens=1000
         )
@@ -4858,9 +5314,12 @@ def analyze_text_emotion_advanced(text, client, speaker=None, audio_analysis=Non
             final_emotions = validated_emotions
             primary_emotion = final_emotions[0] if final_emotions else 'ניטרלי'
             
-            # Update the JSON with our validated emotions
+            # Update the JSON with our validated emotions and precomputed values
             parsed_json['emotions_detected'] = final_emotions
             parsed_json['primary_emotion'] = primary_emotion
+            parsed_json['word_count'] = word_count
+            parsed_json['grid_resolution'] = calculated_grid_resolution
+            parsed_json['prompt_version'] = templates.version
             
             # ENFORCE CONSISTENT SPEAKER POSITIONING - override ChatGPT if needed
             if speaker is not None:
@@ -4873,16 +5332,64 @@ def analyze_text_emotion_advanced(text, client, speaker=None, audio_analysis=Non
                     
                 print(f"🎭 Enforced speaker positioning: speaker {speaker} → {parsed_json['speaker_position']}")
             
-            print(f"🎭 Final validated emotions: {final_emotions}")
+            print(f"🎭 Final validated emotions: {final_emotions} (prompt {templates.version})")
             
             return validate_emotion_response_advanced(parsed_json, speaker=speaker)
         except json.JSONDecodeError as e:
             print(f"❌ Failed to parse GPT JSON: {message}")
             return create_default_emotion_response_advanced("שגיאה בניתוח GPT")
-            
+
+    except CircuitOpenError as e:
+        print(f"🔌 {str(e)} - answering with local Hebrew analyzer")
+        return create_local_emotion_response_advanced(text or "", speaker=speaker, reason="circuit_open")
     except Exception as e:
         print(f"❌ Error in emotion analysis: {str(e)}")
-        return create_default_emotion_response_advanced("שגיאה בחיבור ל-GPT")
+        # Retries are exhausted at this point - a local answer beats a blanket neutral default
+        return create_local_emotion_response_advanced(text or "", speaker=speaker, reason=type(e).__name__)
+
+def create_local_emotion_response_advanced(text, speaker=None, reason=""):
+    """
+    Answer an analysis request with the local HebrewEmotionAnalyzer.
+    The result is flagged with pending_ai_upgrade so it can be re-run through GPT later.
+    """
+    emotions_data = load_emotions_config()
+    try:
+        from backend.ai_analyzer_backend import analyze_single_segment
+        local_analysis = analyze_single_segment(text)
+    except Exception as e:
+        print(f"⚠️ Local Hebrew analyzer failed: {str(e)}")
+        response = create_default_emotion_response_advanced("שגיאה בחיבור ל-GPT", emotions_data)
+        response.update({"analysis_method": "default_fallback", "fallback_reason": reason, "pending_ai_upgrade": True})
+        return response
+
+    validated_emotions = []
+    for emotion in local_analysis.get('emotions', []):
+        validated_emotion = get_emotion_from_config(emotion, emotions_data)
+        if validated_emotion and validated_emotion not in validated_emotions:
+            validated_emotions.append(validated_emotion)
+    if not validated_emotions:
+        validated_emotions = [create_default_emotion_response_advanced("", emotions_data)['primary_emotion']]
+
+    word_count = len(text.split())
+
+    response = create_default_emotion_response_advanced("ניתוח מקומי - ממתין לשדרוג GPT", emotions_data)
+    response.update({
+        "emotions_detected": validated_emotions,
+        "primary_emotion": validated_emotions[0],
+        "emotion_detected": validated_emotions[0],
+        "word_count": word_count,
+        "humor_score": local_analysis.get('humor', 0),
+        "blur": local_analysis.get('blur', 0),
+        "spark": local_analysis.get('shine', 0),
+        "blobiness": local_analysis.get('blobiness', 5),
+        "grid_resolution": max(20, min(word_count * 10, 150)),
+        "is_question": '?' in text,
+        "analysis_method": "local_fallback",
+        "fallback_reason": reason,
+        "pending_ai_upgrade": True
+    })
+
+    return validate_emotion_response_advanced(response, speaker=speaker)
 
 def create_default_emotion_response_advanced(summary, emotions_data=None):
     """Create a default emotion response when analysis fails"""
@@ -5003,15 +5510,13 @@ def get_conversation_details_clean(conversation_id):
         ai_file_path = conv_data.get('ai_file', '')
         transcript = ""
         
-        if os.path.exists(ai_file_path):
-            with open(ai_file_path, 'r', encoding='utf-8') as f:
-                ai_data = json.load(f)
-                if 'segments' in ai_data:
-                    transcript_parts = []
-                    for segment in ai_data['segments']:
-                        if 'transcript' in segment:
-                            transcript_parts.append(segment['transcript'])
-                    transcript = ' '.join(transcript_parts)
+        ai_data = emotion_store.read(ai_file_path) if ai_file_path else None
+        if ai_data is not None and 'segments' in ai_data:
+            transcript_parts = []
+            for segment in ai_data['segments']:
+                if 'transcript' in segment:
+                    transcript_parts.append(segment['transcript'])
+            transcript = ' '.join(transcript_parts)
         
         return jsonify({
             "success": True,
@@ -5030,11 +5535,10 @@ def get_conversation_details_clean(conversation_id):
 
 # New endpoint for updating conversation with new transcript
 @app.route('/api/update-conversation-transcript', methods=['POST'])
+@track_model_job('update-conversation-transcript')
 def update_conversation_transcript():
     """Update existing conversation with new transcript and re-analyze"""
     try:
-        import openai
-        
         data = request.get_json()
         conversation_id = data.get('conversation_id')
         new_transcript = data.get('transcript', '')
@@ -5047,12 +5551,13 @@ def update_conversation_transcript():
         if not api_key:
             return jsonify({"error": "OpenAI API key not configured"}), 500
         
-        client = openai.OpenAI(api_key=api_key)
+        client = create_openai_client(api_key)
         
         # Analyze the new transcript with OpenAI
         try:
             response = client.chat.completions.create(
                 model="gpt-4o",
+                metrics_stage="transcript_update_analysis",
                 messages=[
                     {
                         "role": "system",
@@ -5113,42 +5618,36 @@ def update_conversation_transcript():
         if not os.path.exists(ai_file_path):
             return jsonify({"error": "AI analysis file not found"}), 404
         
-        # Create backup
-        backup_path = f"{ai_file_path}.backup_{int(time.time())}"
-        shutil.copy2(ai_file_path, backup_path)
-        
-        # Load existing AI data
-        with open(ai_file_path, 'r', encoding='utf-8') as f:
-            ai_data = json.load(f)
-        
-        # Update transcript in all segments
-        if 'segments' in ai_data:
-            total_segments = len(ai_data['segments'])
-            words_per_segment = len(new_transcript.split()) // max(total_segments, 1)
-            transcript_words = new_transcript.split()
-            
-            for i, segment in enumerate(ai_data['segments']):
-                start_word = i * words_per_segment
-                end_word = min(start_word + words_per_segment, len(transcript_words))
-                if i == total_segments - 1:  # Last segment gets remaining words
-                    end_word = len(transcript_words)
-                segment_transcript = ' '.join(transcript_words[start_word:end_word])
-                segment['transcript'] = segment_transcript
+        restore_point = time.time()
+        
+        def apply(ai_data):
+            # Update transcript in all segments
+            if 'segments' in ai_data:
+                total_segments = len(ai_data['segments'])
+                words_per_segment = len(new_transcript.split()) // max(total_segments, 1)
+                transcript_words = new_transcript.split()
+                
+                for i, segment in enumerate(ai_data['segments']):
+                    start_word = i * words_per_segment
+                    end_word = min(start_word + words_per_segment, len(transcript_words))
+                    if i == total_segments - 1:  # Last segment gets remaining words
+                        end_word = len(transcript_words)
+                    segment_transcript = ' '.join(transcript_words[start_word:end_word])
+                    segment['transcript'] = segment_transcript
                 
-                # Update analysis parameters for this segment
-                for param, value in analysis_result.items():
-                    if param in segment:
-                        segment[param] = value
+                    # Update analysis parameters for this segment
+                    for param, value in analysis_result.items():
+                        if param in segment:
+                            segment[param] = value
         
-        # Save updated AI data
-        with open(ai_file_path, 'w', encoding='utf-8') as f:
-            json.dump(ai_data, f, ensure_ascii=False, indent=2)
+        # Load, update and save the AI data
+        emotion_store.update(ai_file_path, apply, source="update-conversation-transcript")
         
         return jsonify({
             "success": True,
             "message": f"Conversation {conversation_id} updated successfully",
             "analysis": analysis_result,
-            "backup_created": backup_path
+            "restore_point": restore_point
         })
         
     except Exception as e:
@@ -5156,6 +5655,7 @@ def update_conversation_transcript():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/analyze-main-emotion', methods=['POST'])
+@track_model_job('analyze-main-emotion')
 def analyze_main_emotion():
     """
     Analyze the main emotion of an entire conversation using ChatGPT
@@ -5165,8 +5665,6 @@ def analyze_main_emotion():
     }
     """
     try:
-        import openai
-        
         data = request.get_json()
         conversation_folder = data.get('conversationFolder')
         
@@ -5183,7 +5681,7 @@ def analyze_main_emotion():
             return jsonify({"error": "OpenAI API key not properly configured"}), 500
             
         try:
-            client = openai.OpenAI(api_key=api_key)
+            client = create_openai_client(api_key)
             print(f"🎯 Starting main emotion analysis for {conversation_folder}")
         except Exception as e:
             return jsonify({"error": "Failed to initialize OpenAI client"}), 500
@@ -5200,8 +5698,7 @@ def analyze_main_emotion():
         for emotions_file in emotions_files:
             emotions_path = os.path.join(conv_path, emotions_file)
             try:
-                with open(emotions_path, 'r', encoding='utf-8') as f:
-                    emotion_data = json.load(f)
+                emotion_data = emotion_store.read(emotions_path) or {}
                     
                 # Extract transcript from each segment
                 for segment_key, segment_data in emotion_data.items():
@@ -5256,6 +5753,7 @@ def analyze_main_emotion():
         # Call ChatGPT for analysis
         response = client.chat.completions.create(
             model="gpt-4o",
+            metrics_stage="main_emotion",
             messages=[
                 {"role": "system", "content": "אתה מנתח רגשות מקצועי המתמחה בזיהוי הרגש העיקרי בשיחות בעברית. החזר תמיד JSON תקין."},
                 {"role": "user", "content": prompt}
@@ -5334,49 +5832,31 @@ def kill_process_on_port(port):
         print(f"⚠️ Could not kill process on port {port}: {e}")
     return False
 
-@app.route('/api/generate-conversation-insights', methods=['POST'])
-def generate_conversation_insights():
-    """Generate AI-powered insights for a conversation"""
-    try:
-        import openai
-        
-        data = request.get_json()
-        conversation_key = data.get('conversation_key')
-        conversation_number = data.get('conversation_number')
-        segments = data.get('segments', [])
-        metadata = data.get('metadata', {})
-        
-        if not conversation_key or not segments:
-            return jsonify({"error": "Missing conversation_key or segments"}), 400
-        
-        # Get OpenAI API key
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            return jsonify({"error": "OpenAI API key not configured"}), 500
-        
-        client = openai.OpenAI(api_key=api_key)
-        
-        # Prepare detailed conversation content for analysis
-        detailed_content = []
-        for i, segment in enumerate(segments):
-            speaker_name = f"דובר {segment.get('speaker', 0)}"
-            transcript = segment.get('transcript', '')
-            emotions = ', '.join(segment.get('emotions', ['שמחה']))  # 🚫 NEVER NEUTRAL
-            humor = segment.get('humor', 0)
-            blur = segment.get('blur', 0)
-            spark = segment.get('spark', 0)
-            
-            detailed_content.append(f"קטע {i+1} - {speaker_name}: {transcript}")
-            detailed_content.append(f"   רגשות: {emotions} | הומור: {humor} | טשטוש: {blur} | ברק: {spark}")
-        
-        full_conversation = '\n'.join(detailed_content)
-        
-        # Get speaker names from metadata
-        speaker1_name = metadata.get('speaker1Name', 'דובר ראשי')
-        speaker2_name = metadata.get('speaker2Name', 'דובר משני')
-        
-        # Create AI prompt for insights generation
-        system_prompt = f"""אתה מנתח שיחות מומחה המתמחה בזיהוי תובנות עמוקות ודפוסי תקשורת.
+# ==================== CONVERSATION INSIGHTS ====================
+
+def build_insights_prompts(conversation_key, conversation_number, segments, metadata):
+    """System and user prompts for the conversation insights completion"""
+    # Prepare detailed conversation content for analysis
+    detailed_content = []
+    for i, segment in enumerate(segments):
+        speaker_name = f"דובר {segment.get('speaker', 0)}"
+        transcript = segment.get('transcript', '')
+        emotions = ', '.join(segment.get('emotions', ['שמחה']))  # 🚫 NEVER NEUTRAL
+        humor = segment.get('humor', 0)
+        blur = segment.get('blur', 0)
+        spark = segment.get('spark', 0)
+        
+        detailed_content.append(f"קטע {i+1} - {speaker_name}: {transcript}")
+        detailed_content.append(f"   רגשות: {emotions} | הומור: {humor} | טשטוש: {blur} | ברק: {spark}")
+    
+    full_conversation = '\n'.join(detailed_content)
+    
+    # Get speaker names from metadata
+    speaker1_name = metadata.get('speaker1Name', 'דובר ראשי')
+    speaker2_name = metadata.get('speaker2Name', 'דובר משני')
+    
+    # Create AI prompt for insights generation
+    system_prompt = f"""אתה מנתח שיחות מומחה המתמחה בזיהוי תובנות עמוקות ודפוסי תקשורת.
         
 המשימה שלך היא לנתח שיחה ולספק תובנות מעמיקות על:
 1. דפוסי תקשורת של כל דובר
@@ -5404,8 +5884,8 @@ def generate_conversation_insights():
   "attention_points": ["נקודה לתשומת לב 1", "נקודה לתשומת לב 2"],
   "overall_assessment": "הערכה כללית של השיחה והתקשורת"
 }}"""
-        
-        user_prompt = f"""נתח את השיחה הבאה וצור תובנות מעמיקות:
+    
+    user_prompt = f"""נתח את השיחה הבאה וצור תובנות מעמיקות:
 
 מספר שיחה: {conversation_number}
 מזהה שיחה: {conversation_key}
@@ -5415,10 +5895,54 @@ def generate_conversation_insights():
 {full_conversation}
 
 צור תובנות מעמיקות לפי ההנחיות שלעיל, תוך התמקדות בדפוסי תקשורת, יחסים, ורגשות."""
+    
+    return system_prompt, user_prompt
+
+def parse_insights_response(response_text):
+    """Parse the model's JSON reply, tolerating a ```json fence"""
+    response_text = response_text.strip()
+    if response_text.startswith('```json'):
+        response_text = response_text.replace('```json', '').replace('```', '').strip()
+    return json.loads(response_text)
+
+def save_conversation_insights(conversation_key, insights_result):
+    """Store insights in the conversation's metadata in conversations_config.json"""
+    def store_insights(config):
+        if conversation_key in config['conversations']:
+            if 'metadata' not in config['conversations'][conversation_key]:
+                config['conversations'][conversation_key]['metadata'] = {}
+            
+            config['conversations'][conversation_key]['metadata']['ai_insights'] = insights_result
+            config['conversations'][conversation_key]['metadata']['insights_generated_date'] = datetime.now().isoformat()
+    
+    update_json(CONVERSATIONS_CONFIG_FILE, store_insights)
+
+@app.route('/api/generate-conversation-insights', methods=['POST'])
+@track_model_job('generate-conversation-insights')
+def generate_conversation_insights():
+    """Generate AI-powered insights for a conversation"""
+    try:
+        data = request.get_json()
+        conversation_key = data.get('conversation_key')
+        conversation_number = data.get('conversation_number')
+        segments = data.get('segments', [])
+        metadata = data.get('metadata', {})
+        
+        if not conversation_key or not segments:
+            return jsonify({"error": "Missing conversation_key or segments"}), 400
+        
+        # Get OpenAI API key
+        api_key = os.environ.get('OPENAI_API_KEY')
+        if not api_key:
+            return jsonify({"error": "OpenAI API key not configured"}), 500
+        
+        client = create_openai_client(api_key)
+        system_prompt, user_prompt = build_insights_prompts(conversation_key, conversation_number, segments, metadata)
         
         try:
             response = client.chat.completions.create(
                 model="gpt-4o",
+                metrics_stage="conversation_insights",
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
@@ -5431,28 +5955,10 @@ def generate_conversation_insights():
             if not response_text:
                 return jsonify({"error": "Empty response from OpenAI"}), 500
             
-            response_text = response_text.strip()
-            
-            # Parse JSON response
-            if response_text.startswith('```json'):
-                response_text = response_text.replace('```json', '').replace('```', '').strip()
-            
-            insights_result = json.loads(response_text)
+            insights_result = parse_insights_response(response_text)
             
             # Save insights to conversation metadata
-            config_path = os.path.join("config", "conversations_config.json")
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            
-            if conversation_key in config['conversations']:
-                if 'metadata' not in config['conversations'][conversation_key]:
-                    config['conversations'][conversation_key]['metadata'] = {}
-                
-                config['conversations'][conversation_key]['metadata']['ai_insights'] = insights_result
-                config['conversations'][conversation_key]['metadata']['insights_generated_date'] = datetime.now().isoformat()
-                
-                with open(config_path, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, ensure_ascii=False, indent=2)
+            save_conversation_insights(conversation_key, insights_result)
             
             print(f"✅ Generated insights for {conversation_key}")
             return jsonify({
@@ -5473,6 +5979,92 @@ def generate_conversation_insights():
         print(f"❌ Error generating insights: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def sse_event(event, payload):
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.route('/api/generate-conversation-insights/stream', methods=['POST'])
+def generate_conversation_insights_stream():
+    """
+    Streaming variant of generate-conversation-insights over server-sent events:
+    `token` events relay the completion text, `field` events carry each
+    top-level insights field as soon as it is complete, and a final `done`
+    event carries the whole result once it has been saved.
+    """
+    data = request.get_json(silent=True) or {}
+    conversation_key = data.get('conversation_key')
+    conversation_number = data.get('conversation_number')
+    segments = data.get('segments', [])
+    metadata = data.get('metadata', {})
+    
+    if not conversation_key or not segments:
+        return jsonify({"error": "Missing conversation_key or segments"}), 400
+    
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        return jsonify({"error": "OpenAI API key not configured"}), 500
+    
+    system_prompt, user_prompt = build_insights_prompts(conversation_key, conversation_number, segments, metadata)
+    conversation_dir = request_conversation_dir()
+    
+    def generate():
+        parser = IncrementalJSONObjectParser()
+        # The job is opened here because the generator runs after the route returns
+        with model_job('generate-conversation-insights', conversation_dir):
+            try:
+                yield sse_event("start", {"conversation_key": conversation_key})
+                client = create_openai_client(api_key)
+                stream = client.chat.completions.create(
+                    model="gpt-4o",
+                    metrics_stage="conversation_insights",
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    max_tokens=2000,
+                    temperature=0.4,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    yield sse_event("token", {"text": delta})
+                    for key, value in parser.feed(delta):
+                        yield sse_event("field", {"key": key, "value": value})
+                
+                if not parser.buffer.strip():
+                    yield sse_event("error", {"error": "Empty response from OpenAI"})
+                    return
+                
+                try:
+                    insights_result = parser.result()
+                except json.JSONDecodeError as e:
+                    print(f"❌ JSON parsing error: {str(e)}")
+                    print(f"Raw response: {parser.buffer}")
+                    yield sse_event("error", {"error": "Failed to parse AI response"})
+                    return
+                
+                # Persisted once, after the whole completion has arrived
+                save_conversation_insights(conversation_key, insights_result)
+                print(f"✅ Generated insights for {conversation_key} (streamed)")
+                yield sse_event("done", {
+                    "success": True,
+                    "insights": insights_result,
+                    "conversation_key": conversation_key
+                })
+            except Exception as e:
+                print(f"❌ Error streaming insights: {str(e)}")
+                yield sse_event("error", {"error": f"Analysis failed: {str(e)}"})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 if __name__ == '__main__':
     print("🚀 Starting Enhanced Emotion Visualizer Server...")
     print("📡 Features enabled:")
@@ -5503,6 +6095,12 @@ if __name__ == '__main__':
             print(f"💡 Or use: lsof -ti:{port} | xargs kill -9")
             exit(1)
     
+    # Bring the fingerprint index up to date with the archive (only new or changed files are decoded)
+    fingerprint_index.update_async()
+    
+    # Sweep backup copies into the backup store and apply its retention policy, now and every few hours
+    backup_store.start_maintenance()
+    
     print(f"🌐 Server starting on port {port}...")
     try:
         app.run(host='0.0.0.0', port=port, debug=False)